@@ -0,0 +1,160 @@
+"""
+Offline load benchmark for MyApiSink.
+
+Starts the local stand-in receiver, pushes generated solar panel batches
+through MyApiSink exactly as the Application would (including re-delivering a
+batch after SinkBackpressureError), and reports:
+
+- records/sec delivered
+- p50/p99 delivery latency: from the first write() of a batch until the
+  receiver first got each record, so retries and backpressure pauses count
+- retry amplification: records received by the API per unique record, and
+  HTTP requests per unique record
+
+    python benchmark.py --profile wan --mode bulk --encoding gzip
+    python benchmark.py --profile flaky --batches 20 --batch-size 2000
+
+No Kafka broker or API credentials are needed.
+"""
+
+import argparse
+import dataclasses
+import os
+import random
+import time
+
+from receiver import PROFILES, Receiver
+
+LOCATIONS = ["LONDON", "MADRID", "BERLIN", "ROME", "PARIS", "AMSTERDAM", "VIENNA", "DUBLIN", "PRAGUE", "ATHENS"]
+
+
+def generate_batch(topic: str, partition: int, first_offset: int, size: int, locations: int, panels: int):
+    """A SinkBatch of readings shaped like the solar-data generator output."""
+    from quixstreams.sinks import SinkBatch
+
+    batch = SinkBatch(topic=topic, partition=partition)
+    now_ns = time.time_ns()
+    for i in range(size):
+        offset = first_offset + i
+        location_id = LOCATIONS[offset % locations]
+        power_output = round(random.uniform(0, 300), 1)
+        voltage = round(random.uniform(23.5, 24.5), 1)
+        batch.append(
+            value={
+                "panel_id": f"{location_id}-P{str(offset // locations % panels + 1).zfill(4)}",
+                "location_id": location_id,
+                "location_name": location_id.title(),
+                "latitude": 51.5074,
+                "longitude": -0.1278,
+                "timezone": 1,
+                "power_output": power_output,
+                "unit_power": "W",
+                "temperature": round(random.uniform(20, 40), 1),
+                "unit_temp": "C",
+                "irradiance": round(random.uniform(0, 950), 1),
+                "unit_irradiance": "W/m²",
+                "voltage": voltage,
+                "unit_voltage": "V",
+                "current": round(power_output / voltage, 1),
+                "unit_current": "A",
+                "inverter_status": "OK" if power_output > 0 else "STANDBY",
+                "timestamp": now_ns,
+                "bench_offset": offset,
+            },
+            key=location_id.encode(),
+            timestamp=now_ns // 1_000_000,
+            headers=None,
+            offset=offset,
+        )
+    return batch
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run(args) -> dict:
+    profile = dataclasses.replace(PROFILES[args.profile])
+    for name in ("latency_ms", "jitter_ms", "error_rate", "throttle_rps"):
+        if getattr(args, name) is not None:
+            setattr(profile, name, getattr(args, name))
+    receiver = Receiver(profile, record_key="bench_offset").start()
+
+    # MyApiSink reads its configuration from the environment on import/setup
+    os.environ["API_BASE_URL"] = receiver.url
+    os.environ["API_DELIVERY_MODE"] = args.mode
+    os.environ["API_MAX_CONCURRENCY"] = str(args.concurrency)
+    os.environ["API_CONTENT_ENCODING"] = args.encoding
+    os.environ.setdefault("API_STATS_INTERVAL", "0")
+    from quixstreams.sinks import SinkBackpressureError
+    from main import MyApiSink
+
+    sink = MyApiSink()
+    sink.setup()
+
+    batch_started = {}
+    backpressure_events = 0
+    started = time.monotonic()
+    for number in range(args.batches):
+        first_offset = number * args.batch_size
+        batch = generate_batch("solar-data", 0, first_offset, args.batch_size, args.locations, args.panels)
+        batch_started[number] = time.monotonic()
+        while True:
+            try:
+                sink.write(batch)
+                break
+            except SinkBackpressureError as e:
+                # The Application would pause, seek back and re-consume the batch
+                backpressure_events += 1
+                time.sleep(e.retry_after)
+    elapsed = time.monotonic() - started
+
+    latencies = [
+        arrival - batch_started[offset // args.batch_size]
+        for offset, arrival in receiver.arrivals.items()
+    ]
+    stats = receiver.stats()
+    receiver.stop()
+    unique = stats["unique_records"] or 1
+    return {
+        "profile": args.profile,
+        "mode": args.mode,
+        "encoding": args.encoding,
+        "records": args.batches * args.batch_size,
+        "seconds": round(elapsed, 2),
+        "records_per_sec": round(args.batches * args.batch_size / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "retry_amplification": round(stats["records_received"] / unique, 3),
+        "requests_per_record": round(sum(stats["requests"].values()) / unique, 3),
+        "requests_by_status": stats["requests"],
+        "backpressure_events": backpressure_events,
+        "bytes_received": stats["bytes_received"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MyApiSink against a local stand-in API")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="lan")
+    parser.add_argument("--latency-ms", type=float)
+    parser.add_argument("--jitter-ms", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--throttle-rps", type=float)
+    parser.add_argument("--mode", choices=["record", "bulk"], default="record")
+    parser.add_argument("--encoding", default="identity")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batches", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--locations", type=int, default=10)
+    parser.add_argument("--panels", type=int, default=100)
+    args = parser.parse_args()
+
+    for name, value in run(args).items():
+        print(f"{name:>22}: {value}")
+
+
+if __name__ == "__main__":
+    main()
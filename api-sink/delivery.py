@@ -0,0 +1,209 @@
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from encoding import IDENTITY, BodyEncoder, available_encodings
+
+
+@dataclass
+class DeliveryResult:
+    """Outcome of delivering a single record."""
+    index: int  # Position of the record in the batch passed to deliver()
+    record: Dict[str, Any]
+    ok: bool = False
+    attempted: bool = False  # False if skipped to keep the location's order
+    status: Optional[int] = None
+    error: Optional[str] = None
+    latency: float = 0.0  # Seconds spent on the request that carried the record
+
+
+class DeliveryEngine:
+    """
+    Sends records to the `/data/{location_id}` API over pooled keep-alive
+    connections, with bounded concurrency.
+
+    Records are grouped into one lane per location. Lanes are sent concurrently
+    on a thread pool, while the records within a lane are sent strictly in
+    order. If a request in a lane fails, the rest of that lane is not attempted,
+    so a retry can never overtake an earlier record for the same location.
+
+    Modes:
+    - "record": one POST per record (the original API contract).
+    - "bulk": one POST per location per batch (chunked by `bulk_max_records`),
+      with the records encoded as NDJSON or as a JSON array.
+
+    Bodies can be compressed with `content_encoding` ("identity", "gzip",
+    "zstd" or "auto"). With "auto" the best available encoding is tried first,
+    and an endpoint that answers 415 Unsupported Media Type is stepped down
+    (honouring its `Accept-Encoding` response header if present) to the next
+    configured encoding it hasn't rejected, and finally to identity; the choice
+    is remembered per endpoint. In bulk mode bodies are streamed with chunked
+    transfer encoding, so memory stays flat regardless of the batch size.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        mode: str = "record",
+        bulk_format: str = "ndjson",
+        bulk_max_records: int = 500,
+        max_workers: int = 8,
+        pool_size: Optional[int] = None,
+        timeout: float = 10.0,
+        content_encoding: str = IDENTITY,
+        compression_level: Optional[int] = None,
+        stream_bodies: bool = True,
+        stream_chunk_bytes: int = 64 * 1024,
+    ):
+        if mode not in ("record", "bulk"):
+            raise ValueError(f"Invalid delivery mode: '{mode}'. Valid modes are: \"record\", \"bulk\"")
+        if bulk_format not in ("ndjson", "json"):
+            raise ValueError(f"Invalid bulk format: '{bulk_format}'. Valid formats are: \"ndjson\", \"json\"")
+        self.base_url = base_url.rstrip("/")
+        self.mode = mode
+        self.bulk_format = bulk_format
+        self.bulk_max_records = max(1, bulk_max_records)
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+
+        if content_encoding == "auto":
+            self.encodings = available_encodings()
+        elif content_encoding in available_encodings():
+            self.encodings = [content_encoding]
+        else:
+            raise ValueError(
+                f"Invalid content encoding: '{content_encoding}'. "
+                f"Valid encodings are: auto, {', '.join(available_encodings())}"
+            )
+        self.stream_bodies = stream_bodies
+        self.encoder = BodyEncoder(level=compression_level, chunk_bytes=stream_chunk_bytes)
+        self._endpoint_encodings: Dict[str, str] = {}
+        self._rejected_encodings: Dict[str, Set[str]] = {}
+
+        # One keep-alive pool shared by all workers; size it so no worker
+        # ever has to open a throwaway connection.
+        pool_size = pool_size or self.max_workers
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="api-delivery"
+        )
+
+    def url_for(self, location_id: Optional[str]) -> str:
+        return f"{self.base_url}/data/{location_id}" if location_id else f"{self.base_url}/data/"
+
+    def deliver(self, records: List[Dict[str, Any]]) -> List[DeliveryResult]:
+        """Deliver `records` and return one result per record, in input order."""
+        results = [DeliveryResult(index=i, record=record) for i, record in enumerate(records)]
+
+        lanes: "OrderedDict[str, List[DeliveryResult]]" = OrderedDict()
+        for result in results:
+            lanes.setdefault(self.url_for(result.record.get("location_id")), []).append(result)
+
+        send_lane = self._send_lane_bulk if self.mode == "bulk" else self._send_lane_records
+        futures = [self._executor.submit(send_lane, url, lane) for url, lane in lanes.items()]
+        for future in futures:
+            future.result()
+        return results
+
+    def _send_lane_records(self, url: str, lane: List[DeliveryResult]):
+        for position, result in enumerate(lane):
+            if not self._post(url, [result], "application/json", stream=False):
+                self._skip(lane[position + 1:], result)
+                return
+
+    def _send_lane_bulk(self, url: str, lane: List[DeliveryResult]):
+        content_type = "application/x-ndjson" if self.bulk_format == "ndjson" else "application/json"
+        for start in range(0, len(lane), self.bulk_max_records):
+            chunk = lane[start:start + self.bulk_max_records]
+            if not self._post(url, chunk, content_type, stream=self.stream_bodies):
+                self._skip(lane[start + len(chunk):], chunk[0])
+                return
+
+    def _serialize(self, results: List[DeliveryResult]) -> Iterator[bytes]:
+        """Yield the request body one record at a time."""
+        if self.mode == "record":
+            yield json.dumps(results[0].record).encode()
+        elif self.bulk_format == "ndjson":
+            for result in results:
+                yield json.dumps(result.record).encode() + b"\n"
+        else:
+            yield b"["
+            for position, result in enumerate(results):
+                yield (b"," if position else b"") + json.dumps(result.record).encode()
+            yield b"]"
+
+    def _post(self, url: str, results: List[DeliveryResult], content_type: str, stream: bool) -> bool:
+        """POST one request carrying `results`; record the outcome on each of them."""
+        started = time.monotonic()
+        encoding = self._endpoint_encodings.get(url, self.encodings[0])
+        try:
+            # Every 415 rules out one more encoding, so this ends at identity at the latest
+            for _ in range(len(self.encodings) + 1):
+                headers = {"Content-Type": content_type}
+                if encoding != IDENTITY:
+                    headers["Content-Encoding"] = encoding
+                if stream:
+                    body = self.encoder.stream(encoding, self._serialize(results))
+                else:
+                    body = self.encoder.encode(encoding, self._serialize(results))
+                response = self.session.post(
+                    url=url,
+                    headers=headers,
+                    data=body,
+                    timeout=self.timeout,
+                )
+                if response.status_code == 415 and encoding != IDENTITY:
+                    encoding = self._step_down(url, encoding, response)
+                    continue
+                break
+            status, error = response.status_code, None
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            status = e.response.status_code if e.response is not None else None
+            error = str(e)
+        latency = time.monotonic() - started
+        for result in results:
+            result.ok, result.attempted = error is None, True
+            result.status, result.error, result.latency = status, error, latency
+        return error is None
+
+    def _step_down(self, url: str, rejected: str, response: requests.Response) -> str:
+        """Pick the next content encoding for an endpoint that rejected `rejected`."""
+        rejected_encodings = self._rejected_encodings.setdefault(url, set())
+        rejected_encodings.add(rejected)
+        accepted = [
+            value.split(";")[0].strip().lower()
+            for value in response.headers.get("Accept-Encoding", "").split(",")
+            if value.strip()
+        ]
+        # Only the configured encodings the endpoint hasn't rejected yet; identity always works
+        candidates = [e for e in self.encodings if e not in rejected_encodings and e != IDENTITY]
+        if accepted:
+            candidates = [e for e in candidates if e in accepted]
+        encoding = (candidates + [IDENTITY])[0]
+        print(f"Endpoint {url} rejected {rejected} bodies, falling back to {encoding}")
+        self._endpoint_encodings[url] = encoding
+        return encoding
+
+    def encoding_stats(self) -> Dict[str, dict]:
+        """Bytes on the wire and CPU cost so far, per content encoding."""
+        return self.encoder.stats()
+
+    @staticmethod
+    def _skip(remaining: List[DeliveryResult], failed: DeliveryResult):
+        # Not attempted, to keep per-location ordering intact for the retry.
+        for result in remaining:
+            result.error = f"Not sent: earlier record for the same location failed ({failed.error})"
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,123 @@
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip and identity always work
+    zstandard = None
+
+IDENTITY, GZIP, ZSTD = "identity", "gzip", "zstd"
+
+
+def available_encodings() -> List[str]:
+    """Supported content encodings, most preferred first."""
+    return ([ZSTD] if zstandard else []) + [GZIP, IDENTITY]
+
+
+class _Passthrough:
+    def compress(self, data: bytes) -> bytes:
+        return bytes(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def _compressor(encoding: str, level: Optional[int]):
+    if encoding == GZIP:
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        return zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+    if encoding == ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd content encoding requires the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+    if encoding == IDENTITY:
+        return _Passthrough()
+    raise ValueError(
+        f"Invalid content encoding: '{encoding}'. "
+        f"Valid encodings are: {', '.join(available_encodings())}"
+    )
+
+
+@dataclass
+class EncodingStats:
+    """What one content encoding has cost so far."""
+    requests: int = 0
+    raw_bytes: int = 0
+    wire_bytes: int = 0
+    cpu_seconds: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        return self.raw_bytes / self.wire_bytes if self.wire_bytes else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "raw_bytes": self.raw_bytes,
+            "wire_bytes": self.wire_bytes,
+            "compression_ratio": round(self.ratio, 2),
+            "cpu_ms": round(self.cpu_seconds * 1000, 1),
+            "cpu_us_per_kb": round(self.cpu_seconds * 1e6 / (self.raw_bytes / 1024), 1) if self.raw_bytes else 0.0,
+        }
+
+
+class BodyEncoder:
+    """
+    Turns a stream of serialized byte pieces into a (compressed) request body.
+
+    Bodies are produced chunk by chunk, so a large bulk request never has to
+    exist in memory in full: pieces are buffered up to `chunk_bytes`, pushed
+    through the compressor and yielded as they come out. Bytes in, bytes on
+    the wire and the CPU time spent serializing and compressing are recorded
+    per encoding (thread CPU time, so concurrent requests don't skew it).
+    """
+
+    def __init__(self, level: Optional[int] = None, chunk_bytes: int = 64 * 1024):
+        self.level = level
+        self.chunk_bytes = chunk_bytes
+        self._stats: Dict[str, EncodingStats] = {}
+        self._lock = threading.Lock()
+
+    def stream(self, encoding: str, pieces: Iterable[bytes]) -> Iterator[bytes]:
+        """Yield the encoded body chunk by chunk (for chunked transfer encoding)."""
+        compressor = _compressor(encoding, self.level)
+        raw = wire = 0
+        cpu = 0.0
+        buffer = bytearray()
+
+        started = time.thread_time()
+        for piece in pieces:
+            buffer += piece
+            if len(buffer) >= self.chunk_bytes:
+                out = compressor.compress(buffer)
+                raw, wire = raw + len(buffer), wire + len(out)
+                buffer.clear()
+                if out:
+                    cpu += time.thread_time() - started
+                    yield out
+                    started = time.thread_time()
+        out = compressor.compress(buffer) + compressor.flush()
+        raw, wire = raw + len(buffer), wire + len(out)
+        cpu += time.thread_time() - started
+        self._record(encoding, raw, wire, cpu)
+        if out:
+            yield out
+
+    def encode(self, encoding: str, pieces: Iterable[bytes]) -> bytes:
+        """Encode the whole body at once (for small, single-record requests)."""
+        return b"".join(self.stream(encoding, pieces))
+
+    def _record(self, encoding: str, raw: int, wire: int, cpu: float):
+        with self._lock:
+            stats = self._stats.setdefault(encoding, EncodingStats())
+            stats.requests += 1
+            stats.raw_bytes += raw
+            stats.wire_bytes += wire
+            stats.cpu_seconds += cpu
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {encoding: stats.as_dict() for encoding, stats in self._stats.items()}
@@ -1,6 +1,3 @@
-import requests
-import json
-
 # import the Quix Streams modules for interacting with Kafka.
 # For general info, see https://quix.io/docs/quix-streams/introduction.html
 # For sinks, see https://quix.io/docs/quix-streams/connectors/sinks/index.html
@@ -9,7 +6,11 @@ from quixstreams.sinks import BatchingSink, SinkBatch, SinkBackpressureError
 
 import os
 import time
-from typing import List, Dict, Any
+from collections import OrderedDict
+
+from delivery import DeliveryEngine
+from retry import Backoff, CircuitBreaker, RetryScheduler
+from tracing import LatencyTracing, start_metrics_server
 
 # for local dev, you can load env vars from a .env file
 # from dotenv import load_dotenv
@@ -19,39 +20,62 @@ from typing import List, Dict, Any
 API_BASE_URL = os.environ["API_BASE_URL"]
 
 
-class MyApiSink(BatchingSink):
+class MyApiSink(LatencyTracing, BatchingSink):
     """
     A custom sink that sends data to an HTTP API endpoint.
     
     This sink takes messages from a Kafka topic and sends them to the specified API endpoint.
     If a 'location_id' field is present in the data, it will be used as the key in the API URL.
+
+    Requests go through a DeliveryEngine, which reuses keep-alive connections and
+    sends different locations concurrently while keeping each location in order.
+
+    Failed records are retried individually with exponential backoff, and each
+    endpoint has its own circuit breaker. Instead of sleeping, the sink raises
+    SinkBackpressureError when records are still waiting, so the batch is
+    re-consumed later and only the records not yet delivered are sent again.
     """
-    def _send_to_api(self, data: List[Dict[str, Any]]) -> None:
-        """
-        Send data to the API endpoint.
-        
-        Args:
-            data: List of records to send to the API
-        """
-        headers = {"Content-Type": "application/json"}
-        
-        for record in data:
-            try:
-                # Use location_id as the key if available, otherwise send without a key
-                location_id = record.get("location_id")
-                url = f"{API_BASE_URL}/data/{location_id}" if location_id else f"{API_BASE_URL}/data/"
-                
-                response = requests.post(
-                    url=url,
-                    headers=headers,
-                    data=json.dumps(record),
-                    timeout=10  # 10 second timeout
-                )
-                response.raise_for_status()  # Raise an exception for HTTP errors
-                
-            except requests.exceptions.RequestException as e:
-                print(f"Error sending data to API: {e}")
-                raise ConnectionError(f"Failed to send data to API: {e}")
+    trace_name = "api"
+
+    def __init__(self):
+        super().__init__()
+        self._engine = None
+        self._retries = RetryScheduler(
+            backoff=Backoff(
+                base=float(os.environ.get("API_RETRY_BACKOFF_BASE", "0.5")),
+                cap=float(os.environ.get("API_RETRY_BACKOFF_MAX", "30")),
+            ),
+            max_attempts=int(os.environ.get("API_RETRY_MAX_ATTEMPTS", "10")),
+        )
+        self._breakers = {}
+
+    def setup(self):
+        self._engine = DeliveryEngine(
+            base_url=API_BASE_URL,
+            mode=os.environ.get("API_DELIVERY_MODE", "record"),
+            bulk_format=os.environ.get("API_BULK_FORMAT", "ndjson"),
+            bulk_max_records=int(os.environ.get("API_BULK_MAX_RECORDS", "500")),
+            max_workers=int(os.environ.get("API_MAX_CONCURRENCY", "8")),
+            timeout=float(os.environ.get("API_TIMEOUT", "10")),
+            content_encoding=os.environ.get("API_CONTENT_ENCODING", "identity"),
+            compression_level=int(level) if (level := os.environ.get("API_COMPRESSION_LEVEL")) else None,
+            stream_bodies=os.environ.get("API_STREAM_BODIES", "true").lower() == "true",
+        )
+        self._stats_interval = float(os.environ.get("API_STATS_INTERVAL", "60"))
+        self._next_stats = time.monotonic() + self._stats_interval
+
+    def _report_stats(self):
+        if self._stats_interval and time.monotonic() >= self._next_stats:
+            self._next_stats = time.monotonic() + self._stats_interval
+            print(f"API delivery encoding stats: {self._engine.encoding_stats()}")
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        if url not in self._breakers:
+            self._breakers[url] = CircuitBreaker(
+                failure_threshold=int(os.environ.get("API_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.environ.get("API_BREAKER_RESET_TIMEOUT", "30")),
+            )
+        return self._breakers[url]
 
     def write(self, batch: SinkBatch):
         """
@@ -65,26 +89,63 @@ class MyApiSink(BatchingSink):
         See https://quix.io/docs/quix-streams/connectors/sinks/custom-sinks.html for
         more details.
         """
-        attempts_remaining = 3
-        data = [item.value for item in batch]
-        while attempts_remaining:
-            try:
-                return self._send_to_api(data)
-            except ConnectionError:
-                # Maybe we just failed to connect, do a short wait and try again
-                # We can't repeat forever; the consumer will eventually time out
-                attempts_remaining -= 1
-                if attempts_remaining:
-                    time.sleep(3)
-            except TimeoutError:
-                # Maybe the server is busy, do a sanctioned extended pause
-                # Always safe to do, but will require re-consuming the data.
-                raise SinkBackpressureError(
-                    retry_after=30.0,
-                    topic=batch.topic,
-                    partition=batch.partition,
-                )
-        raise Exception("Error while sending data to API")
+        self._retries.prune(batch.topic, batch.partition, batch.start_offset)
+
+        # Group the records that still need delivering by endpoint, in offset order
+        lanes = OrderedDict()
+        for item in batch:
+            key = (batch.topic, batch.partition, item.offset)
+            if not self._retries.is_delivered(key):
+                url = self._engine.url_for(item.value.get("location_id"))
+                lanes.setdefault(url, []).append((key, item.value))
+
+        # Only send lanes whose endpoint is healthy and whose oldest record is due
+        now = time.monotonic()
+        waits = []
+        to_send = []
+        for url, lane in lanes.items():
+            breaker = self._breaker(url)
+            if not breaker.allow():
+                waits.append(breaker.retry_after())
+                continue
+            wait = self._retries.wait_time(lane[0][0], now)
+            if wait > 0:
+                waits.append(wait)
+                continue
+            to_send.extend(lane)
+
+        results = self._engine.deliver([record for _, record in to_send]) if to_send else []
+        self._report_stats()
+
+        delivered_lanes, failed_lanes = set(), set()
+        now = time.monotonic()
+        for (key, _), result in zip(to_send, results):
+            url = self._engine.url_for(result.record.get("location_id"))
+            if result.ok:
+                self._retries.mark_delivered(key)
+                delivered_lanes.add(url)
+            elif result.attempted:
+                attempts = self._retries.mark_failed(key, now)
+                failed_lanes.add(url)
+                waits.append(self._retries.wait_time(key, now))
+                print(f"Error sending data to API (attempt {attempts}): {result.error}")
+                if self._retries.exhausted(key):
+                    raise Exception(
+                        f"Error while sending data to API: record at offset {key[2]} "
+                        f"failed {attempts} times"
+                    )
+        # A lane's requests go in order and stop at the first failure, so its
+        # successes come first: the breakers only count failures in a row
+        for url in delivered_lanes:
+            self._breaker(url).record_success()
+        for url in failed_lanes:
+            self._breaker(url).record_failure()
+
+        if waits:
+            # Some records are still waiting for a retry or an open breaker.
+            # Pause instead of blocking; the batch will be re-consumed and the
+            # delivered records skipped.
+            raise SinkBackpressureError(retry_after=max(0.1, min(waits)))
 
 
 def main():
@@ -106,6 +167,10 @@ def main():
     # Finish by calling StreamingDataFrame.sink()
     sdf.sink(my_api_sink)
 
+    # Latency of each message from generation to delivery, see tracing.py
+    start_metrics_server(int(os.environ.get("TRACE_METRICS_PORT", "9464")),
+                         window_s=float(os.environ.get("TRACE_WINDOW_S", "60")))
+
     # With our pipeline defined, now run the Application
     app.run()
 
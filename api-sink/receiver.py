@@ -0,0 +1,232 @@
+"""
+A local stand-in for the `/data/{location_id}` API, for load-testing the sink
+without a real service.
+
+It accepts single JSON records, JSON arrays and NDJSON bodies, plain or
+compressed (gzip/zstd), with or without chunked transfer encoding, and can
+simulate slow, flaky or rate-limited endpoints:
+
+    python receiver.py --profile wan
+    python receiver.py --port 8080 --latency-ms 50 --error-rate 0.02 --throttle-rps 200
+
+Then point the sink at it with API_BASE_URL=http://localhost:8080.
+"""
+
+import argparse
+import dataclasses
+import gzip
+import json
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+@dataclass
+class ReceiverProfile:
+    """How the stand-in API behaves."""
+    latency_ms: float = 0.0  # Added to every request
+    jitter_ms: float = 0.0  # Uniform random extra latency
+    error_rate: float = 0.0  # Fraction of requests answered with 503
+    throttle_rps: float = 0.0  # Requests/sec before answering 429 (0 = unlimited)
+    accept_encodings: tuple = ("identity", "gzip", "zstd")
+
+
+PROFILES: Dict[str, ReceiverProfile] = {
+    "fast": ReceiverProfile(),
+    "lan": ReceiverProfile(latency_ms=2, jitter_ms=1),
+    "wan": ReceiverProfile(latency_ms=40, jitter_ms=20),
+    "flaky": ReceiverProfile(latency_ms=20, jitter_ms=10, error_rate=0.05),
+    "throttled": ReceiverProfile(latency_ms=10, jitter_ms=5, throttle_rps=100),
+    "legacy": ReceiverProfile(latency_ms=20, jitter_ms=10, accept_encodings=("identity",)),
+}
+
+
+class _TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class Receiver:
+    """
+    Runs the stand-in API on a background thread and keeps delivery statistics.
+
+    Each accepted record is timestamped on arrival, keyed by `record_key`
+    (a field of the record), so a benchmark can compute delivery latency and
+    how many times a record was received (retry amplification).
+    """
+
+    def __init__(self, profile: ReceiverProfile, host: str = "127.0.0.1", port: int = 0,
+                 record_key: Optional[str] = None):
+        self.profile = profile
+        self.record_key = record_key
+        self._throttle = _TokenBucket(profile.throttle_rps) if profile.throttle_rps else None
+        self._lock = threading.Lock()
+        self.requests = Counter()  # By HTTP status
+        self.records_received = 0
+        self.bytes_received = 0
+        self.arrivals: Dict[object, float] = {}  # record_key value -> first arrival time
+        self.deliveries = Counter()  # record_key value -> times received
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "Receiver":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _record_request(self, status: int, body_bytes: int = 0, records: Optional[List[dict]] = None):
+        now = time.monotonic()
+        with self._lock:
+            self.requests[status] += 1
+            self.bytes_received += body_bytes
+            for record in records or ():
+                self.records_received += 1
+                if self.record_key is not None:
+                    key = record.get(self.record_key)
+                    self.deliveries[key] += 1
+                    self.arrivals.setdefault(key, now)
+
+    def _handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like a real gateway
+
+            def do_POST(self):
+                body = self._read_body()
+                profile = receiver.profile
+                delay = profile.latency_ms + random.uniform(0, profile.jitter_ms)
+                if delay:
+                    time.sleep(delay / 1000)
+
+                if not self.path.startswith("/data/"):
+                    return self._reply(404, body_bytes=len(body))
+                if receiver._throttle and not receiver._throttle.take():
+                    return self._reply(429, {"Retry-After": "1"}, body_bytes=len(body))
+                if profile.error_rate and random.random() < profile.error_rate:
+                    return self._reply(503, body_bytes=len(body))
+
+                encoding = self.headers.get("Content-Encoding", "identity").lower()
+                if encoding not in profile.accept_encodings:
+                    return self._reply(
+                        415, {"Accept-Encoding": ", ".join(profile.accept_encodings)}, body_bytes=len(body)
+                    )
+                try:
+                    records = self._parse(self._decode(body, encoding))
+                except (ValueError, OSError):
+                    return self._reply(400, body_bytes=len(body))
+                self._reply(200, body_bytes=len(body), records=records)
+
+            def _read_body(self) -> bytes:
+                if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            return b"".join(chunks)
+                        chunks.append(self.rfile.read(size))
+                        self.rfile.readline()
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            @staticmethod
+            def _decode(body: bytes, encoding: str) -> bytes:
+                if encoding == "gzip":
+                    return gzip.decompress(body)
+                if encoding == "zstd":
+                    if zstandard is None:
+                        raise ValueError("zstandard is not installed")
+                    return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+                return body
+
+            def _parse(self, body: bytes) -> List[dict]:
+                content_type = self.headers.get("Content-Type", "")
+                if "ndjson" in content_type:
+                    return [json.loads(line) for line in body.splitlines() if line.strip()]
+                data = json.loads(body)
+                return data if isinstance(data, list) else [data]
+
+            def _reply(self, status: int, headers: Optional[dict] = None, body_bytes: int = 0,
+                       records: Optional[List[dict]] = None):
+                receiver._record_request(status, body_bytes, records)
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass  # Far too noisy under load
+
+        return Handler
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "records_received": self.records_received,
+                "unique_records": len(self.deliveries),
+                "bytes_received": self.bytes_received,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the /data/{location_id} API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast")
+    parser.add_argument("--latency-ms", type=float)
+    parser.add_argument("--jitter-ms", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--throttle-rps", type=float)
+    args = parser.parse_args()
+
+    profile = dataclasses.replace(PROFILES[args.profile])
+    for name in ("latency_ms", "jitter_ms", "error_rate", "throttle_rps"):
+        if getattr(args, name) is not None:
+            setattr(profile, name, getattr(args, name))
+
+    receiver = Receiver(profile, host=args.host, port=args.port).start()
+    print(f"Receiving on {receiver.url} with {profile}. Press CTRL-C to exit.")
+    try:
+        while True:
+            time.sleep(10)
+            print(receiver.stats())
+    except KeyboardInterrupt:
+        receiver.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Set, Tuple
+
+# A record is identified by where it came from: (topic, partition, offset)
+RecordKey = Tuple[str, int, int]
+
+
+class Backoff:
+    """Exponential backoff with "full jitter": a random delay in [0, min(cap, base * 2^n)]."""
+
+    def __init__(self, base: float = 0.5, cap: float = 30.0):
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.cap, self.base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker for one endpoint.
+
+    - closed: requests flow; consecutive failures are counted.
+    - open: after `failure_threshold` consecutive failures nothing is sent
+      for `reset_timeout` seconds.
+    - half-open: once the timeout elapses one attempt is let through; success
+      closes the breaker, failure opens it again.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and self.retry_after() <= 0:
+            self.state = self.HALF_OPEN
+        return self.state != self.OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe through (0 unless open)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self._failures = 0
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                print(f"Circuit breaker opened after {self._failures} consecutive failures")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+@dataclass
+class _RetryState:
+    attempts: int = 0
+    next_attempt: float = 0.0
+
+
+class RetryScheduler:
+    """
+    Per-record retry bookkeeping for a BatchingSink.
+
+    A batch that is not fully delivered is backpressured and re-consumed from
+    its first offset. The scheduler remembers which records were already
+    delivered, so that only the failed ones are sent again, and when each
+    failed record is next due according to its own backoff.
+    """
+
+    def __init__(self, backoff: Backoff, max_attempts: int = 10):
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+        self._delivered: Dict[Tuple[str, int], Set[int]] = {}
+        self._pending: Dict[RecordKey, _RetryState] = {}
+        self.retried = 0
+
+    def prune(self, topic: str, partition: int, start_offset: int):
+        """Forget records below `start_offset`; they are committed and won't be seen again."""
+        delivered = self._delivered.get((topic, partition))
+        if delivered:
+            delivered.difference_update([o for o in delivered if o < start_offset])
+        for key in [k for k in self._pending if k[:2] == (topic, partition) and k[2] < start_offset]:
+            del self._pending[key]
+
+    def is_delivered(self, key: RecordKey) -> bool:
+        return key[2] in self._delivered.get(key[:2], ())
+
+    def wait_time(self, key: RecordKey, now: float) -> float:
+        """Seconds until `key` may be attempted again (0 if due now)."""
+        state = self._pending.get(key)
+        return max(0.0, state.next_attempt - now) if state else 0.0
+
+    def mark_delivered(self, key: RecordKey):
+        self._delivered.setdefault(key[:2], set()).add(key[2])
+        if self._pending.pop(key, None):
+            self.retried += 1
+
+    def mark_failed(self, key: RecordKey, now: float) -> int:
+        """Schedule the next attempt for `key` and return how many attempts failed so far."""
+        state = self._pending.setdefault(key, _RetryState())
+        state.attempts += 1
+        state.next_attempt = now + self.backoff.delay(state.attempts)
+        return state.attempts
+
+    def exhausted(self, key: RecordKey) -> bool:
+        state = self._pending.get(key)
+        return bool(self.max_attempts and state and state.attempts >= self.max_attempts)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
@@ -0,0 +1,76 @@
+import unittest
+
+import requests
+
+from delivery import DeliveryEngine
+from encoding import GZIP, IDENTITY, ZSTD, zstandard
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+
+class FakeSession:
+    """Answers 415 to any compressed body (or to every body), without an Accept-Encoding header."""
+
+    def __init__(self, reject_identity=False):
+        self.reject_identity = reject_identity
+        self.encodings = []
+
+    def post(self, url, headers, data, timeout):
+        if not isinstance(data, bytes):
+            data = b"".join(data)
+        encoding = headers.get("Content-Encoding", IDENTITY)
+        self.encodings.append(encoding)
+        if len(self.encodings) > 10:
+            raise AssertionError(f"Endless step-down: {self.encodings}")
+        return FakeResponse(415 if encoding != IDENTITY or self.reject_identity else 200)
+
+    def close(self):
+        pass
+
+
+def make_engine(content_encoding, session):
+    engine = DeliveryEngine("http://api.test", content_encoding=content_encoding, max_workers=1)
+    engine.session = session
+    return engine
+
+
+class StepDownTest(unittest.TestCase):
+    def test_auto_steps_down_to_identity_once(self):
+        session = FakeSession()
+        engine = make_engine("auto", session)
+        results = engine.deliver([{"location_id": "LONDON", "power_output": 1.0}])
+        self.assertTrue(results[0].ok)
+        self.assertEqual(session.encodings, ([ZSTD] if zstandard else []) + [GZIP, IDENTITY])
+
+        engine.deliver([{"location_id": "LONDON", "power_output": 2.0}])
+        self.assertEqual(session.encodings[-1], IDENTITY)
+        engine.close()
+
+    def test_configured_encoding_never_steps_to_another(self):
+        session = FakeSession()
+        engine = make_engine(GZIP, session)
+        results = engine.deliver([{"location_id": "LONDON", "power_output": 1.0}])
+        self.assertTrue(results[0].ok)
+        self.assertEqual(session.encodings, [GZIP, IDENTITY])
+        engine.close()
+
+    def test_request_fails_when_identity_is_rejected_too(self):
+        session = FakeSession(reject_identity=True)
+        engine = make_engine("auto", session)
+        results = engine.deliver([{"location_id": "LONDON", "power_output": 1.0}])
+        self.assertFalse(results[0].ok)
+        self.assertEqual(results[0].status, 415)
+        self.assertEqual(session.encodings[-1], IDENTITY)
+        engine.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
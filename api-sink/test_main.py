@@ -0,0 +1,80 @@
+import os
+import unittest
+
+from quixstreams.sinks import SinkBackpressureError, SinkBatch
+
+os.environ.setdefault("API_BASE_URL", "http://api.test")
+
+from delivery import DeliveryResult
+from main import MyApiSink
+
+
+class FakeEngine:
+    """Delivers like DeliveryEngine: a lane stops at its first failed record, the rest is not attempted."""
+
+    def __init__(self, failing_offsets):
+        self.failing_offsets = failing_offsets
+
+    def url_for(self, location_id):
+        return f"http://api.test/data/{location_id}"
+
+    def deliver(self, records):
+        results, failed = [], False
+        for index, record in enumerate(records):
+            result = DeliveryResult(index=index, record=record)
+            if not failed:
+                result.attempted = True
+                result.ok = record["offset"] not in self.failing_offsets
+                failed = not result.ok
+                result.error = None if result.ok else "503 Service Unavailable"
+            results.append(result)
+        return results
+
+    def encoding_stats(self):
+        return {}
+
+
+def make_batch(start_offset, size):
+    batch = SinkBatch(topic="readings", partition=0)
+    for offset in range(start_offset, start_offset + size):
+        batch.append(value={"location_id": "LONDON", "offset": offset}, key=b"LONDON",
+                     timestamp=0, headers=[], offset=offset)
+    return batch
+
+
+class BreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.sink = MyApiSink()
+        self.sink._stats_interval = 0
+        self.sink._retries.backoff.cap = 0  # Failed records are due again at once
+
+    def breaker(self):
+        return self.sink._breaker("http://api.test/data/LONDON")
+
+    def test_mixed_lane_keeps_breaker_closed(self):
+        # Every batch has one failing record after 19 delivered ones
+        for start in range(0, 200, 20):
+            self.sink._engine = FakeEngine(failing_offsets={start + 19})
+            with self.assertRaises(SinkBackpressureError):
+                self.sink.write(make_batch(start, 20))
+        self.assertEqual(self.breaker().state, "closed")
+
+    def test_lane_without_progress_opens_breaker(self):
+        self.sink._engine = FakeEngine(failing_offsets={0})
+        for _ in range(self.breaker().failure_threshold):
+            with self.assertRaises(SinkBackpressureError):
+                self.sink.write(make_batch(0, 20))
+        self.assertEqual(self.breaker().state, "open")
+
+    def test_failed_record_is_retried_alone(self):
+        self.sink._engine = FakeEngine(failing_offsets={5})
+        with self.assertRaises(SinkBackpressureError):
+            self.sink.write(make_batch(0, 10))
+        self.sink._engine = FakeEngine(failing_offsets=set())
+        self.sink.write(make_batch(0, 10))
+        self.assertEqual(self.sink._retries.pending, 0)
+        self.assertEqual(self.breaker().state, "closed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Points/sec benchmark of the InfluxDB writers.
+
+Feeds generated solar panel readings through Quix Streams' `InfluxDB3Sink`
+and through `LineProtocolSink` exactly as the Application does (`add()` per
+record, `flush()` per checkpoint), both writing over HTTP to a local stand-in
+for InfluxDB's write API that accepts every request and records its size.
+
+    python benchmark.py --points 200000 --checkpoint 1000
+    python benchmark.py --latency-ms 20 --flush-kb 512 --concurrency 8
+"""
+
+import argparse
+import gzip
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from influxdb_client_3 import InfluxDBClient3
+from quixstreams.sinks.core.influxdb3 import InfluxDB3Sink
+
+from line_protocol import LineProtocolEncoder, LineProtocolSink
+
+TAGS = ["panel_id", "location_id", "inverter_status"]
+FIELDS = ["power_output", "temperature", "irradiance", "voltage", "current"]
+LOCATIONS = ["LONDON", "MADRID", "BERLIN", "ROME", "PARIS"]
+
+
+def generate_readings(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    start_ns = 1_700_000_000_000_000_000
+    readings = []
+    for i in range(count):
+        location_id = LOCATIONS[i % len(LOCATIONS)]
+        power_output = round(rng.uniform(0, 300), 1)
+        voltage = round(rng.uniform(23.5, 24.5), 1)
+        readings.append({
+            "panel_id": f"{location_id}-P{i % 100 + 1:04d}",
+            "location_id": location_id,
+            "location_name": location_id.title(),
+            "power_output": power_output,
+            "unit_power": "W",
+            "temperature": round(rng.uniform(20, 40), 1),
+            "irradiance": round(rng.uniform(0, 950), 1),
+            "voltage": voltage,
+            "current": round(power_output / voltage, 1),
+            "inverter_status": "OK" if power_output > 0 else "STANDBY",
+            "timestamp": start_ns + i * 1_000_000_000,
+        })
+    return readings
+
+
+class _WriteEndpoint(BaseHTTPRequestHandler):
+    latency = 0.0
+    requests = []  # (bytes received, bytes of line protocol)
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        plain = gzip.decompress(body) if self.headers.get("Content-Encoding") == "gzip" else body
+        with self.lock:
+            self.requests.append((len(body), len(plain)))
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def run(sink, readings: list, checkpoint: int) -> float:
+    started = time.perf_counter()
+    for offset, reading in enumerate(readings):
+        # Both sinks pop tags from the value, so each gets its own copy
+        sink.add(value=dict(reading), key=reading["location_id"].encode(), timestamp=reading["timestamp"] // 1_000_000,
+                 headers=[], topic="solar-data", partition=0, offset=offset)
+        if (offset + 1) % checkpoint == 0:
+            sink.flush()
+    sink.flush()
+    return time.perf_counter() - started
+
+
+def report(name: str, count: int, seconds: float):
+    sizes = [plain for _, plain in _WriteEndpoint.requests]
+    sent = sum(received for received, _ in _WriteEndpoint.requests)
+    print(f"{name:>14} {count / seconds:>12,.0f} {len(sizes):>9} "
+          f"{statistics.mean(sizes) / 1024 if sizes else 0:>10,.1f} "
+          f"{max(sizes) / 1024 if sizes else 0:>10,.1f} {sent / 1024 / 1024:>9,.1f}")
+    _WriteEndpoint.requests = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the InfluxDB writers against a local write endpoint")
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--checkpoint", type=int, default=1000, help="Records per checkpoint (BUFFER_SIZE)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latency of each write request")
+    parser.add_argument("--flush-kb", type=int, default=1024)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--gzip-level", type=int, default=1)
+    args = parser.parse_args()
+
+    _WriteEndpoint.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _WriteEndpoint)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_port}"
+    readings = generate_readings(args.points)
+
+    print(f"{'writer':>14} {'points/sec':>12} {'requests':>9} {'avg KB':>10} {'max KB':>10} {'sent MB':>9}")
+
+    stock = InfluxDB3Sink(
+        token="benchmark", host=host, organization_id="benchmark", database="benchmark",
+        measurement="solar", tags_keys=TAGS, fields_keys=FIELDS,
+    )  # Both writers time points with the Kafka timestamp
+    # setup() also runs a test query over Flight; writing only needs the client
+    stock._client = InfluxDBClient3(**stock._client_args)
+    report("InfluxDB3Sink", args.points, run(stock, readings, args.checkpoint))
+
+    for checkpoint in (args.checkpoint, args.checkpoint * 10):
+        sink = LineProtocolSink(
+            host=host, token="benchmark", database="benchmark",
+            encoder=LineProtocolEncoder("solar", TAGS, FIELDS),
+            flush_bytes=args.flush_kb * 1024, concurrency=args.concurrency, gzip_level=args.gzip_level,
+        )
+        sink.setup()
+        report(f"line/{checkpoint}", args.points, run(sink, readings, checkpoint))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,10 +11,14 @@ from quixstreams.sinks.base import BatchingSink, SinkBatch
 import clickhouse_connect
 from dotenv import load_dotenv
 
+from tracing import LatencyTracing, start_metrics_server
+
 load_dotenv()
 
 
-class ClickHouseSink(BatchingSink):
+class ClickHouseSink(LatencyTracing, BatchingSink):
+    trace_name = "clickhouse"
+
     def __init__(self, host, token, database, table,
                  on_client_connect_success=None,
                  on_client_connect_failure=None):
@@ -168,4 +172,6 @@ sdf = app.dataframe(input_topic)
 sdf.sink(clickhouse_sink)
 
 if __name__ == "__main__":
+    start_metrics_server(int(os.environ.get("TRACE_METRICS_PORT", "9464")),
+                         window_s=float(os.environ.get("TRACE_WINDOW_S", "60")))
     app.run(count=10, timeout=20)
\ No newline at end of file
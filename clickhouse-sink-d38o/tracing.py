@@ -0,0 +1,349 @@
+"""
+End-to-end latency tracing for the solar data pipeline.
+
+The generator stamps every reading with two Kafka headers: a trace id and the
+wall-clock time it was produced at (`trace_headers()`). Quix Streams carries
+headers through transformations, so they reach every sink. A sink that mixes
+in `LatencyTracing` records, per input topic and partition:
+
+- `generate_to_consume`: from the generator producing a reading to the sink
+  receiving it;
+- `consume_to_commit`: from the sink receiving it to the checkpoint that
+  wrote it to the destination and commits its offset;
+- `generate_to_commit`: the two together, the freshness of the destination.
+
+Latencies go into log-linear histograms (`Histogram`), so recording one costs
+a few integer operations whatever the range, and quantiles are within 1-2%.
+Quantiles cover the last one to two `window_s` windows; counts and sums are
+cumulative. `start_metrics_server()` serves them on `/metrics`, in the
+Prometheus text format, and on `/latency` as JSON with the slowest trace id
+of each series.
+
+The generate times come from the generator's clock, so hops that cross
+machines include their clock offset; keep the hosts NTP-synchronised.
+"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+TRACE_ID_HEADER = "trace_id"
+GENERATED_AT_HEADER = "generated_at_ns"
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def trace_headers() -> List[Tuple[str, bytes]]:
+    """Headers for a newly generated message: a new trace id and the time now."""
+    return [
+        (TRACE_ID_HEADER, uuid.uuid4().hex.encode()),
+        (GENERATED_AT_HEADER, str(time.time_ns()).encode()),
+    ]
+
+
+def read_trace(headers: Any) -> Tuple[Optional[bytes], Optional[int]]:
+    """The trace id and generate time in the headers of a consumed message, if it has them."""
+    trace_id = generated_ns = None
+    for name, value in headers or ():
+        if name == GENERATED_AT_HEADER:
+            try:
+                generated_ns = int(value)
+            except (TypeError, ValueError):
+                pass
+        elif name == TRACE_ID_HEADER:
+            trace_id = value
+    return trace_id, generated_ns
+
+
+class Histogram:
+    """
+    A log-linear histogram in the style of HdrHistogram. Values below
+    2**precision_bits get a bucket each, and every power of two above that is
+    split into 2**(precision_bits - 1) buckets, so a bucket is never wider
+    than 1/2**(precision_bits - 1) of its values (1.6% with 7 bits). Recording
+    is O(1), and microseconds up to an hour fit in under 2,000 buckets.
+    """
+
+    def __init__(self, precision_bits: int = 7):
+        self.bits = precision_bits
+        self.counts: List[int] = [0] * (1 << precision_bits)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _value(self, index: int) -> int:
+        """The middle of a bucket's range of values."""
+        if index < 1 << self.bits:
+            return index
+        shift = (index >> (self.bits - 1)) - 1
+        low = (index - (shift << (self.bits - 1))) << shift
+        return low + (1 << shift >> 1)
+
+    def record(self, value: int):
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - self.bits
+        index = value if shift <= 0 else (shift << (self.bits - 1)) + (value >> shift)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> int:
+        if not self.count:
+            return 0
+        rank = max(1, round(q * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+
+class _Series:
+    """One hop of one partition: histograms of the current and previous window, and running totals."""
+
+    __slots__ = ("current", "previous", "count", "total_us", "slowest_trace")
+
+    def __init__(self):
+        self.current = Histogram()
+        self.previous = Histogram()
+        self.count = 0  # Of the windows before the current one
+        self.total_us = 0
+        self.slowest_trace = None  # Of the current window
+
+    def record(self, latency_us: int, trace_id: Optional[bytes]):
+        if latency_us > self.current.max or self.slowest_trace is None:
+            self.slowest_trace = trace_id
+        self.current.record(latency_us)
+
+    def rotate(self):
+        self.count += self.current.count
+        self.total_us += self.current.total
+        self.previous, self.current = self.current, Histogram()
+        self.slowest_trace = None
+
+
+class LatencyTracker:
+    """The latencies of one sink, per hop and input partition."""
+
+    def __init__(self, sink: str, window_s: float = 60.0):
+        self.sink = sink
+        self.window_s = window_s
+        self._series: Dict[Tuple[str, str, int], _Series] = {}
+        self._consumed: Dict[Tuple[str, int], _Series] = {}  # generate_to_consume, for the hot path
+        self._pending: Dict[Tuple[str, int], List[Tuple[int, Optional[int], Optional[bytes]]]] = {}
+        self._lock = threading.Lock()
+        self._next_rotation = time.monotonic() + window_s
+
+    def _get(self, hop: str, topic: str, partition: int) -> _Series:
+        series = self._series.get((hop, topic, partition))
+        if series is None:
+            series = self._series[(hop, topic, partition)] = _Series()
+        return series
+
+    def _rotate(self):
+        if time.monotonic() >= self._next_rotation:
+            self._next_rotation = time.monotonic() + self.window_s
+            for series in self._series.values():
+                series.rotate()
+
+    def consumed(self, topic: str, partition: int, headers: Any):
+        now = time.time_ns()
+        trace_id, generated_ns = read_trace(headers)
+        tp = (topic, partition)
+        with self._lock:
+            pending = self._pending.get(tp)
+            if pending is None:
+                pending = self._pending[tp] = []
+                if tp not in self._consumed:
+                    self._consumed[tp] = self._get("generate_to_consume", topic, partition)
+            pending.append((now, generated_ns, trace_id))
+            if generated_ns is not None:
+                self._consumed[tp].record((now - generated_ns) // 1000, trace_id)
+
+    def _written(self, topic: str, partition: int, pending: List[Tuple[int, Optional[int], Optional[bytes]]],
+                 now: int):
+        to_commit = self._get("consume_to_commit", topic, partition)
+        end_to_end = self._get("generate_to_commit", topic, partition)
+        for consumed_ns, generated_ns, trace_id in pending:
+            to_commit.record((now - consumed_ns) // 1000, trace_id)
+            if generated_ns is not None:
+                end_to_end.record((now - generated_ns) // 1000, trace_id)
+
+    def committed(self):
+        """Everything consumed since the last checkpoint has been written."""
+        now = time.time_ns()
+        with self._lock:
+            self._rotate()
+            for (topic, partition), pending in self._pending.items():
+                self._written(topic, partition, pending, now)
+            self._pending.clear()
+
+    def hold(self, topic: str, partition: int) -> List[Tuple[int, Optional[int], Optional[bytes]]]:
+        """
+        Take the messages of a partition consumed since the last checkpoint out
+        of it, for a sink that committed them without writing them (e.g. it
+        buffered them on disk). Pass them to `landed()` once they are written.
+        """
+        with self._lock:
+            return self._pending.pop((topic, partition), [])
+
+    def landed(self, topic: str, partition: int, held: List[Tuple[int, Optional[int], Optional[bytes]]]):
+        """Messages taken out of a checkpoint by `hold()` have been written."""
+        now = time.time_ns()
+        with self._lock:
+            self._rotate()
+            self._written(topic, partition, held, now)
+
+    def discard(self):
+        """The checkpoint failed; its messages will be consumed again."""
+        with self._lock:
+            self._pending.clear()
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            self._rotate()
+            rows = []
+            for (hop, topic, partition), series in sorted(self._series.items()):
+                window = Histogram()
+                window.merge(series.previous)
+                window.merge(series.current)
+                rows.append({
+                    "sink": self.sink, "hop": hop, "topic": topic, "partition": partition,
+                    "count": series.count + series.current.count,
+                    "sum_s": (series.total_us + series.current.total) / 1e6,
+                    "quantiles_s": {q: window.quantile(q) / 1e6 for q in QUANTILES},
+                    "max_s": series.current.max / 1e6,
+                    "slowest_trace_id": series.slowest_trace.decode() if series.slowest_trace else None,
+                })
+            return rows
+
+
+class TraceRegistry:
+    """The trackers of every sink in this process."""
+
+    def __init__(self, window_s: float = 60.0):
+        self.window_s = window_s
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+
+    def tracker(self, sink: str) -> LatencyTracker:
+        with self._lock:
+            if sink not in self._trackers:
+                self._trackers[sink] = LatencyTracker(sink, self.window_s)
+            return self._trackers[sink]
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            trackers = list(self._trackers.values())
+        return [row for tracker in trackers for row in tracker.snapshot()]
+
+    def prometheus(self) -> str:
+        rows = self.snapshot()
+        lines = [
+            "# HELP solar_pipeline_latency_seconds Latency of each pipeline hop, per sink and input partition.",
+            "# TYPE solar_pipeline_latency_seconds summary",
+        ]
+        for row in rows:
+            labels = f'sink="{row["sink"]}",hop="{row["hop"]}",topic="{row["topic"]}",partition="{row["partition"]}"'
+            for q, seconds in row["quantiles_s"].items():
+                lines.append(f'solar_pipeline_latency_seconds{{{labels},quantile="{q}"}} {seconds:.6f}')
+            lines.append(f"solar_pipeline_latency_seconds_sum{{{labels}}} {row['sum_s']:.6f}")
+            lines.append(f"solar_pipeline_latency_seconds_count{{{labels}}} {row['count']}")
+        lines.append("# HELP solar_pipeline_latency_max_seconds Highest latency of each hop in the current window.")
+        lines.append("# TYPE solar_pipeline_latency_max_seconds gauge")
+        for row in rows:
+            labels = f'sink="{row["sink"]}",hop="{row["hop"]}",topic="{row["topic"]}",partition="{row["partition"]}"'
+            lines.append(f"solar_pipeline_latency_max_seconds{{{labels}}} {row['max_s']:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = TraceRegistry()
+
+
+class LatencyTracing:
+    """
+    Mixin for a Quix Streams sink that records its latencies in `REGISTRY`
+    under `trace_name`. It must come before the sink class, so that it sees
+    every `add()` and `flush()`:
+
+        class TracedInfluxDB3Sink(LatencyTracing, InfluxDB3Sink):
+            trace_name = "influxdb"
+
+    A checkpoint commits its offsets once `flush()` has returned, which is when
+    the consume-to-commit latencies are recorded. If it fails, the messages are
+    consumed again and only count once they are written.
+    """
+
+    trace_name = "sink"
+
+    def _tracker(self) -> LatencyTracker:
+        tracker = self.__dict__.get("_latency_tracker")
+        if tracker is None:
+            tracker = self.__dict__["_latency_tracker"] = REGISTRY.tracker(self.trace_name)
+        return tracker
+
+    def add(self, value: Any, key: Any, timestamp: int, headers: Any, topic: str, partition: int, offset: int):
+        self._tracker().consumed(topic, partition, headers)
+        super().add(value=value, key=key, timestamp=timestamp, headers=headers, topic=topic,
+                    partition=partition, offset=offset)
+
+    def flush(self):
+        try:
+            super().flush()
+        except BaseException:
+            self._tracker().discard()
+            raise
+        self._tracker().committed()
+
+    def on_paused(self):
+        self._tracker().discard()
+        super().on_paused()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, content_type = REGISTRY.prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/latency":
+            body, content_type = json.dumps(REGISTRY.snapshot(), indent=2).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, window_s: float = 60.0) -> Optional[ThreadingHTTPServer]:
+    """Serves /metrics and /latency on `port` from a background thread; 0 only sets the window."""
+    REGISTRY.window_s = window_s
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="latency-metrics", daemon=True).start()
+    print(f"Serving latency metrics on :{port}/metrics")
+    return server
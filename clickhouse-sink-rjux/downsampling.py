@@ -0,0 +1,167 @@
+"""
+Windowed downsampling in front of the InfluxDB writer.
+
+Readings are reduced over tumbling windows into one point per panel and one
+point per location per window, written to their own measurements (e.g.
+`solar_panel_1m`, `solar_location_1m`). Each field becomes `<field>_mean`,
+`<field>_min`, `<field>_max`, plus a `readings` count, so a panel sending
+every second writes 1/60th of the points at one-minute resolution.
+Categorical fields (e.g. `inverter_status`) are counted per value as
+`<field>_<value>`.
+
+Only per-panel statistics are kept in the window state; location points are
+derived from them when the window closes. The state is plain JSON so it can
+live in the Quix Streams state store.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LEVELS = ("panel", "location")
+
+
+def parse_windows(spec: str) -> List[Tuple[str, int]]:
+    """Parse "1m,15m,1h" into [("1m", 60000), ("15m", 900000), ("1h", 3600000)]."""
+    units = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
+    windows = []
+    for label in (part.strip() for part in spec.split(",")):
+        if not label:
+            continue
+        unit = next((u for u in ("ms", "s", "m", "h", "d") if label.endswith(u)), None)
+        number = label[:-len(unit)] if unit else ""
+        if not unit or not number.isdigit() or int(number) <= 0:
+            raise ValueError(f"Invalid window '{label}'. Use e.g. 10s, 1m, 15m, 1h")
+        windows.append((label, int(number) * units[unit]))
+    if not windows:
+        raise ValueError("At least one downsampling window is required")
+    return windows
+
+
+class Downsampler:
+    """
+    Reducer, initializer and point builder for one kind of reading.
+
+    - `fields`: numeric fields to aggregate. When empty, every numeric value
+      of a reading is aggregated except the keys in `exclude`.
+    - `total_fields`: fields whose per-panel means are also summed into the
+      location point as `<field>_total` (e.g. the power of a whole site).
+    - `count_fields`: fields whose values are counted, e.g.
+      `inverter_status_OK` and `inverter_status_STANDBY`.
+    """
+
+    def __init__(self, measurement: str, fields: Iterable[str] = (), exclude: Iterable[str] = (),
+                 panel_key: str = "panel_id", location_key: str = "location_id",
+                 levels: Iterable[str] = LEVELS, total_fields: Iterable[str] = (), count_fields: Iterable[str] = ()):
+        self.measurement = measurement
+        self.fields = tuple(fields)
+        self.exclude = set(exclude) | {panel_key, location_key}
+        self.panel_key = panel_key
+        self.location_key = location_key
+        self.levels = tuple(levels)
+        self.total_fields = tuple(total_fields)
+        self.count_fields = tuple(count_fields)
+        self.exclude |= set(self.count_fields)
+        unknown = set(self.levels) - set(LEVELS)
+        if unknown:
+            raise ValueError(f"Unknown downsampling levels {sorted(unknown)}. Use {', '.join(LEVELS)}")
+
+    def _numeric(self, reading: dict) -> Iterable[Tuple[str, float]]:
+        if self.fields:
+            items = ((f, reading.get(f)) for f in self.fields)
+        else:
+            items = ((f, v) for f, v in reading.items() if f not in self.exclude)
+        for field, value in items:
+            # Always floats: InfluxDB rejects a field whose type changes between points
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield field, float(value)
+
+    def init(self, reading: dict) -> dict:
+        return self.reduce({}, reading)
+
+    def reduce(self, state: dict, reading: dict) -> dict:
+        panel_id = str(reading.get(self.panel_key))
+        panel = state.get(panel_id)
+        if panel is None:
+            panel = state[panel_id] = {"location": reading.get(self.location_key), "readings": 0, "fields": {}, "counts": {}}
+        panel["readings"] += 1
+        counts = panel["counts"]
+        for field in self.count_fields:
+            value = reading.get(field)
+            if value is not None:
+                key = f"{field}_{value}"
+                counts[key] = counts.get(key, 0) + 1
+        fields = panel["fields"]
+        for field, value in self._numeric(reading):
+            stats = fields.get(field)
+            if stats is None:
+                fields[field] = [value, value, value, 1]  # sum, min, max, count
+            else:
+                stats[0] += value
+                stats[1] = min(stats[1], value)
+                stats[2] = max(stats[2], value)
+                stats[3] += 1
+        return state
+
+    @staticmethod
+    def _fields(stats: Dict[str, list]) -> dict:
+        point = {}
+        for field, (total, low, high, count) in stats.items():
+            point[f"{field}_mean"] = total / count
+            point[f"{field}_min"] = low
+            point[f"{field}_max"] = high
+        return point
+
+    def points(self, window: dict, label: str) -> List[dict]:
+        """Turn a closed window ({"start", "end", "value"}) into the points to write."""
+        panels = window["value"]
+        points = []
+        if "panel" in self.levels:
+            for panel_id, panel in panels.items():
+                point = {
+                    "measurement": f"{self.measurement}_panel_{label}",
+                    self.panel_key: panel_id,
+                    self.location_key: panel["location"],
+                    "readings": panel["readings"],
+                }
+                point.update(self._fields(panel["fields"]))
+                point.update(panel["counts"])
+                points.append(point)
+
+        if "location" in self.levels:
+            locations: Dict[Optional[str], dict] = {}
+            for panel in panels.values():
+                location = locations.setdefault(
+                    panel["location"], {"panels": 0, "readings": 0, "fields": {}, "totals": {}, "counts": {}}
+                )
+                location["panels"] += 1
+                location["readings"] += panel["readings"]
+                for key, count in panel["counts"].items():
+                    location["counts"][key] = location["counts"].get(key, 0) + count
+                for field, (total, low, high, count) in panel["fields"].items():
+                    stats = location["fields"].get(field)
+                    if stats is None:
+                        location["fields"][field] = [total, low, high, count]
+                    else:
+                        stats[0] += total
+                        stats[1] = min(stats[1], low)
+                        stats[2] = max(stats[2], high)
+                        stats[3] += count
+                    if field in self.total_fields:
+                        location["totals"][field] = location["totals"].get(field, 0.0) + total / count
+            for location_id, location in locations.items():
+                point = {
+                    "measurement": f"{self.measurement}_location_{label}",
+                    self.location_key: location_id,
+                    "panels": location["panels"],
+                    "readings": location["readings"],
+                }
+                point.update(self._fields(location["fields"]))
+                point.update({f"{field}_total": total for field, total in location["totals"].items()})
+                point.update(location["counts"])
+                points.append(point)
+        return points
+
+    def tags(self, point: dict) -> List[str]:
+        return [key for key in (self.panel_key, self.location_key) if key in point]
+
+    def field_keys(self, point: dict) -> List[str]:
+        return [key for key in point if key not in ("measurement", self.panel_key, self.location_key)]
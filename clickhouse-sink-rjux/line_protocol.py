@@ -0,0 +1,263 @@
+"""
+InfluxDB line-protocol writer.
+
+`LineProtocolSink` is a drop-in alternative to Quix Streams' `InfluxDB3Sink`
+that encodes each record to line protocol as it is added, into a byte
+buffer, instead of building point objects at the checkpoint. Whenever the
+buffer reaches `flush_bytes` it is sent, optionally gzipped, while encoding
+goes on, with up to `concurrency` requests in flight over a pooled HTTP
+client. Request sizes therefore stay near `flush_bytes` however large the
+records are.
+
+The checkpoint sends what is left and waits for every request, so offsets
+are only committed once InfluxDB has accepted everything before them.
+"""
+
+import gzip
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+from urllib.parse import urlencode
+
+import urllib3
+from quixstreams.sinks import BaseSink, SinkBackpressureError
+
+logger = logging.getLogger(__name__)
+
+_MEASUREMENT_ESCAPES = str.maketrans({",": "\\,", " ": "\\ ", "\n": "\\n"})
+_KEY_ESCAPES = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n"})
+_STRING_ESCAPES = str.maketrans({'"': '\\"', "\\": "\\\\", "\n": "\\n"})
+
+# Multipliers from each precision to nanoseconds
+_TO_NS = {"ns": 1, "us": 1_000, "ms": 1_000_000, "s": 1_000_000_000}
+
+
+def _format_float(value: float) -> Optional[str]:
+    # InfluxDB rejects the whole request over one NaN or infinity
+    return repr(value) if math.isfinite(value) else None
+
+
+def _format_int(value: int) -> str:
+    return f"{value}i"
+
+
+def _format_bool(value: bool) -> str:
+    return "true" if value else "false"
+
+
+def _format_str(value: str) -> str:
+    return f'"{value.translate(_STRING_ESCAPES)}"'
+
+
+class LineProtocolEncoder:
+    """
+    Encodes dict records to line protocol with nanosecond timestamps.
+
+    Measurement, tags and fields are given like `InfluxDB3Sink`'s: fixed
+    values or callables of the record. Escaped keys are computed once per key
+    and value formatters are looked up by type, so encoding a record is a
+    handful of dict lookups and one join.
+
+    - With no `fields_keys`, every non-tag value of the record is a field.
+    - Missing, None and non-finite fields are skipped; records with no fields
+      are dropped.
+    - `time_key`: record value holding the time in `time_precision` units;
+      otherwise the Kafka timestamp (milliseconds) is used.
+    - `ints_as_floats`: write ints as floats, for fields that hold both (an
+      int and a float field of the same name conflict in InfluxDB).
+    """
+
+    def __init__(self, measurement: Union[str, Callable[[dict], str]],
+                 tags_keys: Union[Iterable[str], Callable[[dict], Iterable[str]]] = (),
+                 fields_keys: Union[Iterable[str], Callable[[dict], Iterable[str]]] = (),
+                 time_key: Optional[str] = None, time_precision: str = "ns", ints_as_floats: bool = False):
+        if time_precision not in _TO_NS:
+            raise ValueError(f"time_precision must be one of {', '.join(_TO_NS)}")
+        self._measurement = measurement if callable(measurement) else None
+        self._static_measurement = None if callable(measurement) else measurement.translate(_MEASUREMENT_ESCAPES)
+        self._tags = tags_keys if callable(tags_keys) else None
+        # Influx sorts tags on write; sending them sorted saves it the work
+        self._static_tags = None if callable(tags_keys) else sorted(tags_keys)
+        self._fields = fields_keys if callable(fields_keys) else None
+        self._static_fields = None if callable(fields_keys) else list(fields_keys)
+        self._time_key = time_key
+        self._time_multiplier = _TO_NS[time_precision]
+        self._formatters: Dict[type, Callable[[Any], str]] = {
+            float: _format_float,
+            int: _format_float if ints_as_floats else _format_int,
+            bool: _format_bool,
+            str: _format_str,
+        }
+        self._tag_prefixes: Dict[str, str] = {}
+        self._field_prefixes: Dict[str, str] = {}
+        self.dropped = 0
+
+    def _tag_prefix(self, key: str) -> str:
+        prefix = self._tag_prefixes.get(key)
+        if prefix is None:
+            prefix = self._tag_prefixes[key] = f",{key.translate(_KEY_ESCAPES)}="
+        return prefix
+
+    def _field_prefix(self, key: str) -> str:
+        prefix = self._field_prefixes.get(key)
+        if prefix is None:
+            prefix = self._field_prefixes[key] = f"{key.translate(_KEY_ESCAPES)}="
+        return prefix
+
+    def encode(self, value: dict, timestamp_ms: int) -> Optional[bytes]:
+        """One line, newline included, or None if the record has no fields."""
+        measurement = self._static_measurement or self._measurement(value).translate(_MEASUREMENT_ESCAPES)
+        tags_keys = self._static_tags if self._tags is None else sorted(self._tags(value))
+        fields_keys = self._static_fields if self._fields is None else self._fields(value)
+
+        parts = [measurement]
+        for key in tags_keys:
+            tag = value.get(key)
+            if tag is not None and tag != "":
+                parts.append(self._tag_prefix(key))
+                parts.append(str(tag).translate(_KEY_ESCAPES))
+
+        formatters = self._formatters
+        separator = " "
+        if fields_keys:
+            items = ((key, value.get(key)) for key in fields_keys)
+        else:
+            tags = set(tags_keys)
+            items = ((key, field) for key, field in value.items() if key not in tags and key != self._time_key)
+        for key, field in items:
+            formatter = formatters.get(type(field))
+            formatted = formatter(field) if formatter is not None else None
+            if formatted is None:
+                continue  # None, NaN, nested values
+            parts.append(separator)
+            parts.append(self._field_prefix(key))
+            parts.append(formatted)
+            separator = ","
+        if separator == " ":
+            self.dropped += 1
+            return None
+
+        if self._time_key is not None:
+            ns = int(value[self._time_key]) * self._time_multiplier
+        else:
+            ns = timestamp_ms * 1_000_000
+        parts.append(f" {ns}\n")
+        return "".join(parts).encode()
+
+
+class LineProtocolSink(BaseSink):
+    """
+    Writes records to InfluxDB (v3, or v2 through the same API) as line
+    protocol, sending a request each time `flush_bytes` have been encoded.
+
+    - `concurrency`: requests in flight at once. When all are busy, adding
+      records waits for the oldest to finish.
+    - `gzip_level`: 0 sends plain text, 1-9 gzips each request (in the
+      sending thread, off the consumer thread).
+    """
+
+    def __init__(self, host: str, token: str, database: str, encoder: LineProtocolEncoder,
+                 organization_id: str = "", flush_bytes: int = 1024 * 1024, concurrency: int = 4,
+                 gzip_level: int = 1, request_timeout: float = 10.0, **kwargs):
+        super().__init__(**kwargs)
+        query = urlencode({"bucket": database, "org": organization_id or "", "precision": "ns"})
+        self._url = f"{host.rstrip('/')}/api/v2/write?{query}"
+        self._headers = {"Authorization": f"Token {token}", "Content-Type": "text/plain; charset=utf-8"}
+        if gzip_level:
+            self._headers["Content-Encoding"] = "gzip"
+        self._encoder = encoder
+        self._flush_bytes = flush_bytes
+        self._concurrency = concurrency
+        self._gzip_level = gzip_level
+        self._timeout = urllib3.Timeout(total=request_timeout)
+        self._buffer = bytearray()
+        self._points = 0
+        self._in_flight: deque = deque()
+        self._failure: Optional[Exception] = None
+        self._http: Optional[urllib3.PoolManager] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats = {"points": 0, "requests": 0, "bytes": 0, "sent_bytes": 0, "seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def setup(self):
+        self._http = urllib3.PoolManager(maxsize=self._concurrency, block=True, retries=False)
+        self._executor = ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix="influx-write")
+
+    def _post(self, body: bytes, points: int) -> Optional[float]:
+        """Send one request; returns the retry-after seconds if InfluxDB pushed back."""
+        started = time.monotonic()
+        payload = gzip.compress(body, compresslevel=self._gzip_level) if self._gzip_level else body
+        try:
+            response = self._http.request("POST", self._url, body=payload, headers=self._headers,
+                                          timeout=self._timeout, preload_content=True)
+        except urllib3.exceptions.HTTPError as e:
+            logger.warning("InfluxDB write request failed, pausing: %s", e)
+            return 5.0
+        if response.status in (429, 503):
+            return float(response.headers.get("Retry-After") or 1)
+        if response.status >= 300:
+            raise RuntimeError(f"InfluxDB write failed ({response.status}): {response.data[:500].decode(errors='replace')}")
+        with self._stats_lock:
+            self.stats["points"] += points
+            self.stats["requests"] += 1
+            self.stats["bytes"] += len(body)
+            self.stats["sent_bytes"] += len(payload)
+            self.stats["seconds"] += time.monotonic() - started
+        return None
+
+    def _send(self):
+        if not self._buffer:
+            return
+        if self._http is None:
+            self.setup()
+        while len(self._in_flight) >= self._concurrency:
+            self._wait_oldest()
+        body, points = bytes(self._buffer), self._points
+        del self._buffer[:]
+        self._points = 0
+        if self._failure is None:
+            self._in_flight.append(self._executor.submit(self._post, body, points))
+
+    def _wait_oldest(self):
+        """Wait for the oldest request. A failure is kept for flush() to raise: add() must not."""
+        try:
+            retry_after = self._in_flight.popleft().result()
+            if retry_after is not None:
+                raise SinkBackpressureError(retry_after=retry_after)
+        except Exception as e:
+            self._failure = self._failure or e
+
+    def add(self, value: Any, key: Any, timestamp: int, headers: Any, topic: str, partition: int, offset: int):
+        if not isinstance(value, dict):
+            raise TypeError(f'Sink "{self.__class__.__name__}" supports only dictionaries, got {type(value)}')
+        if self._failure is not None:
+            return  # Everything since the last commit is consumed again anyway
+        line = self._encoder.encode(value, timestamp)
+        if line is None:
+            return
+        self._buffer += line
+        self._points += 1
+        if len(self._buffer) >= self._flush_bytes:
+            self._send()
+
+    def flush(self):
+        self._send()
+        while self._in_flight:
+            self._wait_oldest()
+        failure, self._failure = self._failure, None
+        if failure is not None:
+            self.on_paused()
+            raise failure
+        logger.debug("Sent data to InfluxDB; %s", self.stats)
+
+    def on_paused(self):
+        # Everything since the last commit is consumed again after the pause
+        del self._buffer[:]
+        self._points = 0
+        while self._in_flight:
+            self._in_flight.popleft().cancel()
+        self._failure = None
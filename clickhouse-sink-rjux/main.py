@@ -5,6 +5,10 @@ import os
 from quixstreams import Application
 from quixstreams.sinks.core.influxdb3 import InfluxDB3Sink
 
+from downsampling import Downsampler, parse_windows
+from line_protocol import LineProtocolEncoder, LineProtocolSink
+from tracing import LatencyTracing, start_metrics_server
+
 # for local dev, load env vars from a .env file
 from dotenv import load_dotenv
 load_dotenv()
@@ -15,16 +19,59 @@ field_keys = keys.split(",") if (keys := os.environ.get("INFLUXDB_FIELD_KEYS"))
 measurement_name = os.environ.get("INFLUXDB_MEASUREMENT_NAME", "measurement1")
 time_setter = col if (col := os.environ.get("TIMESTAMP_COLUMN")) else None
 
-influxdb_v3_sink = InfluxDB3Sink(
-    token=os.environ["INFLUXDB_TOKEN"],
-    host=os.environ["INFLUXDB_HOST"],
-    organization_id=os.environ["INFLUXDB_ORG"],
-    tags_keys=tag_keys,
-    fields_keys=field_keys,
-    time_setter=time_setter,
-    database=os.environ["INFLUXDB_DATABASE"],
-    measurement=measurement_name,
-)
+# raw: write every reading; downsampled: only per-window aggregates; both
+write_mode = os.environ.get("INFLUXDB_WRITE_MODE", "raw").lower()
+if write_mode not in ("raw", "downsampled", "both"):
+    raise ValueError('INFLUXDB_WRITE_MODE must be one of "raw", "downsampled", "both"')
+
+
+# stock: Quix Streams' InfluxDB3Sink; line_protocol: requests sized in bytes (see line_protocol.py)
+writer = os.environ.get("INFLUXDB_WRITER", "stock").lower()
+if writer not in ("stock", "line_protocol"):
+    raise ValueError('INFLUXDB_WRITER must be one of "stock", "line_protocol"')
+
+
+class TracedInfluxDB3Sink(LatencyTracing, InfluxDB3Sink):
+    trace_name = "influxdb"
+
+
+class TracedLineProtocolSink(LatencyTracing, LineProtocolSink):
+    trace_name = "influxdb"
+
+
+def influxdb_sink(measurement, tags_keys, fields_keys, time_setter=None, traced=False):
+    # Only one sink per app can be traced: they would share their metrics
+    if writer == "line_protocol":
+        return (TracedLineProtocolSink if traced else LineProtocolSink)(
+            token=os.environ["INFLUXDB_TOKEN"],
+            host=os.environ["INFLUXDB_HOST"],
+            organization_id=os.environ.get("INFLUXDB_ORG", ""),
+            database=os.environ["INFLUXDB_DATABASE"],
+            # TIMESTAMP_COLUMN holds nanoseconds. Numbers are all written as floats: the
+            # generator clamps readings with max(0, x), so night values are int 0 and
+            # InfluxDB rejects a field once it has been written with the other type
+            encoder=LineProtocolEncoder(measurement, tags_keys, fields_keys, time_key=time_setter, time_precision="ns",
+                                        ints_as_floats=True),
+            flush_bytes=int(os.environ.get("INFLUXDB_FLUSH_KB", "1024")) * 1024,
+            concurrency=int(os.environ.get("INFLUXDB_WRITE_CONCURRENCY", "4")),
+            gzip_level=int(os.environ.get("INFLUXDB_GZIP_LEVEL", "1")),
+        )
+    return (TracedInfluxDB3Sink if traced else InfluxDB3Sink)(
+        token=os.environ["INFLUXDB_TOKEN"],
+        host=os.environ["INFLUXDB_HOST"],
+        organization_id=os.environ["INFLUXDB_ORG"],
+        database=os.environ["INFLUXDB_DATABASE"],
+        measurement=measurement,
+        tags_keys=tags_keys,
+        fields_keys=fields_keys,
+        time_setter=time_setter,
+    )
+
+
+def event_time_ms(value, headers, timestamp, timestamp_type) -> int:
+    # TIMESTAMP_COLUMN holds nanoseconds; windows run on milliseconds
+    event_time = value.get(time_setter) if isinstance(value, dict) else None
+    return event_time // 1_000_000 if isinstance(event_time, int) else timestamp
 
 
 app = Application(
@@ -33,11 +80,57 @@ app = Application(
     commit_every=int(os.environ.get("BUFFER_SIZE", "1000")),
     commit_interval=float(os.environ.get("BUFFER_DELAY", "1")),
 )
-input_topic = app.topic(os.environ["input"])
+# Downsampling windows follow the readings' own timestamps when there are any
+input_topic = app.topic(
+    os.environ["input"],
+    timestamp_extractor=event_time_ms if time_setter and write_mode != "raw" else None,
+)
 
 sdf = app.dataframe(input_topic)
-sdf.sink(influxdb_v3_sink)
+
+if write_mode in ("downsampled", "both"):
+    # Windows are per message key and must hold all of a location's panels, so readings
+    # keyed by anything else (the generator's KEY_STRATEGY) are regrouped by location first
+    location_key = os.environ.get("DOWNSAMPLE_LOCATION_KEY", "location_id")
+    keyed_by_location = os.environ.get("KEY_STRATEGY", "location").lower() == "location"
+    readings = sdf if keyed_by_location else sdf.group_by(location_key)
+    downsampler = Downsampler(
+        measurement=measurement_name,
+        fields=field_keys,
+        exclude=tag_keys + ([time_setter] if time_setter else []),
+        panel_key=os.environ.get("DOWNSAMPLE_PANEL_KEY", "panel_id"),
+        location_key=location_key,
+        levels=[level.strip() for level in os.environ.get("DOWNSAMPLE_LEVELS", "panel,location").split(",") if level.strip()],
+        total_fields=[f.strip() for f in os.environ.get("DOWNSAMPLE_TOTAL_FIELDS", "power_output").split(",") if f.strip()],
+        count_fields=[f.strip() for f in os.environ.get("DOWNSAMPLE_COUNT_FIELDS", "inverter_status").split(",") if f.strip()],
+    )
+    grace_ms = int(os.environ.get("DOWNSAMPLE_GRACE_MS", "1000"))
+    for label, duration_ms in parse_windows(os.environ.get("DOWNSAMPLE_WINDOWS", "1m,15m,1h")):
+        points = (
+            readings.tumbling_window(duration_ms=duration_ms, grace_ms=grace_ms, name=f"downsample_{label}")
+            .reduce(reducer=downsampler.reduce, initializer=downsampler.init)
+            .final()
+        )
+        # One record per point; each is timestamped with its window start
+        points = points.apply(lambda window, label=label: downsampler.points(window, label), expand=True)
+        points.sink(influxdb_sink(
+            measurement=lambda point: point["measurement"],
+            tags_keys=downsampler.tags,
+            fields_keys=downsampler.field_keys,
+        ))
+
+if write_mode in ("raw", "both"):
+    sdf.sink(influxdb_sink(
+        tags_keys=tag_keys,
+        fields_keys=field_keys,
+        time_setter=time_setter,
+        measurement=measurement_name,
+        # Raw readings carry the generator's trace headers, see tracing.py
+        traced=True,
+    ))
 
 
 if __name__ == "__main__":
+    start_metrics_server(int(os.environ.get("TRACE_METRICS_PORT", "9464")),
+                         window_s=float(os.environ.get("TRACE_WINDOW_S", "60")))
     app.run()
\ No newline at end of file
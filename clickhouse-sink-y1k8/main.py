@@ -15,10 +15,14 @@ from quixstreams import Application
 from quixstreams.sinks.base import BatchingSink, SinkBatch
 import clickhouse_connect
 from dotenv import load_dotenv
+
+from tracing import LatencyTracing, start_metrics_server
 load_dotenv()
 
 
-class ClickHouseSink(BatchingSink):
+class ClickHouseSink(LatencyTracing, BatchingSink):
+    trace_name = "clickhouse"
+
     def __init__(
         self,
         host: str,
@@ -186,4 +190,6 @@ sdf = app.dataframe(input_topic)
 sdf.sink(sink)
 
 if __name__ == "__main__":
+    start_metrics_server(int(os.environ.get("TRACE_METRICS_PORT", "9464")),
+                         window_s=float(os.environ.get("TRACE_WINDOW_S", "60")))
     app.run()
\ No newline at end of file
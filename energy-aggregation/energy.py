@@ -0,0 +1,204 @@
+"""
+Energy, availability and peak power of solar panels and locations.
+
+`Integrator` runs on every reading, before any window. It keeps the previous
+reading of each panel in the state store and adds two values to the reading:
+`interval_s`, the seconds since that previous reading, and `energy_wh`, the
+energy over that interval by the trapezoidal rule. Windows then only have to
+sum these values. Energy between two readings that fall in different windows
+counts towards the window of the later reading, so none of it is lost at a
+window boundary.
+
+`EnergyAggregator` holds the reducers and record builders for the windows.
+Availability is time-weighted: each interval counts towards the inverter
+status of the reading that ends it, as seconds per status (`ok_s`,
+`standby_s`, ...).
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from quixstreams.state import State
+
+
+def parse_window(label: str) -> int:
+    """Parse "15m" into 900000 milliseconds."""
+    units = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
+    unit = next((u for u in ("ms", "s", "m", "h", "d") if label.endswith(u)), None)
+    number = label[:-len(unit)] if unit else ""
+    if not unit or not number.isdigit() or int(number) <= 0:
+        raise ValueError(f"Invalid window '{label}'. Use e.g. 30s, 1m, 15m, 1h")
+    return int(number) * units[unit]
+
+
+def parse_hopping_windows(spec: str) -> List[Tuple[str, int, int]]:
+    """Parse "1h/5m,1d/1h" into [("1h", 3600000, 300000), ("1d", 86400000, 3600000)]."""
+    windows = []
+    for part in (part.strip() for part in spec.split(",")):
+        if not part:
+            continue
+        label, _, step = part.partition("/")
+        duration_ms = parse_window(label.strip())
+        step_ms = parse_window(step.strip()) if step else duration_ms
+        if duration_ms % step_ms:
+            raise ValueError(f"Invalid hopping window '{part}'. The step must divide the duration, e.g. 1h/5m")
+        windows.append((label.strip(), duration_ms, step_ms))
+    return windows
+
+
+class Integrator:
+    """
+    Stateful step annotating each reading with `interval_s` and `energy_wh`.
+
+    Use with `sdf.apply(integrator, stateful=True)` on readings keyed by
+    location: the state holds the last time and power of each panel.
+
+    - `max_gap_s`: longer gaps between readings of a panel (it was offline,
+      or the service was stopped) are not integrated.
+    """
+
+    def __init__(self, panel_key: str = "panel_id", power_key: str = "power_output",
+                 time_key: str = "timestamp", max_gap_s: float = 10.0):
+        self.panel_key = panel_key
+        self.power_key = power_key
+        self.time_key = time_key
+        self.max_gap_s = max_gap_s
+
+    def __call__(self, reading: dict, state: State) -> dict:
+        panel_id = str(reading.get(self.panel_key))
+        time_ns = int(reading[self.time_key])
+        power = float(reading.get(self.power_key) or 0.0)
+
+        previous = state.get(panel_id)
+        seconds = energy_wh = 0.0
+        if previous is None or time_ns > previous[0]:
+            state.set(panel_id, [time_ns, power])
+            if previous is not None:
+                seconds = (time_ns - previous[0]) / 1_000_000_000
+                if seconds <= self.max_gap_s:
+                    energy_wh = (previous[1] + power) / 2 * seconds / 3600
+                else:
+                    seconds = 0.0
+        # Duplicates and readings older than the panel's last one add nothing
+
+        reading["interval_s"] = seconds
+        reading["energy_wh"] = energy_wh
+        return reading
+
+
+class EnergyAggregator:
+    """
+    Reducers and record builders for the energy windows.
+
+    Tumbling windows keep per-panel statistics and produce one record per
+    panel plus one per location. Hopping windows only keep location totals, as
+    every reading updates all the windows it overlaps.
+    """
+
+    def __init__(self, panel_key: str = "panel_id", location_key: str = "location_id",
+                 power_key: str = "power_output", status_key: str = "inverter_status"):
+        self.panel_key = panel_key
+        self.location_key = location_key
+        self.power_key = power_key
+        self.status_key = status_key
+
+    def _add(self, stats: dict, reading: dict) -> dict:
+        stats["readings"] += 1
+        stats["energy_wh"] += reading["energy_wh"]
+        power = float(reading.get(self.power_key) or 0.0)
+        if stats["peak_power_w"] is None or power > stats["peak_power_w"]:
+            stats["peak_power_w"] = power
+        if reading["interval_s"]:
+            status = str(reading.get(self.status_key) or "UNKNOWN")
+            stats["status_s"][status] = stats["status_s"].get(status, 0.0) + reading["interval_s"]
+        return stats
+
+    @staticmethod
+    def _empty() -> dict:
+        return {"readings": 0, "energy_wh": 0.0, "peak_power_w": None, "status_s": {}}
+
+    def init_panels(self, reading: dict) -> dict:
+        return self.reduce_panels({}, reading)
+
+    def reduce_panels(self, state: dict, reading: dict) -> dict:
+        panel_id = str(reading.get(self.panel_key))
+        panel = state.get(panel_id)
+        if panel is None:
+            panel = state[panel_id] = self._empty()
+            panel["location"] = reading.get(self.location_key)
+        self._add(panel, reading)
+        return state
+
+    def init_location(self, reading: dict) -> dict:
+        return self._add(self._empty(), reading)
+
+    def reduce_location(self, state: dict, reading: dict) -> dict:
+        return self._add(state, reading)
+
+    @staticmethod
+    def _figures(stats: dict, window_s: float) -> dict:
+        status_s = stats["status_s"]
+        covered_s = sum(status_s.values())
+        figures = {
+            "energy_wh": round(stats["energy_wh"], 3),
+            "energy_kwh": round(stats["energy_wh"] / 1000, 6),
+            # Average over the whole window, so a panel offline half of it shows half
+            "mean_power_w": round(stats["energy_wh"] * 3600 / window_s, 2),
+            "peak_power_w": stats["peak_power_w"],
+            "readings": stats["readings"],
+            "availability": round(status_s.get("OK", 0.0) / covered_s, 4) if covered_s else None,
+        }
+        for status, seconds in status_s.items():
+            figures[f"{status.lower()}_s"] = round(seconds, 3)
+        return figures
+
+    def _record(self, level: str, label: str, window: dict) -> dict:
+        return {
+            "level": level,
+            "window": label,
+            "start": window["start"],
+            "end": window["end"],
+            "timestamp": window["start"] * 1_000_000,  # Nanoseconds, like the readings
+        }
+
+    def window_records(self, window: dict, label: str) -> List[dict]:
+        """Turn a closed tumbling window into one record per panel and per location."""
+        window_s = (window["end"] - window["start"]) / 1000
+        records = []
+        locations: Dict[Optional[str], dict] = {}
+        for panel_id, panel in window["value"].items():
+            record = self._record("panel", label, window)
+            record[self.location_key] = panel["location"]
+            record[self.panel_key] = panel_id
+            record.update(self._figures(panel, window_s))
+            records.append(record)
+
+            location = locations.get(panel["location"])
+            if location is None:
+                location = locations[panel["location"]] = self._empty()
+                location["panels"] = 0
+                location["peak_power_w"] = panel["peak_power_w"]
+            location["panels"] += 1
+            location["readings"] += panel["readings"]
+            location["energy_wh"] += panel["energy_wh"]
+            location["peak_power_w"] = max(location["peak_power_w"], panel["peak_power_w"])
+            for status, seconds in panel["status_s"].items():
+                location["status_s"][status] = location["status_s"].get(status, 0.0) + seconds
+
+        for location_id, location in locations.items():
+            records.append(self.location_record(window, label, location_id, location, window_s))
+        return records
+
+    def location_record(self, window: dict, label: str, location_id: Optional[str], stats: dict,
+                        window_s: Optional[float] = None) -> dict:
+        """
+        One location's record. `peak_power_w` is the highest single-panel
+        reading, as panels do not report at the same instant.
+        """
+        if window_s is None:
+            window_s = (window["end"] - window["start"]) / 1000
+        record = self._record("location", label, window)
+        record[self.location_key] = location_id
+        if "panels" in stats:
+            record["panels"] = stats["panels"]
+        record.update(self._figures(stats, window_s))
+        return record
@@ -0,0 +1,85 @@
+# import the Quix Streams modules for interacting with Kafka.
+# For general info, see https://quix.io/docs/quix-streams/introduction.html
+from quixstreams import Application
+
+import os
+
+from energy import EnergyAggregator, Integrator, parse_hopping_windows, parse_window
+
+# for local dev, load env vars from a .env file
+# from dotenv import load_dotenv
+# load_dotenv()
+
+
+def event_time_ms(value, headers, timestamp, timestamp_type) -> int:
+    # Readings carry their time in nanoseconds; windows run on milliseconds
+    event_time = value.get("timestamp") if isinstance(value, dict) else None
+    return event_time // 1_000_000 if isinstance(event_time, int) else timestamp
+
+
+def main():
+    """
+    Integrates solar panel power into energy over event-time windows.
+
+    All the state of a location (the last reading of each of its panels and
+    its open windows) must live on one partition. Readings keyed by
+    location_id, the generator's default KEY_STRATEGY, need nothing more;
+    with any other key they are regrouped by location_id first.
+
+    - A tumbling window of ENERGY_WINDOW produces one record per panel and one
+      per location (level "panel" / "location").
+    - Hopping windows from ENERGY_HOPPING_WINDOWS produce rolling location
+      totals, e.g. the last hour's energy every 5 minutes.
+
+    See energy.py for how energy and availability are computed.
+    """
+
+    # Setup necessary objects
+    app = Application(
+        consumer_group=os.environ.get("CONSUMER_GROUP_NAME", "energy-aggregation"),
+        auto_create_topics=True,
+        auto_offset_reset="earliest"
+    )
+    input_topic = app.topic(name=os.environ["input"], timestamp_extractor=event_time_ms)
+    output_topic = app.topic(name=os.environ["output"])
+    sdf = app.dataframe(topic=input_topic)
+    if os.environ.get("KEY_STRATEGY", "location").lower() != "location":
+        sdf = sdf.group_by("location_id")
+
+    window_label = os.environ.get("ENERGY_WINDOW", "1m")
+    grace_ms = int(os.environ.get("ENERGY_GRACE_MS", "1000"))
+    aggregator = EnergyAggregator()
+
+    sdf = sdf.apply(Integrator(max_gap_s=float(os.environ.get("ENERGY_MAX_GAP_S", "10"))), stateful=True)
+
+    # Per panel and per location
+    energy = (
+        sdf.tumbling_window(duration_ms=parse_window(window_label), grace_ms=grace_ms, name=f"energy_{window_label}")
+        .reduce(reducer=aggregator.reduce_panels, initializer=aggregator.init_panels)
+        .final()
+    )
+    energy = energy.apply(lambda window, label=window_label: aggregator.window_records(window, label), expand=True)
+    energy.to_topic(output_topic)
+
+    # Rolling per-location totals
+    for label, duration_ms, step_ms in parse_hopping_windows(os.environ.get("ENERGY_HOPPING_WINDOWS", "1h/5m")):
+        rolling = (
+            sdf.hopping_window(duration_ms=duration_ms, step_ms=step_ms, grace_ms=grace_ms, name=f"energy_{label}_{step_ms}")
+            .reduce(reducer=aggregator.reduce_location, initializer=aggregator.init_location)
+            .final()
+        )
+        rolling = rolling.apply(
+            lambda window, key, timestamp, headers, label=label: aggregator.location_record(
+                window, label, key.decode("utf-8") if isinstance(key, bytes) else str(key), window["value"]
+            ),
+            metadata=True,
+        )
+        rolling.to_topic(output_topic)
+
+    # With our pipeline defined, now run the Application
+    app.run()
+
+
+# It is recommended to execute Applications under a conditional main
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""
+Destinations of the fan-out sink.
+
+Each backend writes decoded rows to one system, with the same tables, columns
+and endpoints as the dedicated sink app for that system (clickhouse-sink-y1k8,
+timescaledb-sink, questdb-sink-9z5r, api-sink and hivemq-sink), so the
+fan-out sink can replace those deployments without touching anything
+downstream. They are configured from the same environment variables too.
+
+A backend's `write` either writes every row it is given or raises; retries,
+spilling and batching are left to the router. Client libraries are imported
+in `setup`, so only those of the configured backends need to be installed.
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+class Row(NamedTuple):
+    """One consumed message, decoded once and shared by every backend."""
+    value: Dict[str, Any]
+    key: Optional[str]
+    timestamp: int  # Kafka timestamp, milliseconds
+    topic: str
+    partition: int
+    offset: int
+
+    def encode(self) -> bytes:
+        """Spill log record."""
+        return json.dumps(self, separators=(",", ":")).encode()
+
+    @classmethod
+    def decode(cls, record: bytes) -> "Row":
+        return cls(*json.loads(record))
+
+
+def _event_time(row: Row) -> datetime:
+    timestamp_ns = row.value.get("timestamp") or 0
+    return (
+        datetime.fromtimestamp(timestamp_ns / 1_000_000_000)
+        if timestamp_ns
+        else datetime.fromtimestamp(row.timestamp / 1000)
+    )
+
+
+class Backend:
+    """
+    One destination.
+
+    - `batch_size`: rows per request; a checkpoint's rows are split to fit.
+    - `spill`: whether rows that cannot be written are kept on disk to be
+      replayed, or (for live-only destinations) dropped.
+    """
+
+    name = ""
+    spill = True
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    def setup(self):
+        pass
+
+    def write(self, rows: List[Row]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ClickHouseBackend(Backend):
+    name = "clickhouse"
+
+    COLUMNS = [
+        "panel_id", "location_id", "location_name", "latitude", "longitude", "timezone",
+        "power_output", "unit_power", "temperature", "unit_temp", "irradiance", "unit_irradiance",
+        "voltage", "unit_voltage", "current", "unit_current", "inverter_status", "timestamp",
+        "kafka_timestamp", "kafka_key", "kafka_topic", "kafka_partition", "kafka_offset",
+    ]
+    _DEFAULTS = {
+        "panel_id": "", "location_id": "", "location_name": "", "latitude": 0.0, "longitude": 0.0, "timezone": 0,
+        "power_output": 0, "unit_power": "", "temperature": 0.0, "unit_temp": "", "irradiance": 0,
+        "unit_irradiance": "", "voltage": 0.0, "unit_voltage": "", "current": 0, "unit_current": "",
+        "inverter_status": "",
+    }
+
+    def __init__(self, host: str, database: str, table: str, username: Optional[str] = None,
+                 password: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+        self.database = database
+        self.table = table
+        self.username = username
+        self.password = password
+        self.client = None
+
+    def setup(self):
+        import clickhouse_connect
+
+        connect_kwargs = {"host": self.host, "database": self.database}
+        if self.username:
+            connect_kwargs["username"] = self.username
+        if self.password:
+            connect_kwargs["password"] = self.password
+        self.client = clickhouse_connect.get_client(**connect_kwargs)
+        self.client.command(f"""
+        CREATE TABLE IF NOT EXISTS {self.table} (
+            panel_id String,
+            location_id String,
+            location_name String,
+            latitude Float64,
+            longitude Float64,
+            timezone Int32,
+            power_output Int32,
+            unit_power String,
+            temperature Float64,
+            unit_temp String,
+            irradiance Int32,
+            unit_irradiance String,
+            voltage Float64,
+            unit_voltage String,
+            current Int32,
+            unit_current String,
+            inverter_status String,
+            timestamp DateTime64(3),
+            kafka_timestamp DateTime64(3),
+            kafka_key String,
+            kafka_topic String,
+            kafka_partition Int32,
+            kafka_offset Int64
+        )
+        ENGINE = MergeTree()
+        ORDER BY (timestamp, panel_id)
+        """)
+
+    def write(self, rows: List[Row]):
+        data = []
+        for row in rows:
+            value = row.value
+            data.append([value.get(column, default) for column, default in self._DEFAULTS.items()] + [
+                _event_time(row),
+                datetime.fromtimestamp(row.timestamp / 1000),
+                row.key or "",
+                row.topic,
+                row.partition,
+                row.offset,
+            ])
+        self.client.insert(self.table, data, column_names=self.COLUMNS)
+
+    def close(self):
+        if self.client:
+            self.client.close()
+
+
+class TimescaleDBBackend(Backend):
+    name = "timescaledb"
+
+    _COLUMNS = (
+        "panel_id", "location_id", "location_name", "latitude", "longitude", "timezone",
+        "power_output", "unit_power", "temperature", "unit_temp", "irradiance", "unit_irradiance",
+        "voltage", "unit_voltage", "current", "unit_current", "inverter_status",
+    )
+
+    def __init__(self, host: str, port: int, dbname: str, user: str, password: str, table_name: str,
+                 schema_name: str = "public", **kwargs):
+        super().__init__(**kwargs)
+        self.connect_kwargs = dict(host=host, port=port, dbname=dbname, user=user, password=password)
+        self.table = f"{schema_name}.{table_name}"
+        self._connection = None
+
+    def setup(self):
+        import psycopg2
+
+        self._connection = psycopg2.connect(**self.connect_kwargs)
+        with self._connection.cursor() as cursor:
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                panel_id TEXT,
+                location_id TEXT,
+                location_name TEXT,
+                latitude DOUBLE PRECISION,
+                longitude DOUBLE PRECISION,
+                timezone INTEGER,
+                power_output INTEGER,
+                unit_power TEXT,
+                temperature DOUBLE PRECISION,
+                unit_temp TEXT,
+                irradiance INTEGER,
+                unit_irradiance TEXT,
+                voltage DOUBLE PRECISION,
+                unit_voltage TEXT,
+                current INTEGER,
+                unit_current TEXT,
+                inverter_status TEXT,
+                timestamp TIMESTAMPTZ,
+                PRIMARY KEY (panel_id, timestamp)
+            );
+            """)
+            self._connection.commit()
+            try:
+                cursor.execute(f"SELECT create_hypertable('{self.table}', 'timestamp', if_not_exists => TRUE);")
+            except Exception as e:
+                print(f"Warning: Could not create hypertable (TimescaleDB extension may not be available): {e}")
+                self._connection.rollback()
+        self._connection.commit()
+
+    def write(self, rows: List[Row]):
+        from psycopg2.extras import execute_values
+
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in self._COLUMNS[1:])
+        sql = (
+            f"INSERT INTO {self.table} ({', '.join(self._COLUMNS)}, timestamp) VALUES %s "
+            f"ON CONFLICT (panel_id, timestamp) DO UPDATE SET {updates}"
+        )
+        # A batch must not update the same row twice, so keep the last reading per key
+        records = {}
+        for row in rows:
+            timestamp = datetime.fromtimestamp((row.value.get("timestamp") or 0) / 1_000_000_000)
+            records[(row.value.get("panel_id"), timestamp)] = tuple(
+                row.value.get(column) for column in self._COLUMNS
+            ) + (timestamp,)
+        try:
+            with self._connection.cursor() as cursor:
+                execute_values(cursor, sql, list(records.values()), page_size=self.batch_size)
+            self._connection.commit()
+        except Exception:
+            self._connection.rollback()
+            raise
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+
+
+class QuestDBBackend(Backend):
+    name = "questdb"
+
+    def __init__(self, host: str, port: int, token: str, table: str, **kwargs):
+        super().__init__(**kwargs)
+        self.conf = f"http::addr={host}:{port};token={token};"
+        self.table = table
+        self.sender = None
+
+    def setup(self):
+        from questdb.ingress import Sender
+
+        self.sender = Sender.from_conf(self.conf)
+        self.sender.establish()
+
+    def write(self, rows: List[Row]):
+        buffer = self.sender.new_buffer()
+        for row in rows:
+            data = row.value
+            buffer.row(
+                self.table,
+                symbols={
+                    "panel_id": data.get("panel_id", ""),
+                    "location_id": data.get("location_id", ""),
+                    "location_name": data.get("location_name", ""),
+                    "inverter_status": data.get("inverter_status", ""),
+                },
+                columns={
+                    "latitude": float(data.get("latitude", 0)),
+                    "longitude": float(data.get("longitude", 0)),
+                    "timezone": int(data.get("timezone", 0)),
+                    "power_output": float(data.get("power_output", 0)),
+                    "temperature": float(data.get("temperature", 0)),
+                    "irradiance": float(data.get("irradiance", 0)),
+                    "voltage": float(data.get("voltage", 0)),
+                    "current": float(data.get("current", 0)),
+                },
+                at=_event_time(row),
+            )
+        self.sender.flush(buffer)
+
+    def close(self):
+        if self.sender:
+            self.sender.close()
+
+
+class ApiBackend(Backend):
+    """POSTs each location's rows as one NDJSON body to `/data/{location_id}`, like api-sink's bulk mode."""
+
+    name = "api"
+
+    def __init__(self, base_url: str, timeout: float = 10.0, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = None
+
+    def setup(self):
+        import requests
+
+        self.session = requests.Session()
+
+    def write(self, rows: List[Row]):
+        lanes: Dict[str, List[bytes]] = {}
+        for row in rows:
+            location_id = row.value.get("location_id")
+            url = f"{self.base_url}/data/{location_id}" if location_id else f"{self.base_url}/data/"
+            lanes.setdefault(url, []).append(json.dumps(row.value, separators=(",", ":")).encode())
+        for url, lines in lanes.items():
+            response = self.session.post(
+                url, data=b"\n".join(lines) + b"\n", timeout=self.timeout,
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+            response.raise_for_status()
+
+    def close(self):
+        if self.session:
+            self.session.close()
+
+
+class MqttBackend(Backend):
+    """
+    Publishes each row to `<topic_root>/<location_id>` with QoS 1 and waits
+    for the broker's acknowledgements, like hivemq-sink. Readings are live
+    telemetry, so rows are not spilled: paho re-sends unacknowledged messages
+    itself after a reconnect.
+    """
+
+    name = "mqtt"
+    spill = False
+
+    def __init__(self, server: str, port: int, topic_root: str, username: str = "", password: str = "",
+                 inflight_window: int = 1000, ack_timeout: float = 30.0, topic_field: Optional[str] = None,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.server = server
+        self.port = port
+        self.topic_root = topic_root
+        self.username = username
+        self.password = password
+        self.inflight_window = inflight_window
+        self.ack_timeout = ack_timeout
+        self.topic_field = topic_field
+        self.client = None
+        self.publisher = None
+
+    def setup(self):
+        import paho.mqtt.client as paho
+        from paho import mqtt
+
+        from publisher import InflightPublisher
+
+        client_id = f"{os.getenv('Quix__Deployment__Name', 'default')}-fanout"
+        self.client = paho.Client(callback_api_version=paho.CallbackAPIVersion.VERSION2, client_id=client_id)
+        self.client.tls_set(tls_version=mqtt.client.ssl.PROTOCOL_TLS)
+        self.client.reconnect_delay_set(5, 60)
+        if self.username:
+            self.client.username_pw_set(self.username, self.password)
+        self.publisher = InflightPublisher(self.client, window=self.inflight_window)
+        self.client.connect(self.server, self.port)
+        self.client.loop_start()
+
+    def write(self, rows: List[Row]):
+        for row in rows:
+            key = row.value.get(self.topic_field) if self.topic_field else row.key
+            self.publisher.publish(
+                f"{self.topic_root}/{key if key is not None else row.value.get('location_id')}",
+                payload=json.dumps(row.value, separators=(",", ":")),
+                timeout=self.ack_timeout,
+            )
+        self.publisher.flush(timeout=self.ack_timeout)
+
+    def close(self):
+        if self.client:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+
+def _int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+# Each backend from the environment variables of its dedicated sink app
+BACKENDS: Dict[str, Callable[[], Backend]] = {
+    "clickhouse": lambda: ClickHouseBackend(
+        host=os.environ.get("CLICKHOUSE_HOST", "localhost"),
+        database=os.environ.get("CLICKHOUSE_DATABASE", "default"),
+        table=os.environ.get("CLICKHOUSE_TABLE", "solar_readings"),
+        username=os.environ.get("CLICKHOUSE_USERNAME", "default"),
+        password=os.environ.get("CLICKHOUSE_TOKEN_KEY"),
+        batch_size=_int("CLICKHOUSE_BUFFER_SIZE", 1000),
+    ),
+    "timescaledb": lambda: TimescaleDBBackend(
+        host=os.environ.get("TSDB_HOST"),
+        port=_int("TSDB_PORT", 5432),
+        dbname=os.environ.get("TSDB_DBNAME"),
+        user=os.environ.get("TSDB_USER"),
+        password=os.environ.get("TSDB_PASSWORD_KEY"),
+        table_name=os.environ.get("TSDB_TABLE", "solar_data"),
+        schema_name=os.environ.get("TSDB_SCHEMA", "public"),
+        batch_size=_int("TSDB_BATCH_SIZE", 1000),
+    ),
+    "questdb": lambda: QuestDBBackend(
+        host=os.environ.get("QDB_HOST", "localhost"),
+        port=_int("QDB_PORT", 9000),
+        token=os.environ.get("QDB_TOKEN_KEY", ""),
+        table=os.environ.get("QDB_TABLE", "solar_data"),
+        batch_size=_int("QDB_BUFFER_SIZE", 1000),
+    ),
+    "api": lambda: ApiBackend(
+        base_url=os.environ["API_BASE_URL"],
+        timeout=float(os.environ.get("API_TIMEOUT", "10")),
+        batch_size=_int("API_BULK_MAX_RECORDS", 500),
+    ),
+    "mqtt": lambda: MqttBackend(
+        server=os.environ["mqtt_server"],
+        port=_int("mqtt_port", 8883),
+        topic_root=os.environ.get("mqtt_topic_root", "solar-data"),
+        username=os.environ.get("mqtt_username", ""),
+        password=os.environ.get("mqtt_password", ""),
+        inflight_window=_int("mqtt_inflight_window", 1000),
+        ack_timeout=float(os.environ.get("mqtt_ack_timeout", "30")),
+        batch_size=_int("mqtt_inflight_window", 1000),
+        # Per-location topics, like hivemq-sink, whatever the generator's KEY_STRATEGY
+        topic_field=None if os.environ.get("KEY_STRATEGY", "location").lower() == "location" else "location_id",
+    ),
+}
+
+
+def backends_from_env(names: List[str]) -> List[Backend]:
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown:
+        raise ValueError(f"Unknown backends {unknown}. Use {', '.join(BACKENDS)}")
+    return [BACKENDS[name]() for name in names]
@@ -0,0 +1,92 @@
+"""
+CPU and broker egress of one fan-out consumer against one consumer per sink.
+
+Both sides get the same serialized solar readings, as fetched from Kafka, and
+deliver them to the same number of in-memory backends that encode each row
+the way a database client would. Separate consumers each fetch and decode
+every message; the fan-out sink fetches and decodes it once and runs the
+backends concurrently.
+
+    python benchmark.py --messages 200000 --sinks 5
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import List
+
+from quixstreams.sinks.base import SinkBatch
+
+from backends import Backend, Row
+from router import FanoutSink, Lane
+
+
+class MemoryBackend(Backend):
+    """Encodes rows like a client library would, without sending them anywhere."""
+
+    def __init__(self, name: str, batch_size: int = 1000):
+        super().__init__(batch_size=batch_size)
+        self.name = name
+        self.rows = 0
+
+    def write(self, rows: List[Row]):
+        body = [(row.value["panel_id"], row.value["power_output"], row.value["timestamp"]) for row in rows]
+        self.rows += len(body)
+
+
+def generate_messages(count: int, seed: int = 7) -> List[bytes]:
+    rng = random.Random(seed)
+    start_ns = 1_700_000_000_000_000_000
+    messages = []
+    for i in range(count):
+        power_output = round(rng.uniform(0, 300), 1)
+        messages.append(json.dumps({
+            "panel_id": f"LONDON-P{i % 100 + 1:04d}", "location_id": "LONDON", "location_name": "London, UK",
+            "latitude": 51.5074, "longitude": -0.1278, "timezone": 1,
+            "power_output": power_output, "unit_power": "W", "temperature": round(rng.uniform(20, 40), 1),
+            "unit_temp": "C", "irradiance": round(rng.uniform(0, 950), 1), "unit_irradiance": "W/m²",
+            "voltage": 24.0, "unit_voltage": "V", "current": round(power_output / 24, 1), "unit_current": "A",
+            "inverter_status": "OK" if power_output > 0 else "STANDBY", "timestamp": start_ns + i * 1_000_000_000,
+        }).encode())
+    return messages
+
+
+def consume(sink: FanoutSink, messages: List[bytes], checkpoint: int):
+    """What a consumer does with fetched messages: decode each one, batch, write at each checkpoint."""
+    for start in range(0, len(messages), checkpoint):
+        batch = SinkBatch(topic="solar-data", partition=0)
+        for offset, message in enumerate(messages[start:start + checkpoint], start):
+            batch.append(value=json.loads(message), key=b"LONDON", timestamp=offset, headers=[], offset=offset)
+        sink.write(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare one fan-out consumer with one consumer per sink")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--sinks", type=int, default=5)
+    parser.add_argument("--checkpoint", type=int, default=1000, help="Messages per checkpoint (BUFFER_SIZE)")
+    args = parser.parse_args()
+
+    messages = generate_messages(args.messages)
+    fetched = sum(len(message) for message in messages)
+    print(f"{'consumers':>22} {'CPU s':>8} {'wall s':>8} {'fetched MB':>11}")
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    for i in range(args.sinks):
+        sink = FanoutSink([Lane(MemoryBackend(f"sink{i}"), required=True)], stats_interval=0)
+        consume(sink, messages, args.checkpoint)
+    print(f"{f'{args.sinks} separate':>22} {time.process_time() - cpu:>8.2f} {time.perf_counter() - wall:>8.2f} "
+          f"{fetched * args.sinks / 1e6:>11.1f}")
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    backends = [MemoryBackend(f"sink{i}") for i in range(args.sinks)]
+    sink = FanoutSink([Lane(backend, required=True) for backend in backends], stats_interval=0)
+    consume(sink, messages, args.checkpoint)
+    print(f"{'1 fan-out':>22} {time.process_time() - cpu:>8.2f} {time.perf_counter() - wall:>8.2f} "
+          f"{fetched / 1e6:>11.1f}")
+    assert all(backend.rows == args.messages for backend in backends)
+
+
+if __name__ == "__main__":
+    main()
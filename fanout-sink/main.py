@@ -0,0 +1,85 @@
+# import the Quix Streams modules for interacting with Kafka.
+# For general info, see https://quix.io/docs/quix-streams/introduction.html
+# For sinks, see https://quix.io/docs/quix-streams/connectors/sinks/index.html
+from quixstreams import Application
+
+import os
+
+from backends import backends_from_env
+from retry import Backoff, CircuitBreaker
+from router import FanoutSink, Lane
+from spill_log import SpillLog, is_persistent
+from tracing import start_metrics_server
+
+# for local dev, load env vars from a .env file
+from dotenv import load_dotenv
+load_dotenv()
+
+
+def _names(variable: str, default: str = "") -> list:
+    return [name.strip().lower() for name in os.environ.get(variable, default).split(",") if name.strip()]
+
+
+def build_lanes() -> list:
+    """One lane per backend in FANOUT_BACKENDS, configured from that backend's own variables."""
+    names = _names("FANOUT_BACKENDS")
+    required = set(_names("FANOUT_REQUIRED")) or set(names)
+    spill_dir = os.environ.get("FANOUT_SPILL_DIR", "state/fanout-spill")
+    if spill_dir and not is_persistent(spill_dir):
+        # Spilled rows have their offsets committed, so they would be lost with the pod
+        print(f"{spill_dir} is not on a persistent volume (enable state for this deployment): not spilling")
+        spill_dir = ""
+    lanes = []
+    for backend in backends_from_env(names):
+        spill = None
+        if backend.spill and spill_dir:
+            spill = SpillLog(
+                os.path.join(spill_dir, backend.name),
+                segment_bytes=int(os.environ.get("FANOUT_SPILL_SEGMENT_MB", "64")) * 1024 * 1024,
+                max_bytes=int(os.environ.get("FANOUT_SPILL_MAX_MB", "1024")) * 1024 * 1024,
+            )
+            if len(spill):
+                print(f"[{backend.name}] found spilled rows from a previous run: {spill.metrics()}")
+        lanes.append(Lane(
+            backend,
+            required=backend.name in required,
+            spill=spill,
+            attempts=int(os.environ.get("FANOUT_RETRY_ATTEMPTS", "3")),
+            backoff=Backoff(
+                base=float(os.environ.get("FANOUT_RETRY_BACKOFF_BASE", "0.5")),
+                cap=float(os.environ.get("FANOUT_RETRY_BACKOFF_MAX", "5")),
+            ),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get("FANOUT_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.environ.get("FANOUT_BREAKER_RESET_TIMEOUT", "30")),
+            ),
+            drain_retry_interval=float(os.environ.get("FANOUT_DRAIN_RETRY_INTERVAL", "5")),
+        ))
+    return lanes
+
+
+def main():
+    """
+    Consumes the topic once and writes every checkpoint's batch to all the
+    configured backends at the same time, instead of one consumer group per
+    destination each fetching and decoding the whole topic. See router.py.
+    """
+    app = Application(
+        consumer_group=os.environ.get("CONSUMER_GROUP_NAME", "fanout-sink"),
+        auto_offset_reset="earliest",
+        commit_every=int(os.environ.get("FANOUT_BUFFER_SIZE", "1000")),
+        commit_interval=float(os.environ.get("FANOUT_BUFFER_TIMEOUT", "1")),
+    )
+    input_topic = app.topic(os.environ["input"])
+    sdf = app.dataframe(input_topic)
+
+    sdf.sink(FanoutSink(build_lanes(), stats_interval=float(os.environ.get("FANOUT_STATS_INTERVAL", "60"))))
+
+    # Latency of each message from generation to every required backend, see tracing.py
+    start_metrics_server(int(os.environ.get("TRACE_METRICS_PORT", "9464")),
+                         window_s=float(os.environ.get("TRACE_WINDOW_S", "60")))
+    app.run()
+
+
+if __name__ == "__main__":
+    main()
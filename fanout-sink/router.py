@@ -0,0 +1,227 @@
+"""
+Fan-out of one consumed topic to several backends.
+
+`FanoutSink` receives each checkpoint's batch once, with every message
+decoded once, and hands the same rows to one `Lane` per backend. The lanes
+write concurrently, each on its own thread, and each deals with failures on
+its own:
+
+- rows are written in requests of the backend's `batch_size`, each retried
+  with exponential backoff, behind a circuit breaker;
+- rows that still cannot be written go to the lane's spill log, and are
+  replayed oldest first before any newer row once the backend is back: one
+  request per batch, with the batch spilled behind the rest, and between
+  batches from a background thread, so no batch waits for a whole drain;
+- without a spill log (or with a full one), rows for an optional backend are
+  dropped, while a required backend holds the batch back.
+
+A batch is committed only when every required lane has written or durably
+spilled all of its rows; otherwise the sink raises SinkBackpressureError and
+the batch is consumed again. Each lane remembers the last offset it has taken
+care of per partition, so the lanes that did succeed skip those rows the
+second time round instead of writing them twice.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from quixstreams.sinks import BatchingSink, SinkBackpressureError, SinkBatch
+
+from backends import Backend, Row
+from retry import Backoff, CircuitBreaker
+from spill_log import SpillLog, SpillLogFull
+from tracing import LatencyTracing
+
+
+class Lane:
+    """One backend, with its own retries, circuit breaker and spill log."""
+
+    def __init__(self, backend: Backend, required: bool, spill: Optional[SpillLog] = None,
+                 attempts: int = 3, backoff: Optional[Backoff] = None, breaker: Optional[CircuitBreaker] = None,
+                 drain_retry_interval: float = 5.0):
+        self.backend = backend
+        self.name = backend.name
+        self.required = required
+        self.spill = spill
+        self.attempts = max(1, attempts)
+        self.backoff = backoff or Backoff(base=0.5, cap=5.0)
+        self.breaker = breaker or CircuitBreaker()
+        self.drain_retry_interval = drain_retry_interval
+        self._ready = False
+        self._next_drain_attempt = 0.0
+        self._acked: Dict[Tuple[str, int], int] = {}
+        # deliver() and the idle drain both use the backend and the spill log
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"rows": 0, "requests": 0, "retries": 0, "spilled": 0, "drained": 0, "dropped": 0, "seconds": 0.0}
+
+    def _setup(self):
+        if not self._ready:
+            self.backend.setup()
+            self._ready = True
+
+    def _write(self, rows: List[Row]):
+        """One request, retried with backoff; raises once the attempts are used up."""
+        for attempt in range(self.attempts):
+            if not self.breaker.allow():
+                raise RuntimeError(f"circuit open for another {self.breaker.retry_after():.1f}s")
+            started = time.monotonic()
+            try:
+                self._setup()
+                self.backend.write(rows)
+            except Exception:
+                self.breaker.record_failure()
+                self._ready = False  # Reconnect on the next attempt
+                if attempt + 1 == self.attempts:
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(self.backoff.delay(attempt))
+                continue
+            self.breaker.record_success()
+            self.stats["requests"] += 1
+            self.stats["rows"] += len(rows)
+            self.stats["seconds"] += time.monotonic() - started
+            return
+
+    def _drain(self) -> bool:
+        """
+        Replay the oldest `batch_size` spilled rows in one request.
+        Returns True once the spill log is empty.
+        """
+        if time.monotonic() < self._next_drain_attempt:
+            return False
+        records, position = self.spill.read(self.backend.batch_size)
+        try:
+            self._write([Row.decode(record) for record in records])
+        except Exception as e:
+            print(f"[{self.name}] still unavailable, keeping spilled rows: {e}")
+            self._next_drain_attempt = time.monotonic() + self.drain_retry_interval
+            return False
+        self.spill.commit(position)
+        self.stats["drained"] += len(records)
+        return not len(self.spill)
+
+    def drain_while_idle(self):
+        """
+        Drain the spill log between batches, one request per turn of the lock:
+        Quix Streams only writes to sinks when there are new messages.
+        """
+        while True:
+            time.sleep(self.drain_retry_interval)
+            while True:
+                with self._lock:
+                    if self._closed:
+                        return
+                    if not len(self.spill) or self._drain() or time.monotonic() < self._next_drain_attempt:
+                        break
+
+    def _fallback(self, rows: List[Row], topic: str, partition: int) -> Optional[float]:
+        if self.spill is not None:
+            try:
+                self.spill.append(row.encode() for row in rows)
+                self.stats["spilled"] += len(rows)
+                self._acked[(topic, partition)] = rows[-1].offset
+                return None
+            except SpillLogFull as e:
+                print(f"[{self.name}] {e}")
+        if not self.required:
+            print(f"[{self.name}] dropping {len(rows)} rows for an optional backend")
+            self.stats["dropped"] += len(rows)
+            self._acked[(topic, partition)] = rows[-1].offset
+            return None
+        return max(self.breaker.retry_after(), self.drain_retry_interval)
+
+    def deliver(self, topic: str, partition: int, rows: List[Row]) -> Optional[float]:
+        """
+        Write, spill or drop the rows of one batch. Returns None once they are
+        taken care of, or the seconds to wait before the batch is retried.
+        """
+        with self._lock:
+            return self._deliver(topic, partition, rows)
+
+    def _deliver(self, topic: str, partition: int, rows: List[Row]) -> Optional[float]:
+        acked = self._acked.get((topic, partition), -1)
+        if rows and rows[0].offset <= acked:
+            rows = [row for row in rows if row.offset > acked]
+        if not rows:
+            return None
+
+        # Spilled rows must reach the backend before newer ones do. Only the oldest
+        # of them are sent here; while more are left the rows are spilled behind them
+        if self.spill is not None and len(self.spill) and not self._drain():
+            return self._fallback(rows, topic, partition)
+
+        for start in range(0, len(rows), self.backend.batch_size):
+            chunk = rows[start:start + self.backend.batch_size]
+            try:
+                self._write(chunk)
+            except Exception as e:
+                print(f"[{self.name}] write failed: {e}")
+                self._next_drain_attempt = time.monotonic() + self.drain_retry_interval
+                return self._fallback(rows[start:], topic, partition)
+            self._acked[(topic, partition)] = chunk[-1].offset
+        return None
+
+    def metrics(self) -> dict:
+        metrics = dict(self.stats, required=self.required, breaker=self.breaker.state)
+        if self.spill is not None:
+            metrics.update(self.spill.metrics())
+        return metrics
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self.backend.close()
+            if self.spill is not None:
+                self.spill.close()
+
+
+class FanoutSink(LatencyTracing, BatchingSink):
+    """Writes every batch to all lanes concurrently; commits once the required ones have it."""
+
+    trace_name = "fanout"
+
+    def __init__(self, lanes: List[Lane], stats_interval: float = 60.0):
+        super().__init__()
+        if not lanes:
+            raise ValueError("At least one backend is required")
+        self.lanes = lanes
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats_interval = stats_interval
+        self._next_stats = time.monotonic() + stats_interval
+
+    def setup(self):
+        self._executor = ThreadPoolExecutor(max_workers=len(self.lanes), thread_name_prefix="fanout")
+        for lane in self.lanes:
+            if lane.spill is not None:
+                threading.Thread(target=lane.drain_while_idle, name=f"fanout-drain-{lane.name}", daemon=True).start()
+
+    def write(self, batch: SinkBatch):
+        if self._executor is None:
+            self.setup()
+        rows = [
+            Row(item.value, item.key.decode() if isinstance(item.key, bytes) else item.key,
+                item.timestamp, batch.topic, batch.partition, item.offset)
+            for item in batch
+        ]
+        futures = [
+            (lane, self._executor.submit(lane.deliver, batch.topic, batch.partition, rows))
+            for lane in self.lanes
+        ]
+        waits = {lane.name: wait for lane, future in futures if (wait := future.result()) is not None}
+
+        if self._stats_interval and time.monotonic() >= self._next_stats:
+            self._next_stats = time.monotonic() + self._stats_interval
+            print(f"Fan-out metrics: { {lane.name: lane.metrics() for lane in self.lanes} }")
+
+        if waits:
+            print(f"Required backends {sorted(waits)} did not take the batch, pausing")
+            raise SinkBackpressureError(retry_after=max(waits.values()))
+
+    def close(self):
+        for lane in self.lanes:
+            lane.close()
+        if self._executor is not None:
+            self._executor.shutdown()
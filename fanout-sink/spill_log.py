@@ -0,0 +1,355 @@
+"""
+A small append-only, disk-backed spill log for sinks.
+
+When the destination database is unreachable a sink appends the encoded rows
+of a batch here instead of dropping them. Once the database is back the sink
+drains the log in large batches, oldest first, and only then resumes writing
+live batches, so per-partition ordering is preserved.
+
+Layout on disk (one directory per sink):
+
+    00000000000000000001.seg   pre-allocated, memory-mapped segment files
+    00000000000000000002.seg
+    cursor                      durable read position (segment id, offset)
+
+Each record in a segment is framed as ``<length:u32><crc32:u32><payload>``.
+A zero length marks the end of the written part of a segment. On start-up the
+tail segment is scanned and truncated logically at the first torn or corrupt
+record, so a crash mid-append never yields a half-written row.
+
+Only the standard library is used, so the module can be copied as-is into any
+other sink app in this project.
+
+Offsets are committed once rows are spilled, so the log must be on a volume
+that outlives the container: in a Quix deployment that is the state volume,
+mounted under ``state/`` when state is enabled for the deployment. Sinks check
+``is_persistent()`` and don't spill anywhere else.
+"""
+
+import mmap
+import os
+import struct
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+_HEADER = struct.Struct("<II")
+_CURSOR = struct.Struct("<QQ")
+_SEGMENT_SUFFIX = ".seg"
+
+
+def is_persistent(path: str) -> bool:
+    """
+    Whether files in `path` survive a restart. In a Quix deployment only mounted
+    volumes do (the container's root filesystem goes with the pod); elsewhere any
+    path is taken to be persistent.
+    """
+    if not os.environ.get("Quix__Deployment__Name"):
+        return True
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        path = os.path.dirname(path)
+    return path != os.path.dirname(path)  # Not the root filesystem
+
+
+class SpillLogFull(Exception):
+    """Raised when appending would exceed the configured disk budget."""
+
+
+class _Segment:
+    def __init__(self, path: str, segment_id: int, size: int, create: bool):
+        self.path = path
+        self.segment_id = segment_id
+        mode = "w+b" if create else "r+b"
+        self._file = open(path, mode)
+        if create:
+            self._file.truncate(size)
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.mm = mmap.mmap(self._file.fileno(), self.size)
+        self.write_offset = 0
+
+    def scan(self, start: int = 0) -> Tuple[int, int]:
+        """Validate records from ``start``; return (end offset, record count)."""
+        offset, count = start, 0
+        while offset + _HEADER.size <= self.size:
+            length, crc = _HEADER.unpack_from(self.mm, offset)
+            end = offset + _HEADER.size + length
+            if length == 0 or end > self.size:
+                break
+            if zlib.crc32(self.mm[offset + _HEADER.size:end]) != crc:
+                break
+            offset, count = end, count + 1
+        return offset, count
+
+    def free(self) -> int:
+        return self.size - self.write_offset
+
+    def append(self, payload: bytes) -> None:
+        offset = self.write_offset
+        _HEADER.pack_into(self.mm, offset, len(payload), zlib.crc32(payload))
+        start = offset + _HEADER.size
+        self.mm[start:start + len(payload)] = payload
+        self.write_offset = start + len(payload)
+        # Keep the end marker explicit in case the segment is being reused.
+        if self.write_offset + _HEADER.size <= self.size:
+            _HEADER.pack_into(self.mm, self.write_offset, 0, 0)
+
+    def read(self, offset: int) -> Tuple[Optional[bytes], int]:
+        """Return (payload, next offset), or (None, offset) at the end."""
+        if offset >= self.write_offset:
+            return None, offset
+        length, _ = _HEADER.unpack_from(self.mm, offset)
+        start = offset + _HEADER.size
+        return bytes(self.mm[start:start + length]), start + length
+
+    def sync(self) -> None:
+        self.mm.flush()
+
+    def close(self) -> None:
+        self.mm.close()
+        self._file.close()
+
+
+class SpillLog:
+    """
+    Bounded, crash-safe FIFO of opaque byte records.
+
+    Typical use from a ``BatchingSink``:
+
+        spill.append(encoded_rows)          # database down; offsets may commit
+        ...
+        records, position = spill.read(max_records=10_000)
+        write_to_database(records)          # raises if still down
+        spill.commit(position)              # drained records are released
+
+    Appends are synced to disk before returning, so once ``append`` returns
+    it is safe to let Kafka commit the offsets of the spilled batch. If the
+    disk budget would be exceeded ``SpillLogFull`` is raised and nothing from
+    the call is written; the sink should then apply backpressure instead.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        fsync: bool = True,
+    ):
+        if segment_bytes <= _HEADER.size * 2:
+            raise ValueError("segment_bytes is too small")
+        if max_bytes < segment_bytes:
+            raise ValueError("max_bytes must be at least segment_bytes")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._segments: List[_Segment] = []
+        self._read_segment_id = 0
+        self._read_offset = 0
+        self._pending_records = 0
+        self._pending_bytes = 0
+        self.total_spilled = 0
+        self.total_drained = 0
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    # ------------------------------------------------------------------
+    # Recovery
+    # ------------------------------------------------------------------
+    def _recover(self):
+        segment_ids = sorted(
+            int(name[:-len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(_SEGMENT_SUFFIX)
+        )
+        self._read_segment_id, self._read_offset = self._load_cursor()
+
+        for segment_id in segment_ids:
+            path = self._segment_path(segment_id)
+            if segment_id < self._read_segment_id or os.path.getsize(path) == 0:
+                # Fully drained (or never written) before a crash.
+                os.remove(path)
+                continue
+            segment = _Segment(path, segment_id, 0, create=False)
+            segment.write_offset, count = segment.scan()
+            start = self._read_offset if segment_id == self._read_segment_id else 0
+            count -= self._count_range(segment, 0, start)
+            self._pending_records += count
+            self._pending_bytes += segment.write_offset - start
+            self._segments.append(segment)
+
+        if self._segments and self._read_segment_id < self._segments[0].segment_id:
+            self._read_segment_id, self._read_offset = self._segments[0].segment_id, 0
+
+    def _load_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(self._cursor_path(), "rb") as f:
+                return _CURSOR.unpack(f.read(_CURSOR.size))
+        except (FileNotFoundError, struct.error):
+            return 0, 0
+
+    def _store_cursor(self):
+        tmp_path = self._cursor_path() + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_CURSOR.pack(self._read_segment_id, self._read_offset))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self._cursor_path())
+
+    def _cursor_path(self) -> str:
+        return os.path.join(self.directory, "cursor")
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.directory, f"{segment_id:020d}{_SEGMENT_SUFFIX}")
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def append(self, records: Iterable[bytes]) -> int:
+        """Durably append ``records``; return how many were written."""
+        records = list(records)
+        if not records:
+            return 0
+        self._check_budget(records)
+
+        touched = []
+        for payload in records:
+            segment = self._tail_for(len(payload))
+            segment.append(payload)
+            if not touched or touched[-1] is not segment:
+                touched.append(segment)
+            self._pending_bytes += _HEADER.size + len(payload)
+
+        if self.fsync:
+            for segment in touched:
+                segment.sync()
+
+        self._pending_records += len(records)
+        self.total_spilled += len(records)
+        return len(records)
+
+    def _check_budget(self, records: List[bytes]):
+        """Simulate the append so a batch is either fully spilled or not at all."""
+        capacity = self.segment_bytes - _HEADER.size
+        free = self._segments[-1].free() - _HEADER.size if self._segments else -1
+        new_segments = 0
+        for payload in records:
+            needed = _HEADER.size + len(payload)
+            if needed > capacity:
+                raise ValueError(
+                    f"Record of {len(payload)} bytes does not fit in a "
+                    f"{self.segment_bytes} byte segment"
+                )
+            if needed > free:
+                new_segments += 1
+                free = capacity
+            free -= needed
+        if self.disk_bytes + new_segments * self.segment_bytes > self.max_bytes:
+            raise SpillLogFull(
+                f"Spill log at {self.directory} would exceed {self.max_bytes} bytes"
+            )
+
+    def _tail_for(self, payload_size: int) -> _Segment:
+        needed = _HEADER.size * 2 + payload_size
+        if self._segments and self._segments[-1].free() >= needed:
+            return self._segments[-1]
+        segment_id = self._segments[-1].segment_id + 1 if self._segments else max(1, self._read_segment_id)
+        segment = _Segment(self._segment_path(segment_id), segment_id, self.segment_bytes, create=True)
+        if not self._segments:
+            self._read_segment_id, self._read_offset = segment_id, 0
+        self._segments.append(segment)
+        return segment
+
+    # ------------------------------------------------------------------
+    # Draining
+    # ------------------------------------------------------------------
+    def read(self, max_records: int) -> Tuple[List[bytes], Tuple[int, int]]:
+        """
+        Return up to ``max_records`` of the oldest records without removing them,
+        along with the position to pass to ``commit`` once they are written.
+        """
+        records = []
+        segment_id, offset = self._read_segment_id, self._read_offset
+        for segment in self._segments:
+            if segment.segment_id < segment_id:
+                continue
+            if segment.segment_id > segment_id:
+                segment_id, offset = segment.segment_id, 0
+            while len(records) < max_records:
+                payload, next_offset = segment.read(offset)
+                if payload is None:
+                    break
+                records.append(payload)
+                offset = next_offset
+            if len(records) >= max_records:
+                break
+        return records, (segment_id, offset)
+
+    def commit(self, position: Tuple[int, int]) -> None:
+        """Release every record before ``position`` and free drained segments."""
+        segment_id, offset = position
+        released_records = 0
+        released_bytes = 0
+        for segment in self._segments:
+            if segment.segment_id < self._read_segment_id or segment.segment_id > segment_id:
+                continue
+            start = self._read_offset if segment.segment_id == self._read_segment_id else 0
+            stop = offset if segment.segment_id == segment_id else segment.write_offset
+            released_records += self._count_range(segment, start, stop)
+            released_bytes += stop - start
+
+        self._read_segment_id, self._read_offset = segment_id, offset
+        self._store_cursor()
+        self._pending_records -= released_records
+        self._pending_bytes -= released_bytes
+        self.total_drained += released_records
+
+        # Delete segments that are completely drained.
+        while self._segments:
+            head = self._segments[0]
+            if head.segment_id > segment_id or (
+                head.segment_id == segment_id and offset < head.write_offset
+            ):
+                break
+            head.close()
+            os.remove(head.path)
+            self._segments.pop(0)
+
+        if not self._segments:
+            # Empty log: the next append starts on a fresh segment.
+            self._read_segment_id, self._read_offset = segment_id + 1, 0
+            self._store_cursor()
+
+    @staticmethod
+    def _count_range(segment: _Segment, start: int, stop: int) -> int:
+        count = 0
+        while start < stop:
+            _, start = segment.read(start)
+            count += 1
+        return count
+
+    # ------------------------------------------------------------------
+    # Introspection
+    # ------------------------------------------------------------------
+    def __len__(self) -> int:
+        return self._pending_records
+
+    @property
+    def disk_bytes(self) -> int:
+        return sum(segment.size for segment in self._segments)
+
+    def metrics(self) -> dict:
+        return {
+            "spill_depth_records": self._pending_records,
+            "spill_depth_bytes": self._pending_bytes,
+            "spill_segments": len(self._segments),
+            "spill_disk_bytes": self.disk_bytes,
+            "spill_disk_budget_bytes": self.max_bytes,
+            "spilled_total": self.total_spilled,
+            "drained_total": self.total_drained,
+        }
+
+    def close(self) -> None:
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
@@ -5,13 +5,39 @@
 
 import os
 import json
+from typing import Dict, Tuple
+
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from quixstreams import Application
-from quixstreams.sinks.base import BatchingSink, SinkBatch, SinkBackpressureError
-
-
-class GoogleSheetsSink(BatchingSink):
+from quixstreams.sinks.base import BaseSink, SinkBatch, SinkBackpressureError
+
+from sheets_writer import QuotaExhausted, SheetsWriter, TokenBucket, aggregate_rows
+from tracing import LatencyTracing, start_metrics_server
+
+HEADERS = [
+    'panel_id', 'location_id', 'location_name', 'latitude', 'longitude',
+    'timezone', 'power_output', 'unit_power', 'temperature', 'unit_temp',
+    'irradiance', 'unit_irradiance', 'voltage', 'unit_voltage', 'current',
+    'unit_current', 'inverter_status', 'timestamp', 'kafka_timestamp',
+    'stream_id'
+]
+NUMERIC_COLUMNS = ['power_output', 'temperature', 'irradiance', 'voltage', 'current']
+
+
+class GoogleSheetsSink(BaseSink):
+    """
+    Appends solar readings to a Google Sheet without running into API quotas.
+
+    All partition batches of a checkpoint are coalesced into a single
+    `append_rows` call, optionally pre-aggregated to one row per panel per
+    interval. A token bucket sized to the Sheets quota is checked before any
+    request is made; when it is empty the sink backpressures instead of
+    waiting for a 429. Offsets are only committed after the append succeeds.
+
+    It batches per partition like a BatchingSink, but has no per-batch
+    `write()`: `flush()` sends all the batches at once.
+    """
     def __init__(self,
                  on_client_connect_success=None,
                  on_client_connect_failure=None):
@@ -19,8 +45,11 @@ class GoogleSheetsSink(BatchingSink):
             on_client_connect_success=on_client_connect_success,
             on_client_connect_failure=on_client_connect_failure
         )
+        self._batches: Dict[Tuple[str, int], SinkBatch] = {}
         self._client = None
-        self._worksheet = None
+        self._writer = None
+        self._aggregate_interval = float(os.environ.get('GSHEET_AGGREGATE_INTERVAL', '0'))
+        self._headers = HEADERS + (['readings'] if self._aggregate_interval > 0 else [])
 
     def setup(self):
         try:
@@ -44,24 +73,14 @@ class GoogleSheetsSink(BatchingSink):
 
             spreadsheet = self._client.open_by_key(sheet_id)
 
-            sheet_name = os.environ.get('GSHEET_SHEET_NAME', 'Sheet1')
-            try:
-                self._worksheet = spreadsheet.worksheet(sheet_name)
-            except gspread.WorksheetNotFound:
-                self._worksheet = spreadsheet.add_worksheet(
-                    title=sheet_name, rows=1000, cols=20
-                )
-
-            # Add headers if the sheet is empty
-            if not self._worksheet.get_all_values():
-                headers = [
-                    'panel_id', 'location_id', 'location_name', 'latitude', 'longitude',
-                    'timezone', 'power_output', 'unit_power', 'temperature', 'unit_temp',
-                    'irradiance', 'unit_irradiance', 'voltage', 'unit_voltage', 'current',
-                    'unit_current', 'inverter_status', 'timestamp', 'kafka_timestamp',
-                    'stream_id'
-                ]
-                self._worksheet.append_row(headers)
+            self._writer = SheetsWriter(
+                spreadsheet,
+                sheet_name=os.environ.get('GSHEET_SHEET_NAME', 'Sheet1'),
+                headers=self._headers,
+                bucket=TokenBucket(float(os.environ.get('GSHEET_REQUESTS_PER_MINUTE', '60'))),
+                max_rows_per_sheet=int(os.environ.get('GSHEET_MAX_ROWS_PER_SHEET', '100000')),
+            )
+            self._writer.open()
 
         except Exception as e:
             self._on_client_connect_failure(e)
@@ -69,60 +88,70 @@ class GoogleSheetsSink(BatchingSink):
 
         self._on_client_connect_success()
 
-    def write(self, batch: SinkBatch):
+    def _records(self, batch: SinkBatch):
+        for item in batch:
+            # Parse the value field which contains JSON string
+            if isinstance(item.value, str):
+                data = json.loads(item.value)
+            else:
+                data = item.value
+
+            yield {
+                **data,
+                'kafka_timestamp': item.timestamp,
+                'stream_id': getattr(item, 'stream_id', ''),
+            }
+
+    def add(self, value, key, timestamp, headers, topic, partition, offset):
+        batch = self._batches.get((topic, partition))
+        if batch is None:
+            batch = self._batches[(topic, partition)] = SinkBatch(topic=topic, partition=partition)
+        batch.append(value=value, key=key, timestamp=timestamp, headers=headers, offset=offset)
+
+    def flush(self):
+        """Coalesce the batches of every partition into a single append."""
         try:
-            rows_to_add = []
-
-            for item in batch:
-                # Parse the value field which contains JSON string
-                if isinstance(item.value, str):
-                    data = json.loads(item.value)
-                else:
-                    data = item.value
-
-                row = [
-                    data.get('panel_id', ''),
-                    data.get('location_id', ''),
-                    data.get('location_name', ''),
-                    data.get('latitude', ''),
-                    data.get('longitude', ''),
-                    data.get('timezone', ''),
-                    data.get('power_output', ''),
-                    data.get('unit_power', ''),
-                    data.get('temperature', ''),
-                    data.get('unit_temp', ''),
-                    data.get('irradiance', ''),
-                    data.get('unit_irradiance', ''),
-                    data.get('voltage', ''),
-                    data.get('unit_voltage', ''),
-                    data.get('current', ''),
-                    data.get('unit_current', ''),
-                    data.get('inverter_status', ''),
-                    data.get('timestamp', ''),
-                    item.timestamp,
-                    getattr(item, 'stream_id', '')
-                ]
-                rows_to_add.append(row)
-
-            if rows_to_add:
-                self._worksheet.append_rows(rows_to_add)
+            records = [record for batch in self._batches.values() for record in self._records(batch)]
+            self._append(records)
+        finally:
+            self._batches.clear()
+
+    def on_paused(self):
+        # The batches are consumed again after the pause
+        self._batches.clear()
+
+    def _append(self, records):
+        if not records:
+            return
+        if self._aggregate_interval > 0:
+            records = aggregate_rows(records, self._aggregate_interval, NUMERIC_COLUMNS, self._headers)
+        rows = [[record.get(column, '') for column in self._headers] for record in records]
 
-        except Exception as e:
-            # Handle quota/rate limit errors with backpressure
-            if "quota" in str(e).lower() or "rate" in str(e).lower():
-                raise SinkBackpressureError(
-                    retry_after=60.0,
-                    topic=batch.topic,
-                    partition=batch.partition,
-                )
+        try:
+            self._writer.append(rows)
+        except QuotaExhausted as e:
+            # Out of request budget: pause before a 429 happens
+            raise SinkBackpressureError(retry_after=e.retry_after)
+        except gspread.exceptions.APIError as e:
+            # Quota/rate limit errors that slipped through (e.g. shared quota)
+            if e.response.status_code == 429:
+                retry_after = float(e.response.headers.get('Retry-After', '60'))
+                raise SinkBackpressureError(retry_after=retry_after)
             raise e
 
 
+class TracedGoogleSheetsSink(LatencyTracing, GoogleSheetsSink):
+    """GoogleSheetsSink with latency metrics; the mixin must wrap its flush()."""
+    trace_name = "google_sheets"
+
+
 def main():
     app = Application(
         consumer_group="google_sheets_sink",
         auto_create_topics=True,
         auto_offset_reset="earliest",
+        # Longer checkpoints coalesce more messages into each append
+        commit_interval=float(os.environ.get('GSHEET_COMMIT_INTERVAL', '10')),
     )
 
     input_topic_name = os.environ.get('GSHEET_INPUT')
@@ -134,9 +163,11 @@ def main():
     # Debug print to show raw message structure
     sdf = sdf.apply(lambda r: (print(f"Raw message: {r}"), r)[1])
 
-    sheets_sink = GoogleSheetsSink()
+    sheets_sink = TracedGoogleSheetsSink()
     sdf.sink(sheets_sink)
 
+    start_metrics_server(int(os.environ.get("TRACE_METRICS_PORT", "9464")),
+                         window_s=float(os.environ.get("TRACE_WINDOW_S", "60")))
     app.run()
 
 
@@ -0,0 +1,186 @@
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import gspread
+
+# Google Sheets hard limit on cells per spreadsheet (all worksheets together)
+SPREADSHEET_CELL_LIMIT = 10_000_000
+
+
+class QuotaExhausted(Exception):
+    """No request budget left; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Sheets API request budget exhausted, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Request budget sized to the Sheets API quota (per minute, per user).
+
+    Holds at most `capacity` tokens and refills continuously at
+    `capacity / 60` tokens per second.
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.capacity = requests_per_minute
+        self.rate = requests_per_minute / 60.0
+        self.tokens = requests_per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, tokens: int = 1) -> bool:
+        with self._lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens: int = 1) -> float:
+        """Seconds until `tokens` are available."""
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self.tokens) / self.rate)
+
+
+def aggregate_rows(records: List[dict], interval_s: float, numeric: List[str], columns: List[str]) -> List[dict]:
+    """
+    Reduce readings to one row per panel per `interval_s` seconds.
+
+    Numeric columns are averaged over the readings that have them (empty if
+    none do), the other columns keep the last value seen; `readings` holds how
+    many readings went into the row.
+    """
+    interval_ns = int(interval_s * 1_000_000_000)
+    groups: Dict[tuple, dict] = {}
+    for record in records:
+        timestamp = record.get("timestamp") or 0
+        bucket = timestamp - timestamp % interval_ns if isinstance(timestamp, int) else timestamp
+        key = (record.get("panel_id"), bucket)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "row": dict(record), "sums": dict.fromkeys(numeric, 0.0), "counts": dict.fromkeys(numeric, 0), "count": 0,
+            }
+        else:
+            group["row"].update(record)
+        group["count"] += 1
+        for name in numeric:
+            value = record.get(name)
+            if isinstance(value, (int, float)):
+                group["sums"][name] += value
+                group["counts"][name] += 1
+
+    rows = []
+    for (_, bucket), group in groups.items():
+        row = group["row"]
+        for name in numeric:
+            count = group["counts"][name]
+            row[name] = round(group["sums"][name] / count, 2) if count else ""
+        row["timestamp"] = bucket
+        row["readings"] = group["count"]
+        rows.append({column: row.get(column, "") for column in columns})
+    return rows
+
+
+def _last_row(response: Optional[dict]) -> int:
+    """The last row an append wrote, from its `updatedRange` (e.g. "Sheet1!A101:T150"); 0 if unknown."""
+    updated = ((response or {}).get("updates") or {}).get("updatedRange", "")
+    digits = re.search(r"(\d+)$", updated)
+    return int(digits.group(1)) if digits else 0
+
+
+class SheetsWriter:
+    """
+    Appends rows to a worksheet while staying inside the Sheets API limits.
+
+    - Every API call first takes a token from the quota bucket; when none is
+      left `QuotaExhausted` is raised with the time to wait, before anything
+      is sent.
+    - Header presence comes from a read of the first row on start; the used
+      rows from the `updatedRange` of each append. Until the first append of
+      a run they are unknown, so a worksheet can go one append past
+      `max_rows_per_sheet` before it is rotated.
+    - Before an append would push the worksheet past `max_rows_per_sheet`, a
+      new worksheet (`<name>-2`, `<name>-3`, ...) is started. The spreadsheet
+      cell total is tracked from metadata so the 10M-cell limit is never hit.
+    """
+
+    def __init__(self, spreadsheet: "gspread.Spreadsheet", sheet_name: str, headers: List[str],
+                 bucket: TokenBucket, max_rows_per_sheet: int = 100_000):
+        self.spreadsheet = spreadsheet
+        self.sheet_name = sheet_name
+        self.headers = headers
+        self.bucket = bucket
+        self.max_rows_per_sheet = max_rows_per_sheet
+        self.worksheet: Optional["gspread.Worksheet"] = None
+        self._rows_used: Optional[int] = None  # Unknown until an append reports it
+        self._spreadsheet_cells = 0
+
+    def open(self):
+        # One metadata request: worksheet names and grid sizes, no cell values
+        worksheets = self.spreadsheet.worksheets()
+        self._spreadsheet_cells = sum(ws.row_count * ws.col_count for ws in worksheets)
+        ours = [ws for ws in worksheets if ws.title == self.sheet_name or ws.title.startswith(f"{self.sheet_name}-")]
+        if ours:
+            self.worksheet = max(ours, key=lambda ws: self._rotation_index(ws.title))
+            # The grid is usually larger than the data and reading a column costs as
+            # much as the sheet is long: only the first row is read, for the headers
+            if not self.worksheet.row_values(1):
+                self._append([self.headers])
+        else:
+            self._add_worksheet(self.sheet_name)
+
+    def _rotation_index(self, title: str) -> int:
+        suffix = title[len(self.sheet_name) + 1:]
+        return int(suffix) if suffix.isdigit() else 1
+
+    def _add_worksheet(self, title: str):
+        self._take()
+        cols = len(self.headers)
+        self.worksheet = self.spreadsheet.add_worksheet(title=title, rows=1, cols=cols)
+        self._spreadsheet_cells += cols
+        self._rows_used = 0
+        self._append([self.headers])
+
+    def _take(self, tokens: int = 1):
+        if not self.bucket.try_take(tokens):
+            raise QuotaExhausted(self.bucket.wait_time(tokens))
+
+    def _append(self, rows: List[list]):
+        self._take()
+        response = self.worksheet.append_rows(rows, value_input_option="RAW")
+        # Upper bound: rows appended inside an existing grid don't add cells
+        self._spreadsheet_cells += len(rows) * len(self.headers)
+        self._rows_used = _last_row(response) or (self._rows_used or 0) + len(rows)
+
+    def append(self, rows: List[list]):
+        """Append rows in a single request, rotating the worksheet first if needed."""
+        if not rows:
+            return
+        # Rotation needs two requests (new worksheet + headers) on top of the append
+        needed = 1 if self._rows_used is None or self._rows_used + len(rows) <= self.max_rows_per_sheet else 3
+        wait = self.bucket.wait_time(needed)
+        if wait > 0:
+            raise QuotaExhausted(wait)
+
+        if self._spreadsheet_cells + (len(rows) + 1) * len(self.headers) > SPREADSHEET_CELL_LIMIT:
+            raise RuntimeError(
+                f"Spreadsheet is close to the {SPREADSHEET_CELL_LIMIT} cell limit; "
+                "point GSHEET_ID at a new spreadsheet"
+            )
+        if needed > 1:
+            next_index = self._rotation_index(self.worksheet.title) + 1
+            print(f"Worksheet {self.worksheet.title} reached {self._rows_used} rows, rotating")
+            self._add_worksheet(f"{self.sheet_name}-{next_index}")
+        self._append(rows)
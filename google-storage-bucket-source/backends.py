@@ -0,0 +1,241 @@
+"""
+Storage backends for the bucket source.
+
+The source only needs three things from storage: listing objects page by
+page from a start offset, seekable reads of an object in ranged chunks, and a
+check that the bucket exists. `GCSBackend` does that against Google Cloud
+Storage; `LocalBackend` reads a local directory through memory maps (for
+benchmarks and development without credentials); `FakeGCSBackend` serves
+in-memory objects like GCS does, counting requests and adding latency, for
+benchmark.py.
+
+Listed objects expose `name`, `size` and `generation`, like GCS blobs.
+
+This module has no dependencies on the rest of the source, so it can be
+copied as is into other apps that read from buckets. The copy in
+google-storage-bucket-source is the original: change it there, then copy it
+over the others (google-storage-buckets-source-k5bn) so they stay identical.
+"""
+
+import io
+import mmap
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import IO, Dict, Iterator, List, Optional
+
+DEFAULT_CHUNK_BYTES = 1024 * 1024
+
+
+@dataclass
+class StoredObject:
+    name: str
+    size: int
+    generation: int
+
+
+class StorageBackend(ABC):
+    @abstractmethod
+    def exists(self) -> bool:
+        """Whether the bucket (or directory) is there."""
+
+    @abstractmethod
+    def list_pages(self, prefix: str = "", start_offset: Optional[str] = None,
+                   page_size: int = 1000) -> Iterator[List]:
+        """Pages of objects under `prefix`, in lexicographic name order, from `start_offset` (inclusive)."""
+
+    @abstractmethod
+    def open(self, obj, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> IO[bytes]:
+        """A seekable byte stream over one object, fetched `chunk_bytes` at a time."""
+
+
+class GCSBackend(StorageBackend):
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def exists(self) -> bool:
+        return self.bucket.exists()
+
+    def list_pages(self, prefix: str = "", start_offset: Optional[str] = None,
+                   page_size: int = 1000) -> Iterator[List]:
+        iterator = self.bucket.list_blobs(prefix=prefix, start_offset=start_offset, page_size=page_size)
+        for page in iterator.pages:
+            yield list(page)
+
+    def open(self, obj, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> IO[bytes]:
+        # Blobs returned by list_blobs carry their generation, so every ranged
+        # request reads the same version even if the object is overwritten.
+        # raw_download: objects stored with Content-Encoding: gzip are fetched
+        # as stored (compressed) rather than decompressed by GCS, saving egress.
+        return obj.open("rb", chunk_size=chunk_bytes, raw_download=True)
+
+
+class _MappedFile(io.BufferedIOBase):
+    """Read-only, seekable stream over a memory-mapped file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self._map.read(None if size is None or size < 0 else size)
+
+    read1 = read
+
+    def readinto(self, buffer) -> int:
+        data = self._map.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._map.seek(offset, whence)
+        return self._map.tell()
+
+    def tell(self) -> int:
+        return self._map.tell()
+
+    def close(self):
+        if not self.closed:
+            self._map.close()
+        super().close()
+
+
+class LocalBackend(StorageBackend):
+    """
+    A local directory as a bucket: object names are paths relative to `root`
+    with "/" separators, and the generation is the file's modification time
+    in nanoseconds.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.root)
+
+    def _names(self, prefix: str) -> List[str]:
+        names = []
+        for directory, _, files in os.walk(self.root):
+            relative = os.path.relpath(directory, self.root)
+            for file in files:
+                name = file if relative == "." else f"{relative}/{file}".replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def list_pages(self, prefix: str = "", start_offset: Optional[str] = None,
+                   page_size: int = 1000) -> Iterator[List[StoredObject]]:
+        names = [n for n in self._names(prefix) if start_offset is None or n >= start_offset]
+        for first in range(0, len(names), page_size):
+            page = []
+            for name in names[first:first + page_size]:
+                stat = os.stat(os.path.join(self.root, name))
+                page.append(StoredObject(name=name, size=stat.st_size, generation=stat.st_mtime_ns))
+            yield page
+
+    def open(self, obj, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> IO[bytes]:
+        path = os.path.join(self.root, obj.name)
+        if os.path.getsize(path) == 0:
+            return io.BytesIO()  # Empty files can't be mapped
+        return _MappedFile(path)
+
+
+class _RangedReader(io.BufferedIOBase):
+    """Serves an in-memory object in `chunk_bytes` ranged requests, like GCS's BlobReader."""
+
+    def __init__(self, backend: "FakeGCSBackend", data: bytes, chunk_bytes: int):
+        self._backend = backend
+        self._data = data
+        self._chunk_bytes = chunk_bytes
+        self._pos = 0
+        self._buffer = b""
+        self._buffer_start = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self._data) - self._pos
+        if self._pos >= len(self._data):
+            return b""
+        offset = self._pos - self._buffer_start
+        if not 0 <= offset < len(self._buffer) or offset + size > len(self._buffer):
+            # One ranged request for at least a chunk
+            self._buffer = self._backend._fetch(self._data, self._pos, max(size, self._chunk_bytes))
+            self._buffer_start, offset = self._pos, 0
+        result = self._buffer[offset:offset + size]
+        self._pos += len(result)
+        return result
+
+    read1 = read
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._data)
+        self._pos = max(0, min(offset, len(self._data)))
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+class FakeGCSBackend(StorageBackend):
+    """
+    In-memory objects served the way GCS serves them: paged listings and
+    ranged reads, each counted as a request, with optional per-request
+    latency. Uploading an existing name bumps its generation.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects: Dict[str, bytes] = {}
+        self.generations: Dict[str, int] = {}
+        self.list_requests = 0
+        self.read_requests = 0
+        self.bytes_served = 0
+        self._lock = threading.Lock()
+
+    def upload(self, name: str, data: bytes):
+        self.objects[name] = data
+        self.generations[name] = self.generations.get(name, 0) + 1
+
+    def exists(self) -> bool:
+        return True
+
+    def list_pages(self, prefix: str = "", start_offset: Optional[str] = None,
+                   page_size: int = 1000) -> Iterator[List[StoredObject]]:
+        names = sorted(n for n in self.objects if n.startswith(prefix) and (start_offset is None or n >= start_offset))
+        for first in range(0, len(names), page_size):
+            with self._lock:
+                self.list_requests += 1
+            if self.latency:
+                time.sleep(self.latency)
+            yield [StoredObject(name=n, size=len(self.objects[n]), generation=self.generations[n])
+                   for n in names[first:first + page_size]]
+
+    def open(self, obj, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> IO[bytes]:
+        if self.generations.get(obj.name) != obj.generation:
+            raise FileNotFoundError(f"{obj.name} generation {obj.generation} no longer exists")
+        return _RangedReader(self, self.objects[obj.name], chunk_bytes)
+
+    def _fetch(self, data: bytes, start: int, size: int) -> bytes:
+        with self._lock:
+            self.read_requests += 1
+            self.bytes_served += min(size, max(0, len(data) - start))
+        if self.latency:
+            time.sleep(self.latency)
+        return data[start:start + size]
@@ -0,0 +1,197 @@
+"""
+Parquet and Arrow IPC readers for bucket objects.
+
+Files are read through a seekable stream, so only the footer and the column
+chunks that are needed are fetched with ranged requests: row groups whose
+statistics rule out the filter are skipped without being downloaded, and
+unselected columns are never read. Rows come out in record batches, converted
+to dicts a whole batch at a time.
+"""
+
+import logging
+import operator
+import re
+from typing import IO, Iterator, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+_COMPUTE_FUNCTIONS = {
+    "==": "equal",
+    "!=": "not_equal",
+    "<": "less",
+    "<=": "less_equal",
+    ">": "greater",
+    ">=": "greater_equal",
+}
+_FILTER_RE = re.compile(r"^\s*([\w.]+)\s*(==|!=|<=|>=|<|>)\s*(.+?)\s*$")
+
+# Filter = (column, operator, value)
+Filter = Tuple[str, str, object]
+
+
+def parse_filters(spec: str) -> List[Filter]:
+    """
+    Parse "power_output>100,location_id==LONDON" into filters. Values are
+    numbers when they parse as such, otherwise strings.
+    """
+    filters = []
+    for part in (p for p in spec.split(",") if p.strip()):
+        match = _FILTER_RE.match(part)
+        if not match:
+            raise ValueError(f"Invalid filter '{part}'. Use e.g. power_output>100,location_id==LONDON")
+        column, op, value = match.groups()
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                pass
+        filters.append((column, op, value))
+    return filters
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Parquet and Arrow files need the pyarrow package")
+
+
+def _may_match(statistics, op: str, value) -> bool:
+    """Whether a row group with these column statistics can hold a matching row."""
+    if statistics is None or not statistics.has_min_max:
+        return True
+    low, high = statistics.min, statistics.max
+    try:
+        if op == "==":
+            return low <= value <= high
+        if op == "!=":
+            return not (low == high == value)
+        if op in ("<", "<="):
+            return _OPERATORS[op](low, value)
+        return _OPERATORS[op](high, value)
+    except TypeError:
+        return True  # Not comparable (e.g. timestamp column vs number): can't rule out
+
+
+def _row_mask(batch: "pa.RecordBatch", filters: List[Filter]):
+    """Vectorised evaluation of all filters (ANDed) over a batch."""
+    mask = None
+    for column, op, value in filters:
+        condition = pc.call_function(_COMPUTE_FUNCTIONS[op], [batch.column(column), value])
+        mask = condition if mask is None else pc.and_kleene(mask, condition)
+    return pc.fill_null(mask, False)
+
+
+def _json_compatible(batch: "pa.RecordBatch") -> "pa.RecordBatch":
+    """Timestamps become integers in their unit (nanoseconds for our exports), other non-JSON types strings."""
+    columns = []
+    changed = False
+    for column in batch.columns:
+        kind = column.type
+        if pa.types.is_timestamp(kind) or pa.types.is_duration(kind):
+            column, changed = column.cast(pa.int64()), True
+        elif pa.types.is_date(kind) or pa.types.is_time(kind) or pa.types.is_decimal(kind):
+            column, changed = column.cast(pa.string()), True
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names) if changed else batch
+
+
+def _rows(batch, first_row: int, start: int, filters: List[Filter],
+          columns: Optional[List[str]]) -> Iterator[Tuple[dict, int]]:
+    """Rows of a batch beginning at file row `first_row`, skipping rows before `start`."""
+    if start > first_row:
+        batch = batch.slice(start - first_row)
+        first_row = start
+    end = first_row + batch.num_rows
+    positions = range(first_row + 1, end + 1)
+    if filters:
+        mask = _row_mask(batch, filters)
+        positions = [p for p, keep in zip(positions, mask.to_pylist()) if keep]
+        batch = batch.filter(mask)
+    if columns:
+        batch = batch.select(columns)
+    yield from zip(_json_compatible(batch).to_pylist(), positions)
+
+
+def iter_parquet_rows(raw: IO[bytes], start: int = 0, columns: Optional[List[str]] = None,
+                      filters: Optional[List[Filter]] = None, batch_rows: int = 10_000) -> Iterator[Tuple[dict, int]]:
+    """
+    Rows of a Parquet file as dicts, each with the number of file rows read
+    so far (the resume position). Row groups entirely before `start` or ruled
+    out by `filters` are skipped without fetching their data.
+    """
+    _require_pyarrow()
+    filters = filters or []
+    parquet = pq.ParquetFile(raw)
+    metadata = parquet.metadata
+    schema = parquet.schema_arrow
+    read_columns = None
+    if columns:
+        # Filter columns must be read even when not projected
+        read_columns = list(dict.fromkeys(columns + [c for c, _, _ in filters]))
+
+    first_row = 0
+    for index in range(metadata.num_row_groups):
+        group = metadata.row_group(index)
+        group_start, first_row = first_row, first_row + group.num_rows
+        if first_row <= start:
+            continue
+        skip = False
+        for column, op, value in filters:
+            column_index = schema.get_field_index(column)
+            if column_index >= 0 and not _may_match(group.column(column_index).statistics, op, value):
+                skip = True
+                break
+        if skip:
+            logger.debug("Skipping row group %d by its statistics", index)
+            continue
+
+        row = group_start
+        for batch in parquet.iter_batches(batch_size=batch_rows, row_groups=[index], columns=read_columns):
+            batch_start, row = row, row + batch.num_rows
+            if row <= start:
+                continue
+            yield from _rows(batch, batch_start, start, filters, columns)
+
+
+def iter_arrow_rows(raw: IO[bytes], start: int = 0, columns: Optional[List[str]] = None,
+                    filters: Optional[List[Filter]] = None) -> Iterator[Tuple[dict, int]]:
+    """
+    Rows of an Arrow IPC file (or stream) as dicts, each with the number of
+    rows read so far. Batches entirely before `start` are not converted.
+    """
+    _require_pyarrow()
+    filters = filters or []
+    source = pa.PythonFile(raw, mode="r")
+    try:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        # Not the file format: read it as an IPC stream
+        raw.seek(0)
+        batches = iter(pa.ipc.open_stream(source))
+
+    first_row = 0
+    for batch in batches:
+        batch_start, first_row = first_row, first_row + batch.num_rows
+        if first_row <= start:
+            continue
+        if columns:
+            batch = batch.select(list(dict.fromkeys(columns + [c for c, _, _ in filters])))
+        yield from _rows(batch, batch_start, start, filters, columns)
@@ -0,0 +1,179 @@
+"""
+Schema-driven CSV conversion.
+
+A schema ("panel_id:string,power_output:float,timestamp:int") is compiled
+once into Arrow parse and convert options, and CSV is then converted a block
+of records at a time with Arrow's CSV parser and vectorised casts. Bad rows
+(wrong number of fields, values that don't convert) are dropped one by one
+and counted; the rest of the block is kept.
+"""
+
+import csv
+import io
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = pc = pacsv = None
+
+logger = logging.getLogger(__name__)
+
+# The columns the source has always read from CSV files
+LEGACY_SCHEMA = (
+    "timestamp:string,hotend_temperature:float,bed_temperature:float,"
+    "ambient_temperature:float,fluctuated_ambient_temperature:float"
+)
+
+_TYPES = {
+    "string": "string",
+    "str": "string",
+    "int": "int64",
+    "integer": "int64",
+    "float": "float64",
+    "double": "float64",
+    "bool": "bool",
+    "boolean": "bool",
+    "timestamp": "timestamp",
+}
+
+
+def parse_schema(spec: str) -> Dict[str, str]:
+    """Parse "name:type,..." (types: string, int, float, bool, timestamp) into {name: type}."""
+    schema = {}
+    for part in (p.strip() for p in spec.split(",")):
+        if not part:
+            continue
+        name, _, kind = part.partition(":")
+        kind = (kind or "string").strip().lower()
+        if kind not in _TYPES:
+            raise ValueError(f"Unknown type '{kind}' for column '{name}'. Use one of: {', '.join(sorted(_TYPES))}")
+        schema[name.strip()] = _TYPES[kind]
+    return schema
+
+
+@dataclass
+class ConversionStats:
+    rows: int = 0
+    bad_rows: int = 0
+    blocks: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)  # Column -> values that didn't convert
+
+
+class CsvBlockParser:
+    """
+    Converts blocks of CSV records (as cut by `streaming.iter_csv_blocks`)
+    into rows following `schema`. With an empty schema every column of the
+    header is kept as a string.
+
+    Timestamps may be ISO 8601 strings or integers and come out as integer
+    nanoseconds.
+    """
+
+    def __init__(self, schema: Dict[str, str], delimiter: str = ","):
+        if pa is None:
+            raise RuntimeError("CSV conversion needs the pyarrow package")
+        self.schema = schema
+        self.stats = ConversionStats()
+        self._invalid_rows = 0
+
+        def skip_invalid(row):
+            self._invalid_rows += 1
+            return "skip"
+
+        self.delimiter = delimiter
+        self._parse_options = pacsv.ParseOptions(delimiter=delimiter, invalid_row_handler=skip_invalid)
+        self._convert_options = None
+        self._header = None
+
+    def _options(self, header: bytes) -> "pacsv.ConvertOptions":
+        if header != self._header:
+            columns = list(self.schema) or next(csv.reader([header.decode("utf-8")], delimiter=self.delimiter))
+            # Everything is read as text and cast afterwards, so one bad value
+            # only costs its own row rather than failing the whole block
+            self._convert_options = pacsv.ConvertOptions(
+                column_types={name: pa.string() for name in columns},
+                include_columns=columns,
+                include_missing_columns=True,
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+            )
+            self._header = header
+        return self._convert_options
+
+    def _cast(self, name: str, column: "pa.Array") -> Tuple["pa.Array", Optional["pa.Array"]]:
+        """Cast a text column to its schema type; also returns the mask of bad values, if any."""
+        kind = self.schema.get(name, "string")
+        if kind == "string":
+            return column, None
+        if kind == "timestamp":
+            # Integer timestamps are already nanoseconds
+            if pc.all(pc.fill_null(pc.utf8_is_digit(column), True)).as_py():
+                return pc.cast(column, pa.int64()), None
+            # Naive ISO strings, or ones with a zone offset (e.g. "Z")
+            targets = [pa.timestamp("ns"), pa.timestamp("ns", tz="UTC")]
+        else:
+            targets = [pa.bool_() if kind == "bool" else getattr(pa, kind)()]
+
+        mask = None
+        for target in targets:
+            try:
+                converted = pc.cast(column, target)
+                break
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                continue
+        else:
+            # Fall back to value by value for this block only
+            values, bad = [], []
+            for value in column.to_pylist():
+                values.append(None if value is None else self._cast_value(value, targets))
+                bad.append(value is not None and values[-1] is None)
+            converted = pa.array(values, type=pa.int64() if kind == "timestamp" else targets[-1])
+            mask = pa.array(bad)
+            self.stats.errors[name] = self.stats.errors.get(name, 0) + sum(bad)
+        if converted.type != pa.int64() and kind == "timestamp":
+            converted = converted.cast(pa.int64())
+        return converted, mask
+
+    @staticmethod
+    def _cast_value(value: str, targets):
+        if targets[-1] == pa.timestamp("ns", tz="UTC") and value.isdigit():
+            return int(value)
+        for target in targets:
+            try:
+                converted = pa.scalar(value).cast(target)
+                return converted.cast(pa.int64()).as_py() if pa.types.is_timestamp(target) else converted.as_py()
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                continue
+        return None
+
+    def parse(self, header: bytes, block: bytes, filename: str = "") -> List[dict]:
+        self._invalid_rows = 0
+        table = pacsv.read_csv(
+            io.BytesIO(header + block),
+            parse_options=self._parse_options,
+            convert_options=self._options(header),
+        )
+        columns, bad = [], None
+        for name, column in zip(table.column_names, table.columns):
+            converted, mask = self._cast(name, column.combine_chunks())
+            columns.append(converted)
+            if mask is not None:
+                bad = mask if bad is None else pc.or_(bad, mask)
+
+        batch = pa.RecordBatch.from_arrays(columns, names=table.column_names)
+        bad_rows = self._invalid_rows
+        if bad is not None:
+            bad_rows += pc.sum(bad).as_py()
+            batch = batch.filter(pc.invert(bad))
+        if bad_rows:
+            logger.warning("Skipped %d bad rows in a block of %s", bad_rows, filename)
+
+        self.stats.blocks += 1
+        self.stats.rows += batch.num_rows
+        self.stats.bad_rows += bad_rows
+        return batch.to_pylist()
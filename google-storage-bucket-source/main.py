@@ -1,24 +1,39 @@
 """
 This file defines a GoogleStorageBucketSource class that connects to a Google Cloud Storage bucket,
-reads files in specified formats (CSV, JSON, or text), processes their content, and produces messages
+reads files in specified formats (CSV, JSON, text, Parquet or Arrow IPC), processes their content, and produces messages
 to a streaming application. It handles authentication, file retrieval, and message serialization.
 """
 
 import os
 import json
-import csv
-import io
 import logging
+import time
+from contextlib import closing
 from google.cloud import storage
 from google.oauth2 import service_account
 from quixstreams import Application
-from quixstreams.sources.base import Source
+from quixstreams.sources.base import StatefulSource
+
+from backends import GCSBackend, LocalBackend, StorageBackend
+from checkpoints import CheckpointStore, FileProgress
+from columnar import COLUMNAR_FORMATS, iter_arrow_rows, iter_parquet_rows, parse_filters
+from csv_schema import LEGACY_SCHEMA, CsvBlockParser, parse_schema
+from prefetch import Prefetcher
+from streaming import (
+    DEFAULT_CHUNK_BYTES,
+    decompress,
+    iter_csv_blocks,
+    iter_json_values,
+    iter_text_lines,
+    strip_compression_suffix,
+    text_stream,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-class GoogleStorageBucketSource(Source):
+class GoogleStorageBucketSource(StatefulSource):
     def __init__(
         self,
         bucket_name: str,
@@ -26,7 +41,25 @@ class GoogleStorageBucketSource(Source):
         credentials_json: str = None,
         folder_path: str = "/",
         file_format: str = "csv",
-        file_compression: str = "none",
+        file_compression: str = "auto",
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+        prefetch_files: int = 4,
+        prefetch_max_bytes: int = 128 * 1024 * 1024,
+        prefetch_ordered: bool = True,
+        poll_interval: float = 0,
+        full_rescan_every: int = 10,
+        list_page_size: int = 1000,
+        checkpoint_every: int = 1000,
+        max_messages: int = 0,
+        columns: list = None,
+        row_filter: str = "",
+        batch_rows: int = 10_000,
+        backend: StorageBackend = None,
+        csv_schema: str = LEGACY_SCHEMA,
+        csv_delimiter: str = ",",
+        key_column: str = None,
+        timestamp_column: str = None,
+        max_file_attempts: int = 5,
         **kwargs
     ):
         super().__init__(**kwargs)
@@ -36,10 +69,37 @@ class GoogleStorageBucketSource(Source):
         self.folder_path = folder_path.strip("/")
         self.file_format = file_format.lower()
         self.file_compression = file_compression.lower()
+        self.chunk_bytes = chunk_bytes
+        self.columns = columns or None
+        self.filters = parse_filters(row_filter)
+        self.batch_rows = batch_rows
+        self.key_column = key_column or None
+        self.timestamp_column = timestamp_column or None
+        self.csv_parser = CsvBlockParser(parse_schema(csv_schema), csv_delimiter) if self.file_format == 'csv' else None
+        if self.file_format in COLUMNAR_FORMATS:
+            # Columnar files are read selectively with ranged requests; prefetching
+            # whole files would download what projection and filtering skip
+            prefetch_files = 0
+        self.prefetcher = Prefetcher(
+            lambda blob, chunk_bytes: self.backend.open(blob, chunk_bytes),
+            depth=prefetch_files,
+            max_bytes=prefetch_max_bytes,
+            ordered=prefetch_ordered,
+            chunk_bytes=chunk_bytes,
+            stream_if=self._resumes_with_seek,
+        )
         self.client = None
-        self.bucket = None
+        self.backend = backend
+        self.checkpoints = CheckpointStore(self)
+        self.poll_interval = poll_interval
+        self.full_rescan_every = full_rescan_every
+        self.list_page_size = list_page_size
+        self.checkpoint_every = checkpoint_every
+        self.max_file_attempts = max_file_attempts
         self.messages_processed = 0
-        self.max_messages = 100
+        self.max_messages = max_messages
+        self._since_checkpoint = 0
+        self._last_listed = None
 
     def _build_client(self):
         """Build a google.cloud.storage.Client with flexible authentication."""
@@ -65,14 +125,15 @@ class GoogleStorageBucketSource(Source):
         raise Exception("No valid credentials found.")
 
     def setup(self):
-        """Setup the Google Cloud Storage client and test connection."""
+        """Setup the Google Cloud Storage client (unless another backend was given) and test connection."""
         try:
-            logger.info("Building Google Cloud Storage client")
-            self.client = self._build_client()
-            self.bucket = self.client.bucket(self.bucket_name)
-            
+            if self.backend is None:
+                logger.info("Building Google Cloud Storage client")
+                self.client = self._build_client()
+                self.backend = GCSBackend(self.client.bucket(self.bucket_name))
+
             # Test connection
-            if self.bucket.exists():
+            if self.backend.exists():
                 logger.info("Successfully connected to Google Cloud Storage bucket: %s", self.bucket_name)
             else:
                 logger.error("Bucket %s does not exist", self.bucket_name)
@@ -90,187 +151,242 @@ class GoogleStorageBucketSource(Source):
     def run(self):
         """Main processing loop to read files from Google Storage bucket."""
         try:
-            prefix = self.folder_path + '/' if self.folder_path else ''
-            logger.info("Listing blobs in bucket with prefix: %s", prefix)
-            blobs = list(self.bucket.list_blobs(prefix=prefix))
-            
-            if not blobs:
-                logger.warning("No files found in folder: %s", self.folder_path)
-                return
-
-            # Filter files by format if specified
-            target_files = []
-            if self.file_format and self.file_format != 'none':
-                target_files = [blob for blob in blobs if blob.name.lower().endswith(f'.{self.file_format}')]
-            else:
-                target_files = blobs
-
-            if not target_files:
-                logger.warning("No files with format '%s' found", self.file_format)
-                return
-
-            logger.info("Found %d files matching format '%s'", len(target_files), self.file_format)
+            polls = 0
+            while self.running:
+                full_rescan = bool(polls and self.full_rescan_every and polls % self.full_rescan_every == 0)
+                self._poll(full_rescan)
+                polls += 1
 
-            for blob in target_files:
-                if not self.running or self.messages_processed >= self.max_messages:
-                    logger.info("Stopping processing as max messages reached or not running")
+                if not self.poll_interval or self._limit_reached():
                     break
-                
-                logger.info("Processing file: %s", blob.name)
-                self._process_file(blob)
+                # Sleep in short steps so a stop request is noticed quickly
+                deadline = time.monotonic() + self.poll_interval
+                while self.running and time.monotonic() < deadline:
+                    time.sleep(min(1.0, deadline - time.monotonic()))
 
             logger.info("Finished processing. Total messages: %d", self.messages_processed)
+            logger.info("Throughput: %s", self.prefetcher.stats.as_dict())
+            if self.csv_parser is not None:
+                logger.info("CSV conversion: %s", self.csv_parser.stats)
 
         except Exception as e:
             logger.error("Error during processing: %s", str(e))
             raise
 
-    def _process_file(self, blob):
-        """Process a single file from the bucket."""
+    def _limit_reached(self):
+        return bool(self.max_messages) and self.messages_processed >= self.max_messages
+
+    def _should_stop(self):
+        return not self.running or self._limit_reached()
+
+    def _poll(self, full_rescan: bool):
+        """One pass over the new or changed files in the folder."""
+        start_offset = None if full_rescan else self.checkpoints.watermark
+        listed = self._list_files(start_offset)
+        failed = []
+
+        def open_failed(blob, error):
+            progress = self.checkpoints.get(blob)
+            self._failed(progress)
+            self._checkpoint(progress)
+            if not progress.done:
+                failed.append(blob.name)
+
+        with closing(self.prefetcher.iterate(listed, on_error=open_failed)) as files:
+            for blob, raw in files:
+                if self._should_stop():
+                    logger.info("Stopping processing as max messages reached or not running")
+                    return
+
+                logger.info("Processing file: %s", blob.name)
+                if not self._process_file(blob, raw):
+                    failed.append(blob.name)
+
+        if self._should_stop():
+            return
+        if failed:
+            # Listings are in name order and start at the watermark inclusively, so the
+            # next poll retries the first file that failed; those after it that were read
+            # are skipped as done
+            watermark = min(failed)
+        elif self._last_listed is not None and self._last_listed > (self.checkpoints.watermark or ""):
+            # Everything listed in this pass has been read: later polls can start here
+            watermark = self._last_listed
+        else:
+            return
+        self.checkpoints.watermark = watermark
+        self.flush()
+
+    def _list_files(self, start_offset=None):
+        """
+        Yield new or changed files page by page, starting at `start_offset`
+        (inclusive, lexicographic) when given, so the full listing is never
+        held in memory.
+        """
+        prefix = self.folder_path + '/' if self.folder_path else ''
+        logger.info("Listing blobs in bucket with prefix: %s, starting at: %s", prefix, start_offset or "<start>")
+        self._last_listed = None
+        listed = matched = 0
+        for page in self.backend.list_pages(prefix, start_offset, self.list_page_size):
+            for blob in page:
+                listed += 1
+                self._last_listed = blob.name
+                # Filter files by format if specified
+                if self.file_format and self.file_format != 'none' and \
+                        not self._matches_format(blob.name):
+                    continue
+                if self.checkpoints.is_done(blob):
+                    continue
+                matched += 1
+                yield blob
+
+        if not matched:
+            logger.info("No new files with format '%s' among %d listed", self.file_format, listed)
+        else:
+            logger.info("Found %d new or changed files among %d listed", matched, listed)
+
+    def _matches_format(self, name: str) -> bool:
+        """Whether the file has the configured format, compressed (e.g. .csv.gz) or not."""
+        if self.file_format == 'arrow':
+            return name.lower().endswith(('.arrow', '.feather', '.ipc'))
+        if self.file_compression != 'none' and self.file_format not in COLUMNAR_FORMATS:
+            name = strip_compression_suffix(name)
+        return name.lower().endswith(f'.{self.file_format}')
+
+    def _checkpoint(self, progress: FileProgress):
+        """Store the file's progress and flush it together with the produced messages."""
+        self.checkpoints.save(progress)
+        self.flush()
+        self._since_checkpoint = 0
+
+    def _resumes_with_seek(self, blob) -> bool:
+        """
+        Whether a file is resumed mid-way where a seek skips what was read: CSV
+        and text files that aren't compressed (JSON resumes by record count,
+        compressed files by decompressed offset). Those are streamed with
+        ranged reads from their offset rather than downloaded whole.
+        """
+        uncompressed = self.file_compression == 'none' or (
+            self.file_compression == 'auto' and strip_compression_suffix(blob.name) == blob.name)
+        return self.file_format != 'json' and uncompressed and self.checkpoints.get(blob).offset > 0
+
+    def _failed(self, progress: FileProgress):
+        """Count a failed attempt at a file, and give up on it after `max_file_attempts` in a row."""
+        progress.failures += 1
+        if self.max_file_attempts and progress.failures >= self.max_file_attempts:
+            logger.error("Giving up on %s after %d failed attempts; it is read again once it changes",
+                         progress.name, progress.failures)
+            progress.done = True
+
+    def _process_file(self, blob, raw) -> bool:
+        """
+        Parse a single file from the bucket, producing messages as records are parsed.
+        Returns whether the file was read to the end.
+        """
+        progress = self.checkpoints.get(blob)
+        rows_before = progress.rows
+        if progress.started:
+            logger.info("Resuming %s at byte %d / record %d", blob.name, progress.offset, progress.rows)
         try:
-            logger.info("Downloading content from blob: %s", blob.name)
-            content = blob.download_as_bytes()
-            
-            if self.file_format == 'csv':
-                logger.info("Processing CSV content from: %s", blob.name)
-                self._process_csv_content(content, blob.name)
-            elif self.file_format == 'json':
-                logger.info("Processing JSON content from: %s", blob.name)
-                self._process_json_content(content, blob.name)
+            logger.info("Reading content from blob: %s (%s bytes)", blob.name, blob.size)
+            for message_value, position in self._records(raw, blob.name, progress):
+                if self._should_stop():
+                    logger.info("Stopping file processing as max messages reached or not running")
+                    break
+
+                self._produce_message(message_value, blob.name)
+                progress.rows += 1
+                if isinstance(position, tuple):
+                    progress.offset, progress.skip = position
+                elif position is not None:
+                    progress.offset, progress.skip = position, 0
+                self._since_checkpoint += 1
+                if self._since_checkpoint >= self.checkpoint_every:
+                    self._checkpoint(progress)
             else:
-                logger.info("Processing text content from: %s", blob.name)
-                self._process_text_content(content, blob.name)
-                
+                progress.done = True
+
+        except UnicodeDecodeError:
+            logger.warning("Binary content detected in %s, skipping", blob.name)
+            progress.done = True
         except Exception as e:
             logger.error("Error processing file %s: %s", blob.name, str(e))
-
-    def _process_csv_content(self, content, filename):
-        """Process CSV content and produce messages."""
-        try:
-            content_str = content.decode('utf-8')
-            logger.debug("CSV content decoded for file: %s", filename)
-            csv_reader = csv.DictReader(io.StringIO(content_str))
-            
-            for row in csv_reader:
-                if not self.running or self.messages_processed >= self.max_messages:
-                    logger.info("Stopping CSV processing as max messages reached or not running")
-                    break
-                
-                # Transform the CSV row based on the schema
-                message_value = {
-                    "timestamp": row.get("timestamp", ""),
-                    "hotend_temperature": float(row.get("hotend_temperature", 0.0)),
-                    "bed_temperature": float(row.get("bed_temperature", 0.0)),
-                    "ambient_temperature": float(row.get("ambient_temperature", 0.0)),
-                    "fluctuated_ambient_temperature": float(row.get("fluctuated_ambient_temperature", 0.0)),
+            if progress.rows > rows_before:
+                progress.failures = 0  # Only attempts that get nowhere count
+            self._failed(progress)
+        finally:
+            raw.close()
+        self._checkpoint(progress)
+        return progress.done
+
+    def _records(self, raw, filename, progress: FileProgress):
+        """
+        Yield (message value, position after it) pairs, resuming from `progress`.
+        Positions are byte offsets (into the decompressed content for compressed
+        files) or, for Parquet and Arrow, rows read.
+        """
+        if self.file_format in COLUMNAR_FORMATS:
+            # Compressed internally; needs the seekable object stream
+            if self.file_format == 'parquet':
+                rows = iter_parquet_rows(raw, progress.offset, self.columns, self.filters, self.batch_rows)
+            else:
+                rows = iter_arrow_rows(raw, progress.offset, self.columns, self.filters)
+            logger.info("Processing %s content from: %s", self.file_format, filename)
+            for row, position in rows:
+                row["source_file"] = filename
+                yield row, position
+            return
+
+        raw = decompress(raw, self.file_compression)
+        if self.file_format == 'csv':
+            logger.info("Processing CSV content from: %s", filename)
+            skip = progress.skip
+            for header, block, block_start, block_end in iter_csv_blocks(raw, progress.offset, self.chunk_bytes):
+                rows = self.csv_parser.parse(header, block, filename)
+                # Within a block, the position is the block start plus the rows already produced
+                for index in range(skip, len(rows)):
+                    rows[index]["source_file"] = filename
+                    yield rows[index], (block_end, 0) if index == len(rows) - 1 else (block_start, index + 1)
+                skip = 0
+
+        elif self.file_format == 'json':
+            logger.info("Processing JSON content from: %s", filename)
+            # JSON is resumed by record count: values before it are parsed but not produced
+            for index, item in enumerate(iter_json_values(text_stream(raw), filename)):
+                if index >= progress.rows:
+                    yield {**item, "source_file": filename}, None
+
+        else:
+            logger.info("Processing text content from: %s", filename)
+            for line, position in iter_text_lines(raw, progress.offset, chunk_bytes=self.chunk_bytes):
+                yield {
+                    "content": line,
                     "source_file": filename
-                }
-                
-                msg = self.serialize(
-                    key=filename,
-                    value=message_value,
-                )
-                
-                self.produce(
-                    key=msg.key,
-                    value=msg.value,
-                )
-                
-                self.messages_processed += 1
-                logger.debug("Produced message %d from %s", self.messages_processed, filename)
-                
-        except Exception as e:
-            logger.error("Error processing CSV content from %s: %s", filename, str(e))
+                }, position
 
-    def _process_json_content(self, content, filename):
-        """Process JSON content and produce messages."""
-        try:
-            content_str = content.decode('utf-8')
-            logger.debug("JSON content decoded for file: %s", filename)
-            
-            try:
-                # Try to parse as JSON array
-                json_data = json.loads(content_str)
-                if isinstance(json_data, list):
-                    logger.info("Processing JSON array from: %s", filename)
-                    for item in json_data:
-                        if not self.running or self.messages_processed >= self.max_messages:
-                            logger.info("Stopping JSON processing as max messages reached or not running")
-                            break
-                        self._produce_json_message(item, filename)
-                else:
-                    logger.info("Processing single JSON object from: %s", filename)
-                    self._produce_json_message(json_data, filename)
-                    
-            except json.JSONDecodeError:
-                logger.info("Attempting to parse as JSONL from: %s", filename)
-                # Try to parse as JSONL (newline-delimited JSON)
-                lines = content_str.strip().split('\n')
-                for line in lines:
-                    if not self.running or self.messages_processed >= self.max_messages:
-                        logger.info("Stopping JSONL processing as max messages reached or not running")
-                        break
-                    if line.strip():
-                        try:
-                            json_obj = json.loads(line)
-                            self._produce_json_message(json_obj, filename)
-                        except json.JSONDecodeError:
-                            logger.warning("Skipping invalid JSON line in %s", filename)
-                            
-        except Exception as e:
-            logger.error("Error processing JSON content from %s: %s", filename, str(e))
+    def _produce_message(self, message_value, filename):
+        key = filename
+        if self.key_column and message_value.get(self.key_column) is not None:
+            key = str(message_value[self.key_column])
+        timestamp = None
+        if self.timestamp_column and isinstance(message_value.get(self.timestamp_column), int):
+            # Nanoseconds in the data, milliseconds in Kafka
+            timestamp = message_value[self.timestamp_column] // 1_000_000
 
-    def _produce_json_message(self, data, filename):
-        """Produce a single JSON message."""
-        message_value = {**data, "source_file": filename}
-        
         msg = self.serialize(
-            key=filename,
+            key=key,
             value=message_value,
+            timestamp_ms=timestamp,
         )
-        
+
         self.produce(
             key=msg.key,
             value=msg.value,
+            timestamp=msg.timestamp,
         )
-        
-        self.messages_processed += 1
-        logger.debug("Produced JSON message %d from %s", self.messages_processed, filename)
 
-    def _process_text_content(self, content, filename):
-        """Process text content and produce messages."""
-        try:
-            content_str = content.decode('utf-8')
-            logger.debug("Text content decoded for file: %s", filename)
-            lines = content_str.split('\n')
-            
-            for line in lines:
-                if not self.running or self.messages_processed >= self.max_messages:
-                    logger.info("Stopping text processing as max messages reached or not running")
-                    break
-                if line.strip():
-                    message_value = {
-                        "content": line.strip(),
-                        "source_file": filename
-                    }
-                    
-                    msg = self.serialize(
-                        key=filename,
-                        value=message_value,
-                    )
-                    
-                    self.produce(
-                        key=msg.key,
-                        value=msg.value,
-                    )
-                    
-                    self.messages_processed += 1
-                    logger.debug("Produced text message %d from %s", self.messages_processed, filename)
-                    
-        except UnicodeDecodeError:
-            logger.warning("Binary content detected in %s, skipping", filename)
-        except Exception as e:
-            logger.error("Error processing text content from %s: %s", filename, str(e))
+        self.messages_processed += 1
+        logger.debug("Produced message %d from %s", self.messages_processed, filename)
 
 
 def main():
@@ -281,7 +397,32 @@ def main():
     project_id = os.getenv("GS_PROJECT_ID", "quix-testing-365012")
     folder_path = os.getenv("GS_FOLDER_PATH", "/")
     file_format = os.getenv("GS_FILE_FORMAT", "csv")
-    file_compression = os.getenv("GS_FILE_COMPRESSION", "none")
+    # none, gzip, zstd, bz2 or auto (detected per file from its first bytes)
+    file_compression = os.getenv("GS_FILE_COMPRESSION", "auto")
+    # Bytes fetched per ranged request; bounds memory use per file
+    chunk_bytes = int(os.getenv("GS_CHUNK_SIZE_KB", "1024")) * 1024
+    # Files downloaded ahead while the current one is parsed, within a byte budget
+    prefetch_files = int(os.getenv("GS_PREFETCH_FILES", "4"))
+    prefetch_max_bytes = int(os.getenv("GS_PREFETCH_MAX_MB", "128")) * 1024 * 1024
+    prefetch_ordered = os.getenv("GS_PREFETCH_ORDERED", "true").lower() == "true"
+    # Seconds between listings for new or changed files (0 = one pass, then exit)
+    poll_interval = float(os.getenv("GS_POLL_INTERVAL", "0"))
+    full_rescan_every = int(os.getenv("GS_FULL_RESCAN_EVERY", "10"))
+    list_page_size = int(os.getenv("GS_LIST_PAGE_SIZE", "1000"))
+    checkpoint_every = int(os.getenv("GS_CHECKPOINT_EVERY", "1000"))
+    max_file_attempts = int(os.getenv("GS_MAX_FILE_ATTEMPTS", "5"))
+    max_messages = int(os.getenv("GS_MAX_MESSAGES", "0"))
+    # Parquet/Arrow: columns to read (empty = all), e.g. "panel_id,power_output"
+    columns = [c.strip() for c in os.getenv("GS_COLUMNS", "").split(",") if c.strip()]
+    # Parquet/Arrow: rows to keep, e.g. "power_output>100,location_id==LONDON"
+    row_filter = os.getenv("GS_ROW_FILTER", "")
+    batch_rows = int(os.getenv("GS_BATCH_ROWS", "10000"))
+    # CSV columns and types, e.g. "panel_id:string,power_output:float,timestamp:timestamp"
+    csv_schema = os.getenv("GS_CSV_SCHEMA", LEGACY_SCHEMA)
+    csv_delimiter = os.getenv("GS_CSV_DELIMITER", ",")
+    # Message key and Kafka timestamp (integer nanoseconds) taken from the records
+    key_column = os.getenv("GS_KEY_COLUMN", "")
+    timestamp_column = os.getenv("GS_TIMESTAMP_COLUMN", "")
     
     # Authentication - optional now
     credentials_json = os.getenv("GS_SECRET_KEY")
@@ -289,6 +430,10 @@ def main():
     # Create output topic
     output_topic = app.topic(os.getenv("output", "output"))
 
+    # A local directory can stand in for the bucket, e.g. for development
+    local_path = os.getenv("GS_LOCAL_PATH")
+    backend = LocalBackend(local_path) if local_path else None
+
     # Create the Google Storage source
     source = GoogleStorageBucketSource(
         name="google-storage-bucket-source",
@@ -298,6 +443,24 @@ def main():
         folder_path=folder_path,
         file_format=file_format,
         file_compression=file_compression,
+        chunk_bytes=chunk_bytes,
+        prefetch_files=prefetch_files,
+        prefetch_max_bytes=prefetch_max_bytes,
+        prefetch_ordered=prefetch_ordered,
+        poll_interval=poll_interval,
+        full_rescan_every=full_rescan_every,
+        list_page_size=list_page_size,
+        checkpoint_every=checkpoint_every,
+        max_file_attempts=max_file_attempts,
+        max_messages=max_messages,
+        columns=columns,
+        row_filter=row_filter,
+        batch_rows=batch_rows,
+        csv_schema=csv_schema,
+        csv_delimiter=csv_delimiter,
+        key_column=key_column,
+        timestamp_column=timestamp_column,
+        backend=backend,
     )
 
     # Setup the source before running
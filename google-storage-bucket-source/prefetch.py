@@ -0,0 +1,175 @@
+"""
+Prefetching of bucket objects.
+
+While the current file is being parsed and produced, a small thread pool
+downloads the next ones so the network is never idle. Prefetched files are
+held in memory, bounded by a byte budget; files larger than the whole budget
+are not prefetched but streamed when their turn comes.
+"""
+
+import io
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import IO, Callable, Iterable, Iterator, Optional, Tuple
+
+from streaming import DEFAULT_CHUNK_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchStats:
+    """Download and parse throughput, measured separately."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.files_downloaded = 0
+        self.bytes_downloaded = 0
+        self.download_seconds = 0.0  # Summed over workers
+        self.files_parsed = 0
+        self.bytes_parsed = 0
+        self.parse_seconds = 0.0  # Consumer time spent on files, including produce
+        self.files_streamed = 0  # Too large to prefetch
+        self.stall_seconds = 0.0  # Consumer time spent waiting for a download
+
+    def add_download(self, size: int, seconds: float):
+        with self._lock:
+            self.files_downloaded += 1
+            self.bytes_downloaded += size
+            self.download_seconds += seconds
+
+    def as_dict(self) -> dict:
+        def mb_per_s(size, seconds):
+            return round(size / seconds / 1_000_000, 2) if seconds else 0.0
+
+        with self._lock:
+            return {
+                "files_downloaded": self.files_downloaded,
+                "files_streamed": self.files_streamed,
+                "files_parsed": self.files_parsed,
+                "download_mb_per_s": mb_per_s(self.bytes_downloaded, self.download_seconds),
+                "download_mb_per_s_total": mb_per_s(self.bytes_downloaded, time.monotonic() - self.started),
+                "parse_mb_per_s": mb_per_s(self.bytes_parsed, self.parse_seconds),
+                "stall_seconds": round(self.stall_seconds, 2),
+            }
+
+
+class Prefetcher:
+    """
+    Iterate over blobs as (blob, byte stream) pairs, downloading up to
+    `depth` files ahead of the consumer.
+
+    - `max_bytes` bounds the bytes of prefetched files not yet fully
+      consumed. Budget is released once the consumer moves on from a file.
+    - `ordered=True` hands files out in listing order; otherwise whichever
+      download finishes first is handed out first, and large (streamed) files
+      are consumed while waiting for downloads.
+    - `depth=0` disables prefetching: every file is streamed in turn.
+    - `stream_if(blob)`: files to stream rather than prefetch, e.g. those
+      resumed mid-way, which a seek lets start at their offset.
+    """
+
+    def __init__(self, open_object: Callable[[object, int], IO[bytes]], depth: int = 4,
+                 max_bytes: int = 128 * 1024 * 1024, ordered: bool = True, chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+                 stream_if: Optional[Callable[[object], bool]] = None):
+        self.open_object = open_object
+        self.stream_if = stream_if
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.ordered = ordered
+        self.chunk_bytes = chunk_bytes
+        self.stats = PrefetchStats()
+
+    def _download(self, blob) -> IO[bytes]:
+        started = time.monotonic()
+        buffer = io.BytesIO()
+        with self.open_object(blob, self.chunk_bytes) as raw:
+            while True:
+                chunk = raw.read(self.chunk_bytes)
+                if not chunk:
+                    break
+                buffer.write(chunk)
+        self.stats.add_download(buffer.tell(), time.monotonic() - started)
+        buffer.seek(0)
+        return buffer
+
+    def iterate(self, blobs: Iterable, on_error: Optional[Callable[[object, Exception], None]] = None
+                ) -> Iterator[Tuple[object, IO[bytes]]]:
+        """Files that fail to open or download are skipped, and passed to `on_error` if given."""
+        blobs = iter(blobs)
+        pending = deque()  # [blob, future or None (streamed), reserved bytes]
+        reserved = 0
+        next_blob = None
+        executor = ThreadPoolExecutor(max_workers=self.depth, thread_name_prefix="gcs-prefetch") if self.depth else None
+
+        def top_up():
+            nonlocal reserved, next_blob
+            while len(pending) < max(self.depth, 1):
+                if next_blob is None:
+                    next_blob = next(blobs, None)
+                    if next_blob is None:
+                        return
+                size = next_blob.size or 0
+                if executor is None or size > self.max_bytes or (self.stream_if is not None and self.stream_if(next_blob)):
+                    pending.append([next_blob, None, 0])
+                elif reserved + size <= self.max_bytes:
+                    pending.append([next_blob, executor.submit(self._download, next_blob), size])
+                    reserved += size
+                else:
+                    return  # Wait for budget to be released
+                next_blob = None
+
+        def take():
+            if self.ordered or len(pending) == 1:
+                return pending.popleft()
+            futures = [entry[1] for entry in pending if entry[1] is not None]
+            done = [f for f in futures if f.done()]
+            if not done:
+                streamed = next((entry for entry in pending if entry[1] is None), None)
+                if streamed is not None:
+                    pending.remove(streamed)
+                    return streamed
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            entry = next(entry for entry in pending if entry[1] in done)
+            pending.remove(entry)
+            return entry
+
+        try:
+            while True:
+                top_up()
+                if not pending:
+                    return
+                blob, future, size = take()
+
+                started = time.monotonic()
+                try:
+                    stream = self.open_object(blob, self.chunk_bytes) if future is None else future.result()
+                except Exception as e:
+                    logger.error("Error opening %s: %s", blob.name, e)
+                    reserved -= size
+                    if on_error is not None:
+                        on_error(blob, e)
+                    continue
+                if future is None:
+                    self.stats.files_streamed += 1
+                else:
+                    self.stats.stall_seconds += time.monotonic() - started
+                    started = time.monotonic()
+
+                try:
+                    yield blob, stream
+                finally:
+                    self.stats.files_parsed += 1
+                    self.stats.bytes_parsed += blob.size or 0
+                    self.stats.parse_seconds += time.monotonic() - started
+                    stream.close()
+                    reserved -= size
+        finally:
+            for _, future, _ in pending:
+                if future is not None:
+                    future.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,266 @@
+"""
+Constant-memory readers for bucket objects.
+
+Objects are read through a file-like stream in fixed-size ranged requests,
+decoded incrementally and parsed record by record, so memory is bounded by
+the chunk size (plus the largest single record) rather than the object size.
+Records are available as soon as the first chunk has arrived.
+"""
+
+import bz2
+import gzip
+import io
+import json
+import logging
+from typing import IO, Iterator, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_BYTES = 1024 * 1024
+
+# Characters read from the text stream per step when scanning JSON
+_JSON_READ_CHARS = 64 * 1024
+
+
+# Leading bytes of each supported compression format
+_MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "zstd": b"\x28\xb5\x2f\xfd",
+    "bz2": b"BZh",
+}
+
+# File name suffixes of compressed files, e.g. data.csv.gz
+COMPRESSION_SUFFIXES = {
+    ".gz": "gzip",
+    ".gzip": "gzip",
+    ".zst": "zstd",
+    ".zstd": "zstd",
+    ".bz2": "bz2",
+}
+
+
+def strip_compression_suffix(name: str) -> str:
+    """"data.csv.gz" -> "data.csv"; names without a compression suffix are unchanged."""
+    for suffix in COMPRESSION_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def detect_compression(raw: IO[bytes]) -> str:
+    """Sniff the compression format from the first bytes of a seekable stream."""
+    if not raw.seekable():
+        return "none"
+    head = raw.read(4)
+    raw.seek(0)
+    for compression, magic in _MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return "none"
+
+
+def decompress(raw: IO[bytes], compression: str = "auto") -> IO[bytes]:
+    """
+    Layer a streaming decompressor over `raw`. Only one chunk of compressed
+    and decompressed data is held at a time.
+
+    `compression` is one of none, gzip, zstd, bz2 or auto (detected from the
+    magic bytes, so uncompressed files can be mixed in).
+    """
+    if compression == "auto":
+        compression = detect_compression(raw)
+    if compression in ("none", ""):
+        return raw
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if compression == "bz2":
+        return bz2.BZ2File(raw, mode="rb")
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd compressed file found but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+    raise ValueError(f"Unsupported compression '{compression}'. Use none, gzip, zstd, bz2 or auto")
+
+
+def text_stream(raw: IO[bytes], encoding: str = "utf-8") -> IO[str]:
+    """Incrementally decode a byte stream; multi-byte characters may span chunks."""
+    return io.TextIOWrapper(raw, encoding=encoding, newline="")
+
+
+def iter_line_bytes(raw: IO[bytes], start: int = 0, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> Iterator[Tuple[bytes, int]]:
+    """
+    Lines of a byte stream positioned at `start`, each with the byte offset
+    just past it, so a reader can resume from there with a seek.
+    """
+    position = start
+    pending = b""
+    while True:
+        chunk = raw.read(chunk_bytes)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            position += len(line) + 1
+            yield line + b"\n", position
+    if pending:
+        yield pending, position + len(pending)
+
+
+def _seek(raw: IO[bytes], offset: int):
+    """Move to `offset`, reading forward on streams that can't seek (e.g. decompressed)."""
+    if raw.seekable():
+        raw.seek(offset)
+        return
+    while offset > 0:
+        skipped = len(raw.read(min(offset, DEFAULT_CHUNK_BYTES)))
+        if not skipped:
+            return
+        offset -= skipped
+
+
+def _record_end(data: bytes, last: bool = True) -> int:
+    """
+    Index just past the last (or first) newline of `data` that ends a CSV
+    record, or 0 if there is none. `data` must start at a record boundary; a
+    newline inside a quoted field follows an odd number of quotes.
+    """
+    if b'"' not in data:
+        return (data.rfind(b"\n") if last else data.find(b"\n")) + 1
+    end = index = quotes = 0
+    for segment in data.split(b"\n")[:-1]:
+        quotes += segment.count(b'"')
+        index += len(segment) + 1
+        if quotes % 2 == 0:
+            end = index
+            if not last:
+                break
+    return end
+
+
+def iter_csv_blocks(raw: IO[bytes], start: int = 0,
+                    chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> Iterator[Tuple[bytes, bytes, int, int]]:
+    """
+    Cut a CSV stream into blocks of whole records of about `chunk_bytes`, for
+    parsing a block at a time. Yields (header line, block, block start, block
+    end) with byte offsets. With `start` > 0 the header is read first and
+    blocks begin at `start`, which must be a record boundary.
+    """
+    header = None
+    position = 0
+    pending = b""
+    if start and raw.seekable():
+        while header is None:
+            chunk = raw.read(chunk_bytes)
+            pending += chunk
+            end = _record_end(pending, last=False)
+            if end or not chunk:
+                header = pending[:end or len(pending)]
+        raw.seek(start)
+        position, pending = start, b""
+
+    while True:
+        chunk = raw.read(chunk_bytes)
+        data = pending + chunk
+        if header is None:
+            end = _record_end(data, last=False) if chunk else len(data)
+            if not end and chunk:
+                pending = data
+                continue
+            header, data = data[:end], data[end:]
+            position += end
+        if position < start:
+            # Can't seek: skip forward to the resume position
+            skipped = min(start - position, len(data))
+            data, position = data[skipped:], position + skipped
+
+        end = _record_end(data) if chunk else len(data)
+        if end:
+            yield header, data[:end], position, position + end
+            position += end
+        if not chunk:
+            return
+        pending = data[end:]
+
+
+def iter_text_lines(raw: IO[bytes], start: int = 0, encoding: str = "utf-8",
+                    chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> Iterator[Tuple[str, int]]:
+    """Non-empty, stripped lines of a text stream, each with the byte offset just past it."""
+    _seek(raw, start)
+    for line, position in iter_line_bytes(raw, start, chunk_bytes):
+        line = line.decode(encoding).strip()
+        if line:
+            yield line, position
+
+
+def iter_json_values(text: IO[str], filename: str = "") -> Iterator:
+    """
+    JSON values from a stream holding either a top-level array (yielding its
+    items), a single document, or newline-delimited JSON.
+
+    Only the value being decoded is held in memory. Invalid JSONL lines are
+    skipped with a warning, as before.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    in_array = None
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        chunk = text.read(_JSON_READ_CHARS)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip(chars: str):
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    while True:
+        skip(" \t\r\n," if in_array else " \t\r\n")
+        if pos >= len(buffer):
+            return
+        if in_array is None:
+            in_array = buffer[pos] == "["
+            if in_array:
+                pos += 1
+                continue
+        if in_array and buffer[pos] == "]":
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            # A number or literal ending exactly at the buffer edge may continue
+            # in the next chunk
+            if end == len(buffer) and fill():
+                continue
+        except json.JSONDecodeError as e:
+            # JSON strings can't hold raw newlines, so an error with a newline
+            # after it is a real one; otherwise the value may just be cut off
+            if buffer.find("\n", e.pos) == -1 and fill():
+                continue
+            if in_array:
+                raise
+            # Unparseable JSONL line: skip to the next one
+            newline = buffer.find("\n", pos)
+            logger.warning("Skipping invalid JSON line in %s", filename)
+            pos = len(buffer) if newline == -1 else newline + 1
+            continue
+        pos = end
+        yield value
@@ -1,6 +1,8 @@
 """
 Secure GCS helper for Quix-injected service-account JSON
-Preview now shows first 100 CSV rows instead of first 500 chars.
+Profiles every object under GS_FOLDER_PATH with small ranged reads and
+writes a manifest (see profiler.py). GS_PREVIEW_ROWS > 0 also previews the
+first CSV. Set GS_LOCAL_PATH to read a local directory instead of the bucket.
 
 pip install google-cloud-storage
 """
@@ -9,13 +11,17 @@ import os
 import json
 import base64
 import csv
+import io
 import logging
-from io import StringIO
+import time
 from typing import Dict, Optional
 
 from google.cloud import storage
 from google.oauth2 import service_account
 
+from backends import GCSBackend, LocalBackend, StorageBackend
+from profiler import BucketProfiler, build_manifest, write_manifest
+
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 LOG = logging.getLogger(__name__)
 
@@ -72,49 +78,99 @@ def _prefix() -> Optional[str]:
 
 
 # ---------------------------------------------------------------------------
-# 4. Smoke-test: list CSVs and preview first 100 rows
+# 4. Storage backend: the bucket, or a local directory standing in for it
 # ---------------------------------------------------------------------------
-def smoke_test(max_rows: int = 100) -> None:
+def storage_backend() -> StorageBackend:
+    local_path = os.getenv("GS_LOCAL_PATH")
+    if local_path:
+        LOG.info("✓ Reading local directory %s", local_path)
+        return LocalBackend(local_path)
+
     bucket_name = os.getenv("GS_BUCKET")
     if not bucket_name:
         raise RuntimeError("GS_BUCKET must be set")
+    return GCSBackend(gcs_client().bucket(bucket_name))
+
 
-    client = gcs_client()
-    bucket = client.bucket(bucket_name)
+# ---------------------------------------------------------------------------
+# 5. Smoke-test: list CSVs and preview first 100 rows
+# ---------------------------------------------------------------------------
+def smoke_test(max_rows: int = 100, chunk_bytes: int = 256 * 1024, backend: Optional[StorageBackend] = None) -> None:
+    backend = backend or storage_backend()
 
     blobs = [
-        b for b in bucket.list_blobs(prefix=_prefix())
+        b for page in backend.list_pages(prefix=_prefix() or "")
+        for b in page
         if b.name.lower().endswith(".csv")
     ]
 
     if not blobs:
-        LOG.warning("No CSV files under gs://%s/%s",
-                    bucket_name, (os.getenv('GS_FOLDER_PATH') or ''))
+        LOG.warning("No CSV files under %s/%s",
+                    os.getenv("GS_LOCAL_PATH") or f"gs://{os.getenv('GS_BUCKET')}",
+                    (os.getenv('GS_FOLDER_PATH') or ''))
         return
 
     blob = blobs[0]
     LOG.info("Found %d CSVs. Previewing %s (%d bytes)",
              len(blobs), blob.name, blob.size)
 
-    # Download entire file as text (UTF-8)
-    data = blob.download_as_text()
+    # Stream the file and stop after `max_rows` rows: only the first chunk(s) are fetched
+    with backend.open(blob, chunk_bytes) as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8", newline=""))
+        headers = next(reader, None)
+        print("—" * 60)
+        print(f"Columns: {headers}")
+        print(f"Showing first {max_rows} rows\n")
 
-    # Parse CSV and print up to `max_rows` rows
-    reader = csv.reader(StringIO(data))
-    headers = next(reader, None)
-    print("—" * 60)
-    print(f"Columns: {headers}")
-    print(f"Showing first {max_rows} rows\n")
+        for idx, row in enumerate(reader, 1):
+            if idx > max_rows:
+                break
+            print(f"{idx:>3}: {row}")
+        print("—" * 60)
 
-    for idx, row in enumerate(reader, 1):
-        if idx > max_rows:
-            break
-        print(f"{idx:>3}: {row}")
+
+# ---------------------------------------------------------------------------
+# 6. Profile: sample every object and write the manifest
+# ---------------------------------------------------------------------------
+def profile_bucket(backend: Optional[StorageBackend] = None) -> dict:
+    backend = backend or storage_backend()
+    profiler = BucketProfiler(
+        backend,
+        head_bytes=int(os.getenv("GS_PROFILE_HEAD_KB", "64")) * 1024,
+        tail_bytes=int(os.getenv("GS_PROFILE_TAIL_KB", "16")) * 1024,
+        workers=int(os.getenv("GS_PROFILE_WORKERS", "32")),
+        file_format=os.getenv("GS_FILE_FORMAT") or "all",
+    )
+
+    started = time.monotonic()
+    profiles = profiler.run(prefix=_prefix() or "", max_objects=int(os.getenv("GS_PROFILE_MAX_OBJECTS", "0")))
+    manifest = build_manifest(
+        profiles,
+        bucket=os.getenv("GS_LOCAL_PATH") or f"gs://{os.getenv('GS_BUCKET')}",
+        prefix=_prefix() or "",
+        seconds=time.monotonic() - started,
+    )
+    write_manifest(manifest, os.getenv("GS_MANIFEST_PATH", "manifest.json"))
+
+    print("—" * 60)
+    print(f"Objects: {manifest['objects']}  bytes: {manifest['bytes']:,}  "
+          f"sampled: {manifest['sampled_bytes']:,}  estimated rows: {manifest['estimated_rows']:,}")
+    for file_format, totals in sorted(manifest["formats"].items()):
+        print(f"  {file_format:>8}: {totals['objects']} objects, {totals['bytes']:,} bytes, "
+              f"~{totals['estimated_rows']:,} rows, {totals['errors']} errors")
+    print("Source settings:")
+    for key, value in manifest["source_settings"].items():
+        print(f"  {key}={value}")
     print("—" * 60)
+    return manifest
 
 
 # ---------------------------------------------------------------------------
-# 5. Entry-point
+# 7. Entry-point
 # ---------------------------------------------------------------------------
 if __name__ == "__main__":
-    smoke_test()
\ No newline at end of file
+    backend = storage_backend()
+    profile_bucket(backend)
+    preview_rows = int(os.getenv("GS_PREVIEW_ROWS", "0"))
+    if preview_rows:
+        smoke_test(max_rows=preview_rows, backend=backend)
\ No newline at end of file
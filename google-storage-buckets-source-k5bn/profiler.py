@@ -0,0 +1,493 @@
+"""
+Bucket profiler.
+
+Profiles every object under a prefix without downloading it: each object
+costs at most two small ranged reads, one of its head and one of its tail.
+From those samples the profiler works out the format, compression, CSV
+delimiter and header, column types, the average record size and so the
+number of records the object holds. Parquet files are profiled from their
+footer alone, which holds the exact row count.
+
+Objects are profiled concurrently by a thread pool while the listing is
+still being paged through, so thousands of objects take seconds rather than
+minutes. The result is a manifest (JSON) with one entry per object plus
+per-format totals and the settings the ingestion source should be run with
+(GS_FILE_FORMAT, GS_FILE_COMPRESSION, GS_CSV_SCHEMA, GS_CSV_DELIMITER).
+"""
+
+import bz2
+import csv
+import io
+import json
+import logging
+import re
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backends import StorageBackend
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow.ipc as paipc
+    import pyarrow.parquet as pq
+except ImportError:
+    paipc = pq = None
+
+LOG = logging.getLogger(__name__)
+
+FORMATS = {
+    ".csv": "csv",
+    ".tsv": "csv",
+    ".json": "json",
+    ".jsonl": "json",
+    ".ndjson": "json",
+    ".txt": "txt",
+    ".log": "txt",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd", ".bz2": "bz2"}
+_MAGIC = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd", b"BZh": "bz2"}
+
+_DELIMITERS = ",;\t|"
+_INT = re.compile(r"^[+-]?\d+$")
+_ISO_TIMESTAMP = re.compile(r"^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}:?\d{2})?$")
+_BOOLS = {"true", "false"}
+# Names of integer columns holding epoch times: timestamp, *_time, *_ts, *_at
+_TIME_NAME = re.compile(r"^(.*_)?(timestamp|time|ts)$|_at$", re.IGNORECASE)
+_INFER_ROWS = 100  # Records from each end of the sample used for type inference
+
+
+@dataclass
+class ObjectProfile:
+    name: str
+    size: int
+    generation: int
+    format: str = "unknown"
+    compression: str = "none"
+    delimiter: Optional[str] = None  # CSV only
+    has_header: Optional[bool] = None  # CSV only
+    columns: Dict[str, str] = field(default_factory=dict)  # Column -> type, in file order
+    avg_record_bytes: Optional[float] = None  # Uncompressed
+    estimated_rows: Optional[int] = None
+    exact: bool = False  # The whole object was sampled, or the count comes from Parquet metadata
+    sampled_bytes: int = 0
+    error: Optional[str] = None
+
+    @property
+    def csv_schema(self) -> str:
+        """The columns in the GS_CSV_SCHEMA format of the ingestion source."""
+        return ",".join(f"{name}:{kind}" for name, kind in self.columns.items())
+
+
+# ---------------------------------------------------------------------------
+# Type inference
+# ---------------------------------------------------------------------------
+def _value_type(value: str) -> Optional[str]:
+    value = value.strip()
+    if not value:
+        return None  # Nulls don't narrow the type
+    if value.lower() in _BOOLS:
+        return "bool"
+    if _INT.match(value):
+        return "int"
+    if _ISO_TIMESTAMP.match(value):
+        return "timestamp"
+    try:
+        float(value)
+        return "float"
+    except ValueError:
+        return "string"
+
+
+def _merge_types(name: str, kinds: Iterable[Optional[str]]) -> str:
+    kinds = {k for k in kinds if k is not None}
+    if not kinds:
+        return "string"
+    if kinds <= {"int"} and _TIME_NAME.search(name):
+        return "timestamp"  # Epoch integers, which the source reads as nanoseconds
+    if len(kinds) == 1:
+        return kinds.pop()
+    if kinds <= {"int", "float"}:
+        return "float"
+    return "string"
+
+
+def _json_type(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "timestamp" if _ISO_TIMESTAMP.match(value) else "string"
+    return "object" if isinstance(value, dict) else "array"
+
+
+# ---------------------------------------------------------------------------
+# Sampling
+# ---------------------------------------------------------------------------
+def _detect_compression(name: str, head: bytes) -> Tuple[str, str]:
+    """(compression, name without the compression suffix)."""
+    lowered = name.lower()
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if lowered.endswith(suffix):
+            return compression, name[:-len(suffix)]
+    for magic, compression in _MAGIC.items():
+        if head.startswith(magic):
+            return compression, name
+    return "none", name
+
+
+def _decompress_head(head: bytes, compression: str) -> bytes:
+    """Decompress as much of a truncated compressed stream as there is."""
+    if compression == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head)
+    if compression == "bz2":
+        return bz2.BZ2Decompressor().decompress(head)
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd objects need the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(head)
+    return head
+
+
+def _detect_format(name: str, sample: bytes) -> str:
+    lowered = name.lower()
+    for suffix, file_format in FORMATS.items():
+        if lowered.endswith(suffix):
+            return file_format
+    if sample.startswith(b"PAR1"):
+        return "parquet"
+    if sample.startswith(b"ARROW1") or sample.startswith(b"\xff\xff\xff\xff"):
+        return "arrow"
+    stripped = sample.lstrip()
+    if stripped[:1] in (b"{", b"["):
+        return "json"
+    return "csv" if any(d in sample[:4096].decode("utf-8", "replace") for d in _DELIMITERS) else "txt"
+
+
+def _complete_lines(data: bytes, at_start: bool, at_end: bool) -> List[bytes]:
+    """Lines of a sample, dropping the partial ones cut by the sample edges."""
+    lines = data.split(b"\n")
+    if not at_start:
+        lines = lines[1:]
+    if not at_end or (lines and lines[-1] == b""):
+        lines = lines[:-1]
+    return [line for line in lines if line.strip()]
+
+
+def _sniff_delimiter(lines: List[str]) -> str:
+    """The candidate that splits every sampled line into the same, largest number of fields."""
+    try:
+        return csv.Sniffer().sniff("\n".join(lines[:20]), delimiters=_DELIMITERS).delimiter
+    except csv.Error:
+        pass
+    best, best_fields = ",", 1
+    for candidate in _DELIMITERS:
+        counts = {line.count(candidate) for line in lines[:20]}
+        if len(counts) == 1 and counts.pop() + 1 > best_fields:
+            best, best_fields = candidate, lines[0].count(candidate) + 1
+    return best
+
+
+class _CountingReader(io.RawIOBase):
+    """Counts the bytes the columnar readers actually pull from an object."""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._raw.read(len(buffer))
+        buffer[:len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._raw.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._raw.tell()
+
+
+class BucketProfiler:
+    """
+    Profiles the objects of a `StorageBackend`.
+
+    - `head_bytes` / `tail_bytes`: size of the ranged reads at each end of an
+      object. Objects no larger than their sum are read in one request and
+      counted exactly.
+    - `workers`: objects profiled concurrently. Listing pages are consumed as
+      profiling progresses, so at most a few pages of objects are held.
+    - `file_format`: only profile objects of this format ("all" for every object).
+    """
+
+    def __init__(self, backend: StorageBackend, head_bytes: int = 64 * 1024, tail_bytes: int = 16 * 1024,
+                 workers: int = 32, file_format: str = "all", page_size: int = 1000):
+        self.backend = backend
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.workers = workers
+        self.file_format = file_format.lower()
+        self.page_size = page_size
+
+    # -- One object -----------------------------------------------------------
+    def _read_samples(self, obj) -> Tuple[bytes, bytes, bool]:
+        """(head, tail, whole object read). The tail is empty when the head covers the object."""
+        size = obj.size or 0
+        with self.backend.open(obj, max(self.head_bytes, 1)) as raw:
+            if size <= self.head_bytes + self.tail_bytes:
+                return raw.read(), b"", True
+            head = raw.read(self.head_bytes)
+            raw.seek(size - self.tail_bytes)
+            return head, raw.read(self.tail_bytes), False
+
+    def profile(self, obj) -> ObjectProfile:
+        profile = ObjectProfile(name=obj.name, size=obj.size or 0, generation=obj.generation or 0)
+        try:
+            self._profile(obj, profile)
+        except Exception as e:
+            profile.error = f"{type(e).__name__}: {e}"
+        return profile
+
+    def _profile(self, obj, profile: ObjectProfile):
+        lowered = obj.name.lower()
+        if lowered.endswith(".parquet") and pq is not None:
+            return self._profile_columnar(obj, profile, "parquet")
+        if lowered.endswith((".arrow", ".feather", ".ipc")) and paipc is not None:
+            return self._profile_columnar(obj, profile, "arrow")
+
+        head, tail, whole = self._read_samples(obj)
+        profile.sampled_bytes = len(head) + len(tail)
+        profile.compression, plain_name = _detect_compression(obj.name, head)
+        if profile.compression != "none":
+            # Only the head can be decompressed; the expansion ratio it shows
+            # is applied to the rest of the object
+            compressed = head
+            head, tail = _decompress_head(head, profile.compression), b""
+            if compressed and not head:
+                # bz2 decodes whole blocks of up to 900KB, so a head sample can
+                # hold none of them: nothing is known about the records
+                profile.format = _detect_format(plain_name, head)
+                profile.error = (f"No {profile.compression} block fits in the {len(compressed)} byte head sample; "
+                                 "raise GS_PROFILE_HEAD_KB to profile it")
+                return
+            expansion = len(head) / len(compressed) if compressed else 1.0
+            uncompressed_size = profile.size * expansion
+        else:
+            uncompressed_size = profile.size
+
+        profile.format = _detect_format(plain_name, head)
+        if profile.format == "csv":
+            if plain_name.lower().endswith(".tsv"):
+                profile.delimiter = "\t"
+            self._profile_csv(profile, head, tail, whole, uncompressed_size)
+        elif profile.format == "json":
+            self._profile_json(profile, head, tail, whole, uncompressed_size)
+        elif profile.format == "txt":
+            lines = _complete_lines(head, True, whole) + _complete_lines(tail, False, True)
+            self._estimate(profile, [len(line) + 1 for line in lines], whole, uncompressed_size)
+        elif profile.format in ("parquet", "arrow"):
+            profile.error = "Parquet/Arrow objects need the pyarrow package to be profiled"
+
+    @staticmethod
+    def _estimate(profile: ObjectProfile, sizes: List[int], whole: bool, data_bytes: float):
+        """
+        Row count from the sampled record sizes (separators included), or exact if
+        the object was read whole. Unknown if no whole record was sampled.
+        """
+        if whole:
+            profile.estimated_rows, profile.exact = len(sizes), True
+        if sizes:
+            profile.avg_record_bytes = round(sum(sizes) / len(sizes), 1)
+        if sizes and not whole:
+            profile.estimated_rows = max(len(sizes), round(data_bytes / profile.avg_record_bytes))
+
+    def _profile_csv(self, profile: ObjectProfile, head: bytes, tail: bytes, whole: bool, data_bytes: float):
+        head_lines = _complete_lines(head, True, whole)
+        if not head_lines:
+            if whole:
+                profile.estimated_rows, profile.exact = 0, True
+            return  # Otherwise no record fits in the sample, so the count is unknown
+        text = [line.decode("utf-8", "replace").rstrip("\r") for line in head_lines]
+        profile.delimiter = profile.delimiter or _sniff_delimiter(text)
+        rows = list(csv.reader(text, delimiter=profile.delimiter))
+        # A header is a first row of names over columns holding something else
+        first = [_value_type(v) for v in rows[0]]
+        below = [_merge_types("", (_value_type(r[i]) for r in rows[1:_INFER_ROWS] if len(r) == len(first)))
+                 for i in range(len(first))]
+        profile.has_header = len(rows) == 1 and all(k == "string" for k in first) or any(
+            k == "string" and b != "string" for k, b in zip(first, below))
+
+        header = rows[0] if profile.has_header else [f"column_{i + 1}" for i in range(len(rows[0]))]
+        records = rows[1:] if profile.has_header else rows
+        tail_rows = list(csv.reader(
+            [line.decode("utf-8", "replace").rstrip("\r") for line in _complete_lines(tail, False, True)],
+            delimiter=profile.delimiter,
+        ))
+        samples = [r for r in records[:_INFER_ROWS] + tail_rows[-_INFER_ROWS:] if len(r) == len(header)]
+        profile.columns = {
+            name: _merge_types(name, (_value_type(r[i]) for r in samples)) for i, name in enumerate(header)
+        }
+
+        record_lines = (head_lines[1:] if profile.has_header else head_lines) + _complete_lines(tail, False, True)
+        header_bytes = len(head_lines[0]) + 1 if profile.has_header else 0
+        self._estimate(profile, [len(line) + 1 for line in record_lines], whole, data_bytes - header_bytes)
+
+    def _profile_json(self, profile: ObjectProfile, head: bytes, tail: bytes, whole: bool, data_bytes: float):
+        text = head.decode("utf-8", "replace")
+        records, sizes = [], []
+        if text.lstrip().startswith("["):
+            # A JSON array: decode elements one at a time until the sample runs out
+            decoder, position = json.JSONDecoder(), text.index("[") + 1
+            while True:
+                while position < len(text) and text[position] in " \t\r\n,":
+                    position += 1
+                if position >= len(text) or text[position] == "]":
+                    break
+                try:
+                    value, end = decoder.raw_decode(text, position)
+                except json.JSONDecodeError:
+                    break
+                records.append(value)
+                sizes.append(len(text[position:end].encode()) + 1)
+                position = end
+        else:
+            head_lines, tail_lines = _complete_lines(head, True, whole), _complete_lines(tail, False, True)
+            sizes = [len(line) + 1 for line in head_lines + tail_lines]
+            for line in head_lines[:_INFER_ROWS] + tail_lines[-_INFER_ROWS:]:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+
+        types: Dict[str, List[Optional[str]]] = {}
+        for record in records[:_INFER_ROWS * 2]:
+            if isinstance(record, dict):
+                for key, value in record.items():
+                    types.setdefault(key, []).append(_json_type(value))
+        profile.columns = {name: _merge_types(name, kinds) for name, kinds in types.items()}
+        self._estimate(profile, sizes, whole, data_bytes)
+
+    def _profile_columnar(self, obj, profile: ObjectProfile, file_format: str):
+        profile.format = file_format
+        with self.backend.open(obj, max(self.tail_bytes, 1)) as raw:
+            # Both readers seek to the footer and read only the metadata. Arrow
+            # files don't record row counts there, so theirs stay unknown.
+            counting = _CountingReader(raw)
+            if file_format == "parquet":
+                metadata = pq.ParquetFile(counting).metadata
+                profile.estimated_rows, profile.exact = metadata.num_rows, True
+                schema = metadata.schema.to_arrow_schema()
+            else:
+                schema = paipc.open_file(counting).schema
+            profile.sampled_bytes = counting.bytes_read
+        profile.columns = {f.name: str(f.type) for f in schema}
+        if profile.estimated_rows:
+            profile.avg_record_bytes = round(profile.size / profile.estimated_rows, 1)
+
+    # -- The bucket -----------------------------------------------------------
+    def _wanted(self, obj) -> bool:
+        if obj.name.endswith("/") or not obj.size:
+            return False
+        if self.file_format in ("", "all"):
+            return True
+        name = obj.name.lower()
+        for suffix in COMPRESSION_SUFFIXES:
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+                break
+        return FORMATS.get("." + name.rsplit(".", 1)[-1]) == self.file_format
+
+    def run(self, prefix: str = "", max_objects: int = 0) -> List[ObjectProfile]:
+        profiles, in_flight, listed = [], set(), 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="profiler") as executor:
+            for page in self.backend.list_pages(prefix=prefix, page_size=self.page_size):
+                for obj in page:
+                    if max_objects and listed >= max_objects:
+                        break
+                    if not self._wanted(obj):
+                        continue
+                    listed += 1
+                    # Keep a bounded queue so huge buckets aren't all in memory at once
+                    if len(in_flight) >= self.workers * 4:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        profiles.extend(f.result() for f in done)
+                    in_flight.add(executor.submit(self.profile, obj))
+                if max_objects and listed >= max_objects:
+                    break
+                LOG.info("Listed %d objects, profiled %d", listed, len(profiles))
+            profiles.extend(f.result() for f in wait(in_flight).done)
+        LOG.info("Profiled %d objects in %.1fs", len(profiles), time.monotonic() - started)
+        return sorted(profiles, key=lambda p: p.name)
+
+
+# ---------------------------------------------------------------------------
+# Manifest
+# ---------------------------------------------------------------------------
+def build_manifest(profiles: List[ObjectProfile], bucket: str, prefix: str, seconds: float = 0.0) -> dict:
+    formats: Dict[str, dict] = {}
+    for p in profiles:
+        totals = formats.setdefault(p.format, {"objects": 0, "bytes": 0, "estimated_rows": 0, "errors": 0})
+        totals["objects"] += 1
+        totals["bytes"] += p.size
+        totals["estimated_rows"] += p.estimated_rows or 0
+        totals["errors"] += p.error is not None
+
+    # Settings for the ingestion source, taken from the most common values
+    ok = [p for p in profiles if p.error is None and p.format != "unknown"]
+    settings = {}
+    if ok:
+        file_format = Counter(p.format for p in ok).most_common(1)[0][0]
+        of_format = [p for p in ok if p.format == file_format]
+        compressions = {p.compression for p in of_format}
+        settings["GS_FILE_FORMAT"] = file_format
+        settings["GS_FILE_COMPRESSION"] = compressions.pop() if len(compressions) == 1 else "auto"
+        if file_format == "csv":
+            settings["GS_CSV_SCHEMA"] = Counter(p.csv_schema for p in of_format).most_common(1)[0][0]
+            settings["GS_CSV_DELIMITER"] = Counter(p.delimiter for p in of_format).most_common(1)[0][0]
+        mismatched = [p.name for p in of_format if file_format == "csv" and p.csv_schema != settings["GS_CSV_SCHEMA"]]
+        if mismatched:
+            LOG.warning("%d CSV objects don't share the most common schema, e.g. %s", len(mismatched), mismatched[0])
+
+    return {
+        "bucket": bucket,
+        "prefix": prefix,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "seconds": round(seconds, 2),
+        "objects": len(profiles),
+        "bytes": sum(p.size for p in profiles),
+        "sampled_bytes": sum(p.sampled_bytes for p in profiles),
+        "estimated_rows": sum(p.estimated_rows or 0 for p in profiles),
+        "formats": formats,
+        "source_settings": settings,
+        "files": [dict(asdict(p), csv_schema=p.csv_schema) if p.format == "csv" else asdict(p) for p in profiles],
+    }
+
+
+def write_manifest(manifest: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    LOG.info("✓ Manifest with %d objects written to %s", manifest["objects"], path)
@@ -0,0 +1,76 @@
+"""
+Per-location aggregate frames for MQTT subscribers.
+
+Instead of forwarding every raw per-panel reading, readings are reduced over
+tumbling windows into one compact frame per location per window. The
+reducer state is plain JSON so it can live in the Quix Streams state store.
+"""
+
+from typing import List, Tuple
+
+# Numeric fields summarised in each frame
+_FIELDS = ("power_output", "temperature", "irradiance", "voltage", "current")
+
+
+def parse_windows(spec: str) -> List[Tuple[str, int]]:
+    """Parse "1s,10s,1m" into [("1s", 1000), ("10s", 10000), ("1m", 60000)]."""
+    units = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000}
+    windows = []
+    for label in (part.strip() for part in spec.split(",")):
+        if not label:
+            continue
+        unit = next((u for u in ("ms", "s", "m", "h") if label.endswith(u)), None)
+        number = label[:-len(unit)] if unit else ""
+        if not unit or not number.isdigit() or int(number) <= 0:
+            raise ValueError(f"Invalid window '{label}'. Use e.g. 500ms, 1s, 10s, 1m")
+        windows.append((label, int(number) * units[unit]))
+    if not windows:
+        raise ValueError("At least one aggregate window is required")
+    return windows
+
+
+def init_frame(reading: dict) -> dict:
+    frame = {"readings": 0, "inverter_status": {}}
+    for field in _FIELDS:
+        frame[field] = [0.0, None, None, 0]  # sum, min, max, count
+    return reduce_frame(frame, reading)
+
+
+def reduce_frame(frame: dict, reading: dict) -> dict:
+    frame["readings"] += 1
+    for field in _FIELDS:
+        value = reading.get(field)
+        if value is None:
+            continue
+        stats = frame[field]
+        stats[0] += value
+        stats[1] = value if stats[1] is None else min(stats[1], value)
+        stats[2] = value if stats[2] is None else max(stats[2], value)
+        stats[3] += 1
+    status = reading.get("inverter_status") or "UNKNOWN"
+    frame["inverter_status"][status] = frame["inverter_status"].get(status, 0) + 1
+    return frame
+
+
+def build_frame(window: dict, location_id: str, label: str) -> dict:
+    """Turn a closed window ({"start", "end", "value"}) into the published frame."""
+    state = window["value"]
+    readings = state["readings"]
+    frame = {
+        "location_id": location_id,
+        "window": label,
+        "start": window["start"],
+        "end": window["end"],
+        "readings": readings,
+        "inverter_status": state["inverter_status"],
+    }
+    for field in _FIELDS:
+        # Readings without the field don't count towards its average
+        total, low, high, count = state[field]
+        frame[field] = {
+            "sum": round(total, 1),
+            "avg": round(total / count, 2) if count else None,
+            "min": low,
+            "max": high,
+        }
+    return frame
@@ -1,8 +1,14 @@
-from quixstreams import Application, context
+from quixstreams import Application
+from quixstreams.sinks import BatchingSink, SinkBatch, SinkBackpressureError
 import paho.mqtt.client as paho
 from paho import mqtt
 import json
 import os
+import time
+
+from aggregates import build_frame, init_frame, parse_windows, reduce_frame
+from publisher import InflightPublisher, PublishTimeout, TopicAliases
+from tracing import LatencyTracing, start_metrics_server
 
 # Load environment variables (useful when working locally)
 from dotenv import load_dotenv
@@ -54,6 +60,8 @@ def on_connect_cb(client: paho.Client, userdata: any, connect_flags: paho.Connec
                   reason_code: paho.ReasonCode, properties: paho.Properties):
     if reason_code == 0:
         print("CONNECTED!") # required for Quix to know this has connected
+        # Topic aliases are per connection; the broker tells us how many it allows
+        topic_aliases.reset(getattr(properties, "TopicAliasMaximum", 0) if properties else 0)
     else:
         print(f"ERROR! - ({reason_code.value}). {reason_code.getName()}")
 
@@ -65,6 +73,7 @@ mqtt_client.on_connect = on_connect_cb
 mqtt_client.on_disconnect = on_disconnect_cb
 
 mqtt_topic_root = os.environ["mqtt_topic_root"]
+topic_aliases = TopicAliases(int(os.getenv("mqtt_topic_alias_max", "0")))
 
 # connect to MQTT Cloud on port 8883 (default for MQTT)
 mqtt_client.connect(os.environ["mqtt_server"], int(mqtt_port))
@@ -72,23 +81,121 @@ mqtt_client.connect(os.environ["mqtt_server"], int(mqtt_port))
 # Hook up to termination signal (for docker image) and CTRL-C
 print("Listening to streams. Press CTRL-C to exit.")
 
-sdf = app.dataframe(input_topic)
+class MqttSink(BatchingSink):
+    """
+    Publishes each message to `mqtt_topic_root/<message key><topic_suffix>`, or
+    to `mqtt_topic_root/<value[topic_field]><topic_suffix>` when `topic_field`
+    is set.
+
+    Messages go through an InflightPublisher, which caps the number of
+    unacknowledged messages at `mqtt_inflight_window` and blocks when it is
+    full. A batch is only reported as written once the broker has acknowledged
+    every message in it, so Kafka offsets are never committed ahead of PUBACKs.
+    """
+    def __init__(self, publisher: InflightPublisher, topic_root: str, ack_timeout: float, metrics_interval: float,
+                 topic_suffix: str = "", qos: int = 1, retain: bool = False, aliases: TopicAliases = None,
+                 topic_field: str = None):
+        super().__init__()
+        self._publisher = publisher
+        self._topic_root = topic_root
+        self._topic_suffix = topic_suffix
+        self._topic_field = topic_field
+        self._qos = qos
+        self._retain = retain
+        self._aliases = aliases
+        self._ack_timeout = ack_timeout
+        self._metrics_interval = metrics_interval
+        self._next_metrics = time.monotonic() + metrics_interval
+
+    def write(self, batch: SinkBatch):
+        try:
+            for item in batch:
+                if self._topic_field:
+                    key = str(item.value[self._topic_field])
+                else:
+                    key = item.key.decode('utf-8') if isinstance(item.key, bytes) else str(item.key)
+                self._publisher.publish(
+                    self._topic_root + "/" + key + self._topic_suffix,
+                    payload=json.dumps(item.value, separators=(",", ":")),
+                    timeout=self._ack_timeout,
+                    qos=self._qos,
+                    retain=self._retain,
+                    aliases=self._aliases,
+                )
+            # Only let the offsets be committed once the broker has everything
+            self._publisher.flush(timeout=self._ack_timeout)
+        except PublishTimeout as e:
+            print(f"MQTT broker is not keeping up, pausing: {e}")
+            raise SinkBackpressureError(retry_after=self._ack_timeout)
+        finally:
+            if self._metrics_interval and time.monotonic() >= self._next_metrics:
+                self._next_metrics = time.monotonic() + self._metrics_interval
+                print(f"MQTT publish metrics: {self._publisher.metrics()}")
+
+
+class TracedMqttSink(LatencyTracing, MqttSink):
+    """MqttSink for the raw readings, with the latency metrics of tracing.py."""
+    trace_name = "mqtt"
+
+
+publisher = InflightPublisher(mqtt_client, window=int(os.getenv("mqtt_inflight_window", "1000")))
+ack_timeout = float(os.getenv("mqtt_ack_timeout", "30"))
+metrics_interval = float(os.getenv("mqtt_metrics_interval", "60"))
+
+# raw: forward every reading; aggregate: one frame per location per window; both
+publish_mode = os.getenv("mqtt_publish_mode", "raw").lower()
+if publish_mode not in ("raw", "aggregate", "both"):
+    raise ValueError('mqtt_publish_mode must be one of "raw", "aggregate", "both"')
+
+# The generator's KEY_STRATEGY; with any other key than the location, the
+# readings of a location are spread over partitions
+keyed_by_location = os.getenv("KEY_STRATEGY", "location").lower() == "location"
 
-def publish_to_mqtt(data, key, timestamp, headers):
-    json_data = json.dumps(data)
-    message_key_string = key.decode('utf-8')  # Convert to string using utf-8 encoding
-    # publish to MQTT
-    mqtt_client.publish(mqtt_topic_root + "/" + message_key_string, payload = json_data, qos = 1)
+sdf = app.dataframe(input_topic)
 
-sdf = sdf.apply(publish_to_mqtt, metadata=True)
+if publish_mode in ("aggregate", "both"):
+    # Windows are per key, so readings must be keyed by location_id; regroup them if they are not
+    readings = sdf if keyed_by_location else sdf.group_by("location_id")
+    for label, duration_ms in parse_windows(os.getenv("mqtt_aggregate_windows", "1s,10s")):
+        frames = (
+            readings.tumbling_window(duration_ms=duration_ms)
+            .reduce(reducer=reduce_frame, initializer=init_frame)
+            .final()
+        )
+        frames = frames.apply(
+            lambda window, key, timestamp, headers, label=label: build_frame(
+                window, key.decode("utf-8") if isinstance(key, bytes) else str(key), label
+            ),
+            metadata=True,
+        )
+        frames.sink(MqttSink(
+            publisher,
+            topic_root=mqtt_topic_root,
+            topic_suffix=f"/{label}",
+            qos=int(os.getenv("mqtt_aggregate_qos", "1")),
+            retain=os.getenv("mqtt_aggregate_retain", "true").lower() == "true",
+            aliases=topic_aliases,
+            ack_timeout=ack_timeout,
+            metrics_interval=metrics_interval,
+        ))
+
+if publish_mode in ("raw", "both"):
+    sdf.sink(TracedMqttSink(
+        publisher,
+        topic_root=mqtt_topic_root,
+        topic_field=None if keyed_by_location else "location_id",
+        ack_timeout=ack_timeout,
+        metrics_interval=metrics_interval,
+    ))
 
 
 # start the background process to handle MQTT messages
 mqtt_client.loop_start()
 
 print("Starting application")
+start_metrics_server(int(os.getenv("TRACE_METRICS_PORT", "9464")), window_s=float(os.getenv("TRACE_WINDOW_S", "60")))
 # run the data processing pipeline
-app.run(sdf)
+app.run()
 
 # stop handling MQTT messages
 mqtt_client.loop_stop()
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as paho
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+
+class PublishTimeout(Exception):
+    """Raised when messages are not acknowledged by the broker in time."""
+
+
+class TopicAliases:
+    """
+    MQTT 5 topic aliases for one connection: the first message to a topic
+    carries the topic and its alias, later ones only the 2-byte alias.
+
+    Aliases are only valid for the connection they were set up on, so `reset`
+    must be called on every (re)connect with the broker's TopicAliasMaximum.
+    """
+
+    def __init__(self, maximum: int):
+        self.maximum = maximum
+        self._limit = 0
+        self._aliases = {}
+        self._lock = threading.Lock()
+
+    def reset(self, broker_maximum: int):
+        with self._lock:
+            self._limit = min(self.maximum, broker_maximum)
+            self._aliases = {}
+
+    def resolve(self, topic: str):
+        """Return the (topic, properties) to publish with."""
+        with self._lock:
+            alias = self._aliases.get(topic)
+            if alias is None:
+                if len(self._aliases) >= self._limit:
+                    return topic, None
+                alias = self._aliases[topic] = len(self._aliases) + 1
+                send_topic = topic
+            else:
+                send_topic = ""
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.TopicAlias = alias
+        return send_topic, properties
+
+
+class InflightPublisher:
+    """
+    Publishes QoS1 messages through a paho client while keeping track of
+    every message until its PUBACK arrives.
+
+    At most `window` messages are unacknowledged at any time; `publish` blocks
+    while the window is full, so paho's internal queue can't grow without
+    bound. `flush` waits until everything published so far is acknowledged,
+    which lets a sink commit Kafka offsets only after the broker has the data.
+    """
+
+    def __init__(self, client: paho.Client, window: int = 1000, qos: int = 1, latency_samples: int = 10000):
+        self.client = client
+        self.window = window
+        self.qos = qos
+        self._cond = threading.Condition()
+        self._inflight = {}  # mid -> publish time
+        self._acked_early = set()  # PUBACKs that arrived before publish() returned
+        self._latencies = deque(maxlen=latency_samples)
+        self.published = 0
+        self.acked = 0
+        self.max_inflight_seen = 0
+
+        # Let paho send as many messages as our window allows, and no more.
+        client.max_inflight_messages_set(window)
+        client.on_publish = self._on_publish
+
+    def _on_publish(self, client, userdata, mid, reason_code=None, properties=None):
+        now = time.monotonic()
+        with self._cond:
+            sent_at = self._inflight.pop(mid, None)
+            if sent_at is None:
+                self._acked_early.add(mid)
+                return
+            self._latencies.append(now - sent_at)
+            self.acked += 1
+            self._cond.notify_all()
+
+    def publish(self, topic: str, payload, timeout: float = 30.0, qos: int = None, retain: bool = False,
+                aliases: TopicAliases = None):
+        """Publish one message, waiting first if the in-flight window is full."""
+        qos = self.qos if qos is None else qos
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._inflight) >= self.window:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PublishTimeout(
+                        f"In-flight window of {self.window} messages still full after {timeout}s"
+                    )
+                self._cond.wait(remaining)
+
+        properties = None
+        if aliases is not None and qos == 0 and self.client.is_connected():
+            # QoS 0 only: paho re-sends unacknowledged QoS 1 messages unchanged
+            # after a reconnect, when their aliases are no longer valid.
+            topic, properties = aliases.resolve(topic)
+
+        sent_at = time.monotonic()
+        info = self.client.publish(topic, payload=payload, qos=qos, retain=retain, properties=properties)
+        if qos == 0 and info.rc == paho.MQTT_ERR_NO_CONN:
+            return  # QoS 0 messages are not queued while disconnected
+        # NO_CONN still queues QoS>0 messages; paho sends them on reconnect.
+        if info.rc not in (paho.MQTT_ERR_SUCCESS, paho.MQTT_ERR_NO_CONN):
+            raise RuntimeError(f"Failed to publish to {topic}: {paho.error_string(info.rc)}")
+
+        with self._cond:
+            self.published += 1
+            if info.mid in self._acked_early:
+                self._acked_early.discard(info.mid)
+                self._latencies.append(time.monotonic() - sent_at)
+                self.acked += 1
+                return
+            self._inflight[info.mid] = sent_at
+            self.max_inflight_seen = max(self.max_inflight_seen, len(self._inflight))
+
+    def flush(self, timeout: float = 30.0):
+        """Wait until every published message is acknowledged."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PublishTimeout(
+                        f"{len(self._inflight)} messages not acknowledged after {timeout}s"
+                    )
+                self._cond.wait(remaining)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            latencies = sorted(self._latencies)
+            inflight = len(self._inflight)
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 1) if latencies else 0.0
+
+        return {
+            "inflight": inflight,
+            "inflight_max": self.max_inflight_seen,
+            "window": self.window,
+            "published": self.published,
+            "acked": self.acked,
+            "puback_latency_p50_ms": pct(50),
+            "puback_latency_p99_ms": pct(99),
+        }
@@ -0,0 +1,214 @@
+"""
+Streaming detection of underperforming solar panels.
+
+Each daylight reading is reduced to a performance ratio, power over
+irradiance, and folded into fixed-size per-panel statistics packed with
+`struct`, so every reading costs a few state lookups and constant memory,
+however long the service runs:
+
+- An EWMA of the ratio smooths out the generator's per-reading noise.
+- The ratio is compared to the location's fleet: the median of the panels'
+  EWMAs over the previous tick, estimated with a P² sketch (five markers)
+  while the tick's readings stream past. Weather and time of day affect every
+  panel of a location alike, so a panel's ratio relative to that median only
+  moves when the panel itself does.
+- Welford's mean and variance of that relative performance over a warm-up
+  period give each panel its baseline and its noise level.
+
+Once warmed up, a panel is expected to lose at most its `degradation_rate`
+per year from its baseline. It is reported UNDERPERFORMING when its relative
+performance falls more than `tolerance` below that, and beyond `z` standard
+deviations of its own noise, and RECOVERED once it is back within half of
+`tolerance`. Only these transitions are emitted.
+"""
+
+import math
+import struct
+from typing import List, Optional
+
+from quixstreams.state import State
+
+_YEAR_S = 365 * 24 * 3600
+_TICK_KEY = "__tick__"
+
+# count, mean, m2, ewma, baseline, baseline variance, baseline time (ns), alerting
+_PANEL = struct.Struct("<qdddddqB")
+# tick, previous tick's median (NaN when unknown), then the P² sketch of the current tick
+_TICK = struct.Struct("<qdq5d5d")
+
+
+class P2Median:
+    """
+    Streaming median estimate with the P² algorithm (Jain & Chlamtac, 1985):
+    five markers whose heights are adjusted as values arrive, so each value
+    costs O(1) and memory does not grow with their number.
+    """
+
+    __slots__ = ("count", "heights", "positions")
+
+    _INCREMENTS = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+    def __init__(self, count: int = 0, heights: Optional[List[float]] = None,
+                 positions: Optional[List[float]] = None):
+        self.count = count
+        self.heights = list(heights) if heights is not None else [0.0] * 5
+        self.positions = list(positions) if positions is not None else [1.0, 2.0, 3.0, 4.0, 5.0]
+
+    def add(self, value: float):
+        q, n = self.heights, self.positions
+        if self.count < 5:
+            q[self.count] = value
+            self.count += 1
+            if self.count == 5:
+                q.sort()
+            return
+
+        self.count += 1
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = next(i for i in range(4) if value < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+
+        for i in (1, 2, 3):
+            desired = 1 + (self.count - 1) * self._INCREMENTS[i]
+            d = desired - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def median(self) -> Optional[float]:
+        if self.count >= 5:
+            return self.heights[2]
+        if not self.count:
+            return None
+        values = sorted(self.heights[:self.count])
+        middle = self.count // 2
+        return values[middle] if self.count % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+class AnomalyDetector:
+    """
+    Stateful step returning an alert dict, or None, for each reading.
+
+    Use with `sdf.apply(detector, stateful=True)` on readings keyed by
+    location: the state holds one packed record per panel and the location's
+    tick sketch.
+
+    - `min_irradiance`: readings below it (night, dawn, dusk) are ignored.
+    - `ewma_alpha`: weight of each reading in the panel's EWMA.
+    - `warmup`: daylight readings that make up a panel's baseline.
+    - `tick_ms`: length of a fleet tick; the generator reports every second.
+    - `min_panels`: ticks with fewer panels do not replace the fleet median.
+    - `degradation_rate`: yearly decline expected of panels whose readings
+      carry no `degradation_rate` of their own.
+    """
+
+    def __init__(self, min_irradiance: float = 100.0, ewma_alpha: float = 0.02, warmup: int = 600,
+                 tolerance: float = 0.05, z: float = 3.0, tick_ms: int = 1000, min_panels: int = 5,
+                 degradation_rate: float = 0.02, panel_key: str = "panel_id", location_key: str = "location_id",
+                 power_key: str = "power_output", irradiance_key: str = "irradiance", time_key: str = "timestamp"):
+        self.min_irradiance = min_irradiance
+        self.ewma_alpha = ewma_alpha
+        self.warmup = warmup
+        self.tolerance = tolerance
+        self.z = z
+        self.tick_ms = tick_ms
+        self.min_panels = min_panels
+        self.degradation_rate = degradation_rate
+        self.panel_key = panel_key
+        self.location_key = location_key
+        self.power_key = power_key
+        self.irradiance_key = irradiance_key
+        self.time_key = time_key
+        # The EWMA's own standard deviation relative to the readings'
+        self._ewma_noise = math.sqrt(ewma_alpha / (2 - ewma_alpha))
+
+    def _fleet_median(self, state: State, tick: int, ratio: float) -> float:
+        """Add the panel's ratio to this tick's sketch; returns the previous tick's median."""
+        packed = state.get_bytes(_TICK_KEY)
+        if packed is None:
+            current, median, sketch = tick, math.nan, P2Median()
+        else:
+            current, median, count, *markers = _TICK.unpack(packed)
+            sketch = P2Median(count, markers[:5], markers[5:])
+        if tick > current:
+            if sketch.count >= self.min_panels:
+                median = sketch.median()
+            current, sketch = tick, P2Median()
+        if tick == current:
+            sketch.add(ratio)  # Readings of past ticks arriving late are left out
+        state.set_bytes(_TICK_KEY, _TICK.pack(current, median, sketch.count, *sketch.heights, *sketch.positions))
+        return median
+
+    def __call__(self, reading: dict, state: State) -> Optional[dict]:
+        irradiance = float(reading.get(self.irradiance_key) or 0.0)
+        if irradiance < self.min_irradiance:
+            return None
+        panel_id = str(reading.get(self.panel_key))
+        time_ns = int(reading[self.time_key])
+        ratio = float(reading.get(self.power_key) or 0.0) / irradiance
+
+        packed = state.get_bytes(panel_id)
+        if packed is None:
+            count, mean, m2, ewma, baseline, baseline_var, baseline_ns, alerting = 0, 0.0, 0.0, ratio, 0.0, 0.0, 0, 0
+        else:
+            count, mean, m2, ewma, baseline, baseline_var, baseline_ns, alerting = _PANEL.unpack(packed)
+            ewma += self.ewma_alpha * (ratio - ewma)
+
+        fleet = self._fleet_median(state, time_ns // 1_000_000 // self.tick_ms, ewma)
+        alert = None
+        if not math.isnan(fleet) and fleet > 0:
+            relative = ewma / fleet
+            # Welford
+            count += 1
+            delta = relative - mean
+            mean += delta / count
+            m2 += delta * (relative - mean)
+
+            if count == self.warmup:
+                baseline, baseline_var, baseline_ns = mean, m2 / (count - 1), time_ns
+            elif count > self.warmup:
+                rate = reading.get("degradation_rate", self.degradation_rate)
+                years = (time_ns - baseline_ns) / 1_000_000_000 / _YEAR_S
+                expected = baseline * (1 - rate * years)
+                shortfall = 1 - relative / expected
+                noise = self.z * math.sqrt(baseline_var) * self._ewma_noise
+                if not alerting and shortfall > self.tolerance and expected - relative > noise:
+                    alerting = 1
+                    alert = "UNDERPERFORMING"
+                elif alerting and shortfall < self.tolerance / 2:
+                    alerting = 0
+                    alert = "RECOVERED"
+                if alert:
+                    alert = {
+                        "alert": alert,
+                        self.panel_key: panel_id,
+                        self.location_key: reading.get(self.location_key),
+                        "timestamp": time_ns,
+                        "relative_performance": round(relative, 4),
+                        "expected_performance": round(expected, 4),
+                        "shortfall": round(shortfall, 4),
+                        "baseline": round(baseline, 4),
+                        "long_run_mean": round(mean, 4),
+                        "long_run_std": round(math.sqrt(m2 / (count - 1)), 4),
+                        "degradation_rate": rate,
+                        "fleet_median_ratio": round(fleet, 5),
+                        "power_output": reading.get(self.power_key),
+                        "irradiance": irradiance,
+                    }
+
+        state.set_bytes(panel_id, _PANEL.pack(count, mean, m2, ewma, baseline, baseline_var, baseline_ns, alerting))
+        return alert
@@ -0,0 +1,59 @@
+# import the Quix Streams modules for interacting with Kafka.
+# For general info, see https://quix.io/docs/quix-streams/introduction.html
+from quixstreams import Application
+
+import os
+
+from anomaly import AnomalyDetector
+
+# for local dev, load env vars from a .env file
+# from dotenv import load_dotenv
+# load_dotenv()
+
+
+def main():
+    """
+    Flags solar panels that underperform their location's fleet by more than
+    their expected degradation, and writes an alert when a panel starts and
+    stops doing so.
+
+    Each partition must see whole fleets, so that the per-panel state lives
+    next to the fleet it is compared with. Readings keyed by location_id, the
+    generator's default KEY_STRATEGY, need nothing more; with any other key
+    they are regrouped by location_id first. See anomaly.py for the
+    statistics.
+    """
+
+    # Setup necessary objects
+    app = Application(
+        consumer_group=os.environ.get("CONSUMER_GROUP_NAME", "panel-anomaly-detection"),
+        auto_create_topics=True,
+        auto_offset_reset="earliest"
+    )
+    input_topic = app.topic(name=os.environ["input"])
+    output_topic = app.topic(name=os.environ["output"])
+    sdf = app.dataframe(topic=input_topic)
+    if os.environ.get("KEY_STRATEGY", "location").lower() != "location":
+        sdf = sdf.group_by("location_id")
+
+    detector = AnomalyDetector(
+        min_irradiance=float(os.environ.get("ANOMALY_MIN_IRRADIANCE", "100")),
+        ewma_alpha=float(os.environ.get("ANOMALY_EWMA_ALPHA", "0.02")),
+        warmup=int(os.environ.get("ANOMALY_WARMUP_READINGS", "600")),
+        tolerance=float(os.environ.get("ANOMALY_TOLERANCE", "0.05")),
+        z=float(os.environ.get("ANOMALY_Z", "3")),
+        degradation_rate=float(os.environ.get("ANOMALY_DEGRADATION_RATE", "0.02")),
+    )
+    sdf = sdf.apply(detector, stateful=True).filter(lambda alert: alert is not None)
+    sdf = sdf.print()
+
+    # Finish off by writing to the final result to the output topic
+    sdf.to_topic(output_topic)
+
+    # With our pipeline defined, now run the Application
+    app.run()
+
+
+# It is recommended to execute Applications under a conditional main
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Message keys for the solar readings, and where Kafka puts them.
+
+The key decides the partition, and so how many consumers can share the
+topic: every reading of a key lands on the same partition, in order. Keying
+by location puts a whole site on one partition, which a single consumer then
+has to keep up with alone. The strategies below spread the panels out while
+still sending every reading of a panel to the same key, so per-panel order is
+kept however many consumers read the topic:
+
+- `location`: `LONDON`; one key per site (the original keying);
+- `panel`: `LONDON-P0001`; one key per panel;
+- `panel_bucket`: `b0007`; panels hashed into `buckets` keys shared by all
+  sites, so the number of keys stays fixed as sites are added;
+- `location_bucket`: `LONDON-07`; each site's panels hashed into `buckets`.
+
+Buckets are chosen with CRC-32, which is stable across processes and Python
+versions, unlike `hash()`. Partitions are chosen by the producer; quixstreams
+configures librdkafka's `murmur2` partitioner, the same as Kafka's Java client,
+which `partition_for` reproduces.
+"""
+
+import zlib
+from typing import Callable
+
+STRATEGIES = ("location", "panel", "panel_bucket", "location_bucket")
+
+
+def bucket_of(panel_id: str, buckets: int) -> int:
+    return zlib.crc32(panel_id.encode("utf-8")) % buckets
+
+
+def key_function(strategy: str, buckets: int = 16) -> Callable[[dict], str]:
+    """The function that gives a reading's message key under `strategy`."""
+    strategy = strategy.lower()
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown key strategy {strategy!r}, expected one of {', '.join(STRATEGIES)}")
+    if strategy.endswith("_bucket") and buckets < 1:
+        raise ValueError("The number of key buckets must be at least 1")
+
+    if strategy == "location":
+        return lambda reading: reading["location_id"]
+    if strategy == "panel":
+        return lambda reading: reading["panel_id"]
+    if strategy == "panel_bucket":
+        return lambda reading: f"b{bucket_of(reading['panel_id'], buckets):04d}"
+    return lambda reading: f"{reading['location_id']}-{bucket_of(reading['panel_id'], buckets):02d}"
+
+
+def murmur2(data: bytes) -> int:
+    """Kafka's 32-bit murmur2 hash of a serialized key."""
+    m, r = 0x5BD1E995, 24
+    length = len(data)
+    h = (0x9747B28C ^ length) & 0xFFFFFFFF
+
+    for i in range(0, length - length % 4, 4):
+        k = data[i] | data[i + 1] << 8 | data[i + 2] << 16 | data[i + 3] << 24
+        k = (k * m) & 0xFFFFFFFF
+        k ^= k >> r
+        k = (k * m) & 0xFFFFFFFF
+        h = ((h * m) & 0xFFFFFFFF) ^ k
+
+    tail = length & ~3
+    extra = length % 4
+    if extra == 3:
+        h ^= data[tail + 2] << 16
+    if extra >= 2:
+        h ^= data[tail + 1] << 8
+    if extra >= 1:
+        h ^= data[tail]
+        h = (h * m) & 0xFFFFFFFF
+
+    h ^= h >> 13
+    h = (h * m) & 0xFFFFFFFF
+    h ^= h >> 15
+    return h
+
+
+def partition_for(key: str, partitions: int) -> int:
+    """The partition the producer sends `key` to, for a topic with `partitions` partitions."""
+    return (murmur2(key.encode("utf-8")) & 0x7FFFFFFF) % partitions
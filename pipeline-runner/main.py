@@ -0,0 +1,95 @@
+"""
+Benchmarks a Source of this repo against a sink, in one process and without
+Kafka (see runner.py). Both are loaded from their app directories and
+configured by the same environment variables as when deployed:
+
+    location=LONDON output=readings python main.py --source ../sample-data --sink null
+    location=LONDON output=readings TSDB_INPUT=readings ... \\
+        python main.py --source ../sample-data --sink ../timescaledb-sink --messages 500000
+    python main.py --source ../sample-data --sink ../clickhouse-sink-y1k8 --no-write --serial
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+
+# for local dev, load env vars from a .env file
+from dotenv import load_dotenv
+load_dotenv()
+
+from quixstreams.models.topics import Topic
+from quixstreams.sinks import BatchingSink
+
+from runner import NullSink, Pipeline, load_app
+
+
+def _pick(items: list, index: int, what: str, path: str):
+    if not items:
+        sys.exit(f"{path} sets up no {what}")
+    try:
+        return items[index]
+    except IndexError:
+        sys.exit(f"{path} sets up {len(items)} {what}s, there is no index {index}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure a Source feeding a sink, without a broker")
+    parser.add_argument("--source", required=True, help="Directory (or script) of the app with the Source")
+    parser.add_argument("--source-index", type=int, default=0, help="Which of the app's Sources to run")
+    parser.add_argument("--sink", required=True, help='Directory (or script) of the app with the sink, or "null"')
+    parser.add_argument("--sink-index", type=int, default=-1,
+                        help="Which of the app's sinks to run, in the order they are set up (default: the last)")
+    parser.add_argument("--messages", type=int, default=100_000, help="Messages to produce; 0 for no limit")
+    parser.add_argument("--duration", type=float, help="Seconds to produce for")
+    parser.add_argument("--partitions", type=int, default=1, help="Partitions of the topic between them")
+    parser.add_argument("--queue-size", type=int, default=10_000, help="Messages the queue holds before the source blocks")
+    parser.add_argument("--commit-every", type=int, help="Checkpoint every N messages (default: the sink app's)")
+    parser.add_argument("--commit-interval", type=float, help="Checkpoint every N seconds (default: the sink app's)")
+    parser.add_argument("--paced", action="store_true", help="Keep the source's sleeps instead of producing flat out")
+    parser.add_argument("--serial", action="store_true",
+                        help="Produce every message before consuming, to count each stage's allocations")
+    parser.add_argument("--no-write", action="store_true",
+                        help="Don't connect the sink or write its batches, to measure the path up to the destination")
+    parser.add_argument("--verbose", action="store_true", help="Show what the apps print while running")
+    args = parser.parse_args()
+
+    source_app = load_app(args.source)
+    source, source_topic = _pick(source_app.sources, args.source_index, "Source", args.source)
+    if args.sink == "null":
+        sink, sink_topic, settings = NullSink(), Topic(source_topic.name), {}
+    else:
+        sink_app = load_app(args.sink)
+        sink, sink_topic = _pick(sink_app.sinks, args.sink_index, "sink", args.sink)
+        settings = sink_app.settings
+    if args.no_write:
+        if not isinstance(sink, BatchingSink):
+            sys.exit(f"--no-write needs a BatchingSink, {type(sink).__name__} writes from add()")
+        sink.write = NullSink.write.__get__(sink)
+
+    pipeline = Pipeline(
+        source=source,
+        source_topic=source_topic,
+        sink=sink,
+        sink_topic=sink_topic or Topic(source_topic.name),
+        messages=args.messages or None,
+        duration_s=args.duration,
+        partitions=args.partitions,
+        queue_size=args.queue_size,
+        commit_every=args.commit_every if args.commit_every is not None else settings.get("commit_every", 0),
+        commit_interval=args.commit_interval if args.commit_interval is not None else settings.get("commit_interval", 5.0),
+        paced=args.paced,
+        serial=args.serial,
+        setup_sink=not args.no_write,
+    )
+    print(f"{type(source).__name__} -> {type(sink).__name__}: {args.partitions} partition(s), "
+          f"checkpoints every {pipeline.commit_every or '-'} messages / {pipeline.commit_interval}s"
+          f"{', serial' if args.serial else ''}")
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        report = pipeline.run()
+    print(report.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,535 @@
+"""
+Runs a Source from one app of this repo straight into a sink from another,
+usually a BatchingSink, in one process and without Kafka, to measure what
+each stage costs.
+
+`load_app()` executes an app's main.py with `OfflineApplication` in place of
+`quixstreams.Application`, so the app builds its Source or sinks from its own
+environment variables as it would when deployed, and nothing connects to a
+broker. `Pipeline` then wires them together:
+
+- source: the Source runs in a thread as in its own process. Its producer is a
+  `QueueProducer`, which numbers each message with the partition the key maps
+  to (murmur2, see keying.py) and the next offset of that partition, and puts
+  it on a bounded queue. A full queue blocks the source, like a producer
+  whose buffer is full.
+- consume: the main thread takes messages off the queue, deserializes them with
+  the sink app's input topic (its deserializers and timestamp extractor) and
+  adds them to the sink, which batches them per topic and partition in
+  `SinkBatch`es exactly as under `Application.run()`. Dataframe operations
+  between the topic and the sink are not run.
+- flush: checkpoints follow the sink app's `commit_every` and `commit_interval`
+  and flush the sink. A `SinkBackpressureError` pauses for its `retry_after`
+  and replays the messages since the last checkpoint, as the consumer seeks
+  back to them.
+
+Each stage reports its CPU time (`time.thread_time()`), the time it spent
+working and waiting, and the garbage collections that ran on it. Threads of
+the sink's own, such as write workers, only show in the process CPU time. In
+serial mode the source first produces every message, then the sink consumes
+them, so the pymalloc blocks each stage leaves allocated
+(`sys.getallocatedblocks()`) can be told apart too.
+"""
+
+import gc
+import os
+import queue
+import runpy
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import quixstreams
+from quixstreams.models.topics import Topic
+from quixstreams.sinks import BaseSink, BatchingSink, SinkBackpressureError, SinkBatch
+from quixstreams.sources import Source
+
+from keying import murmur2
+
+STAGES = ("source", "consume", "flush")
+
+_END = object()  # Put on the queue once the source has stopped
+
+
+class _Dataframe:
+    """Stands in for a StreamingDataFrame: every operation gives it back, and sinks are recorded."""
+
+    def __init__(self, wiring: "Wiring", topic: Optional[Topic]):
+        self._wiring = wiring
+        self._topic = topic
+
+    def sink(self, sink):
+        self._wiring.sinks.append((sink, self._topic))
+
+    def _chain(self, *args, **kwargs) -> "_Dataframe":
+        return self
+
+    def __getattr__(self, name: str):
+        return self._chain
+
+    def __getitem__(self, item):
+        return self
+
+    def __setitem__(self, item, value):
+        pass
+
+    __call__ = _chain
+    __hash__ = object.__hash__
+
+
+for _operator in ("eq", "ne", "lt", "le", "gt", "ge", "and", "or", "invert", "contains",
+                  "add", "sub", "mul", "truediv", "floordiv", "mod", "neg", "abs"):
+    setattr(_Dataframe, f"__{_operator}__", _Dataframe._chain)
+
+
+@dataclass
+class Wiring:
+    """What an app's main.py set up: its Application's settings, Sources and sinks, with their topics."""
+
+    path: str
+    settings: Dict[str, Any] = field(default_factory=dict)
+    sources: List[Tuple[Source, Optional[Topic]]] = field(default_factory=list)
+    sinks: List[Tuple[BaseSink, Optional[Topic]]] = field(default_factory=list)
+
+
+class OfflineApplication:
+    """Stands in for `quixstreams.Application` while an app is loaded: it records instead of connecting."""
+
+    def __init__(self, wiring: Wiring, *args, **kwargs):
+        self._wiring = wiring
+        wiring.settings.update(kwargs)
+
+    def topic(self, name: str, **kwargs) -> Topic:
+        return Topic(name, **kwargs)
+
+    def dataframe(self, topic: Optional[Topic] = None, source: Optional[Source] = None) -> _Dataframe:
+        if source is not None:
+            self.add_source(source, topic)
+        return _Dataframe(self._wiring, topic)
+
+    def add_source(self, source: Source, topic: Optional[Topic] = None) -> Topic:
+        topic = topic or source.default_topic()
+        self._wiring.sources.append((source, topic))
+        return topic
+
+    def run(self, *args, **kwargs):
+        pass
+
+
+def load_app(path: str) -> Wiring:
+    """Executes an app's main.py (or any script) with `OfflineApplication` and returns what it set up."""
+    script = os.path.abspath(path if path.endswith(".py") else os.path.join(path, "main.py"))
+    app_dir = os.path.dirname(script)
+    wiring = Wiring(path=app_dir)
+    application = quixstreams.Application
+    modules = set(sys.modules)
+    quixstreams.Application = lambda *args, **kwargs: OfflineApplication(wiring, *args, **kwargs)
+    sys.path.insert(0, app_dir)
+    try:
+        namespace = runpy.run_path(script, run_name="__pipeline_runner__")
+        # Apps with Sources set up the Application in main(), under `if __name__ == "__main__"`
+        if not wiring.sources and not wiring.sinks and callable(namespace.get("main")):
+            namespace["main"]()
+    finally:
+        quixstreams.Application = application
+        sys.path.remove(app_dir)
+        # Apps have modules of the same names (tracing.py, retry.py, ...): forget this app's
+        for name in set(sys.modules) - modules:
+            if (getattr(sys.modules[name], "__file__", None) or "").startswith(app_dir + os.sep):
+                del sys.modules[name]
+    return wiring
+
+
+class NullSink(BatchingSink):
+    """Writes nowhere, to measure the source and batching alone. It still reads every item, as sinks do."""
+
+    def write(self, batch: SinkBatch):
+        for item in batch:
+            item.value
+
+
+class _UnpacedTime:
+    """The `time` module, except that `sleep()` returns at once."""
+
+    def __getattr__(self, name: str):
+        return getattr(time, name)
+
+    @staticmethod
+    def sleep(seconds: float):
+        pass
+
+
+def unpace(source: Source):
+    """Makes the module of a Source's class skip its sleeps, so it produces as fast as it can."""
+    for klass in type(source).__mro__:
+        if klass.__module__.startswith("quixstreams") or klass is object:
+            continue
+        for attribute in vars(klass).values():
+            namespace = getattr(attribute, "__globals__", None)
+            if namespace is None:
+                continue
+            if namespace.get("time") is time:
+                namespace["time"] = _UnpacedTime()
+            if namespace.get("sleep") is time.sleep:
+                namespace["sleep"] = _UnpacedTime.sleep
+
+
+class _Message:
+    """A consumed message, with the interface of `confluent_kafka.Message` that `Topic` reads."""
+
+    __slots__ = ("_topic", "_partition", "_offset", "_key", "_value", "_headers", "_timestamp")
+
+    def __init__(self, topic, partition, offset, key, value, headers, timestamp):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._headers = headers
+        self._timestamp = timestamp
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+    def key(self) -> Optional[bytes]:
+        return self._key
+
+    def value(self) -> Optional[bytes]:
+        return self._value
+
+    def headers(self):
+        return self._headers
+
+    def timestamp(self) -> Tuple[int, int]:
+        return 1, self._timestamp  # TIMESTAMP_CREATE_TIME
+
+    def leader_epoch(self) -> Optional[int]:
+        return None
+
+    def error(self):
+        return None
+
+    def __len__(self) -> int:
+        return len(self._value or b"") + len(self._key or b"")
+
+
+@dataclass
+class StageStats:
+    name: str
+    messages: int = 0
+    cpu_s: float = 0.0
+    busy_s: float = 0.0  # Wall time spent working, not waiting on the queue or backpressure
+    waited_s: float = 0.0
+    gc_collections: List[int] = field(default_factory=lambda: [0, 0, 0])
+    blocks: Optional[int] = None  # Net pymalloc blocks left allocated, serial runs only
+
+    @property
+    def per_second(self) -> float:
+        return self.messages / self.busy_s if self.busy_s else 0.0
+
+    @property
+    def cpu_us_per_message(self) -> float:
+        return self.cpu_s * 1e6 / self.messages if self.messages else 0.0
+
+
+@dataclass
+class Report:
+    stages: Dict[str, StageStats]
+    wall_s: float = 0.0
+    process_cpu_s: float = 0.0
+    committed: int = 0
+    checkpoints: int = 0
+    backpressure_pauses: int = 0
+    paused_s: float = 0.0
+
+    @property
+    def per_second(self) -> float:
+        return self.committed / self.wall_s if self.wall_s else 0.0
+
+    @property
+    def other_threads_cpu_s(self) -> float:
+        return max(0.0, self.process_cpu_s - sum(stage.cpu_s for stage in self.stages.values()))
+
+    def format(self) -> str:
+        lines = [
+            f"{'stage':<8} {'messages':>10} {'msg/s':>11} {'CPU s':>8} {'CPU us/msg':>11} "
+            f"{'busy s':>8} {'waited s':>9} {'gc 0/1/2':>12} {'blocks/msg':>11}"
+        ]
+        for stage in self.stages.values():
+            blocks = f"{stage.blocks / stage.messages:.2f}" if stage.blocks is not None and stage.messages else "-"
+            lines.append(
+                f"{stage.name:<8} {stage.messages:>10,} {stage.per_second:>11,.0f} {stage.cpu_s:>8.3f} "
+                f"{stage.cpu_us_per_message:>11.2f} {stage.busy_s:>8.3f} {stage.waited_s:>9.3f} "
+                f"{'/'.join(map(str, stage.gc_collections)):>12} {blocks:>11}"
+            )
+        lines.append(
+            f"pipeline: {self.committed:,} messages committed in {self.wall_s:.3f}s ({self.per_second:,.0f} msg/s), "
+            f"{self.checkpoints} checkpoints, {self.backpressure_pauses} backpressure pauses ({self.paused_s:.3f}s)"
+        )
+        lines.append(
+            f"process CPU: {self.process_cpu_s:.3f}s, of which {self.other_threads_cpu_s:.3f}s "
+            f"outside the stages (sink worker threads, interpreter)"
+        )
+        return "\n".join(lines)
+
+
+class QueueProducer:
+    """Stands in for a Source's Kafka producer: it partitions and numbers messages and puts them on a queue."""
+
+    def __init__(self, messages: "queue.Queue", topic: str, partitions: int, stats: StageStats,
+                 limit: Optional[int] = None, deadline: Optional[float] = None):
+        self._queue = messages
+        self._topic = topic
+        self._partitions = partitions
+        self._offsets = [0] * partitions
+        self._next_partition = 0  # Keyless messages go round-robin
+        self._stats = stats
+        self.limit = limit
+        self.deadline = deadline
+        self.on_limit = None  # Called once the limit or deadline is reached
+
+    def produce(self, topic: str, value: Optional[bytes] = None, key: Optional[bytes] = None, headers=None,
+                partition: Optional[int] = None, timestamp: Optional[int] = None, **kwargs):
+        stats = self._stats
+        if self.on_limit is not None and (
+            (self.limit is not None and stats.messages >= self.limit)
+            or (self.deadline is not None and time.monotonic() >= self.deadline)
+        ):
+            self.on_limit()
+            self.on_limit = None
+        if self.on_limit is None:
+            return  # Produced past the end of the run, while the source was stopping
+        if isinstance(key, str):
+            key = key.encode()
+        if isinstance(value, str):
+            value = value.encode()
+        if partition is None:
+            if key is None:
+                partition = self._next_partition
+                self._next_partition = (partition + 1) % self._partitions
+            else:
+                partition = (murmur2(key) & 0x7FFFFFFF) % self._partitions
+        offset = self._offsets[partition]
+        self._offsets[partition] = offset + 1
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        message = (self._topic, partition, offset, key, value, headers, timestamp)
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            started = time.perf_counter()
+            self._queue.put(message)
+            stats.waited_s += time.perf_counter() - started
+        stats.messages += 1
+
+    def poll(self, timeout: float = 0):
+        pass
+
+    def flush(self, timeout: Optional[float] = None) -> int:
+        return 0  # Messages still to be delivered
+
+    def __len__(self) -> int:
+        return 0
+
+
+class Pipeline:
+    """
+    A Source, a queue and a sink in one process; `run()` measures them and
+    returns a `Report`. Any sink works, BatchingSinks and those that send from
+    `add()` alike.
+    """
+
+    def __init__(
+        self,
+        source: Source,
+        source_topic: Topic,
+        sink: BaseSink,
+        sink_topic: Topic,
+        messages: Optional[int] = 100_000,
+        duration_s: Optional[float] = None,
+        partitions: int = 1,
+        queue_size: int = 10_000,
+        commit_every: int = 0,
+        commit_interval: float = 5.0,
+        paced: bool = False,
+        serial: bool = False,
+        setup_sink: bool = True,
+    ):
+        if messages is None and duration_s is None:
+            raise ValueError("A run needs a number of messages, a duration or both")
+        self.source = source
+        self.source_topic = source_topic
+        self.sink = sink
+        self.sink_topic = sink_topic
+        self.messages = messages
+        self.duration_s = duration_s
+        self.partitions = partitions
+        self.queue_size = 0 if serial else queue_size  # Serial runs hold every message at once
+        self.commit_every = commit_every
+        self.commit_interval = max(commit_interval, 0)
+        self.paced = paced
+        self.serial = serial
+        self.setup_sink = setup_sink
+        self.report = Report(stages={name: StageStats(name) for name in STAGES})
+        self._queue: "queue.Queue" = queue.Queue(self.queue_size)
+        self._source_thread: Optional[int] = None
+        self._flushing = False
+        self._source_error: Optional[BaseException] = None
+
+    def _on_gc(self, phase: str, info: dict):
+        if phase != "start":
+            return
+        if threading.get_ident() == self._source_thread:
+            stage = "source"
+        else:
+            stage = "flush" if self._flushing else "consume"
+        self.report.stages[stage].gc_collections[info["generation"]] += 1
+
+    def _run_source(self):
+        stats = self.report.stages["source"]
+        self._source_thread = threading.get_ident()
+        cpu, started = time.thread_time(), time.perf_counter()
+        blocks = sys.getallocatedblocks() if self.serial else None
+        try:
+            self.source.start()
+        except BaseException as e:
+            self._source_error = e
+        finally:
+            stats.cpu_s = time.thread_time() - cpu
+            stats.busy_s = time.perf_counter() - started - stats.waited_s
+            if blocks is not None:
+                stats.blocks = sys.getallocatedblocks() - blocks
+            self._queue.put(_END)
+
+    def _add(self, message: tuple):
+        rows = self.sink_topic.row_deserialize(_Message(self.sink_topic.name, *message[1:]))
+        if rows is None:
+            return
+        for row in rows if isinstance(rows, list) else (rows,):
+            self.sink.add(value=row.value, key=row.key, timestamp=row.timestamp, headers=row.headers,
+                          topic=row.topic, partition=row.partition, offset=row.offset)
+
+    def _checkpoint(self, pending: List[tuple]):
+        """Flushes the sink until it takes the messages since the last checkpoint, replaying them after backpressure."""
+        if not pending:
+            return
+        report, consume, flush = self.report, self.report.stages["consume"], self.report.stages["flush"]
+        while True:
+            blocks = sys.getallocatedblocks() if self.serial else None
+            cpu, started = time.thread_time(), time.perf_counter()
+            self._flushing = True
+            try:
+                self.sink.flush()
+                break
+            except SinkBackpressureError as e:
+                report.backpressure_pauses += 1
+                retry_after = e.retry_after
+            finally:
+                self._flushing = False
+                flush.cpu_s += time.thread_time() - cpu
+                flush.busy_s += time.perf_counter() - started
+                if blocks is not None:
+                    flush.blocks += sys.getallocatedblocks() - blocks
+            paused = time.perf_counter()
+            time.sleep(retry_after)
+            report.paused_s += time.perf_counter() - paused
+            # Consumed again from the last committed offsets
+            cpu, started = time.thread_time(), time.perf_counter()
+            for message in pending:
+                self._add(message)
+            consume.messages += len(pending)
+            consume.cpu_s += time.thread_time() - cpu
+            consume.busy_s += time.perf_counter() - started
+        flush.messages += len(pending)
+        report.committed += len(pending)
+        report.checkpoints += 1
+
+    def _consume(self):
+        """Consumes the queue into the sink like the Application's run loop, until the source has stopped."""
+        consume = self.report.stages["consume"]
+        if self.serial:
+            consume.blocks = self.report.stages["flush"].blocks = 0
+        get = self._queue.get_nowait
+        add = self._add
+        commit_every, commit_interval = self.commit_every, self.commit_interval
+        pending: List[tuple] = []
+        checkpoint_started = time.monotonic()
+        blocks = sys.getallocatedblocks() if self.serial else None
+        cpu, started = time.thread_time(), time.perf_counter()
+        while True:
+            try:
+                message = get()
+            except queue.Empty:
+                waiting = time.perf_counter()
+                message = self._queue.get()
+                consume.waited_s += time.perf_counter() - waiting
+            if message is _END:
+                break
+            add(message)
+            pending.append(message)
+            if (0 < commit_every <= len(pending)) or time.monotonic() - commit_interval >= checkpoint_started:
+                consume.messages += len(pending)
+                consume.cpu_s += time.thread_time() - cpu
+                consume.busy_s += time.perf_counter() - started
+                if blocks is not None:
+                    consume.blocks += sys.getallocatedblocks() - blocks
+                self._checkpoint(pending)
+                pending = []
+                checkpoint_started = time.monotonic()
+                blocks = sys.getallocatedblocks() if self.serial else None
+                cpu, started = time.thread_time(), time.perf_counter()
+        consume.messages += len(pending)
+        consume.cpu_s += time.thread_time() - cpu
+        consume.busy_s += time.perf_counter() - started - consume.waited_s
+        if blocks is not None:
+            consume.blocks += sys.getallocatedblocks() - blocks
+        self._checkpoint(pending)
+
+    def run(self) -> Report:
+        report = self.report
+        producer = QueueProducer(
+            self._queue, self.source_topic.name, self.partitions, report.stages["source"], limit=self.messages,
+            deadline=time.monotonic() + self.duration_s if self.duration_s is not None else None,
+        )
+        producer.on_limit = self.source.stop
+        self.source.configure(self.source_topic, producer)
+        if not self.paced:
+            unpace(self.source)
+        if self.setup_sink:
+            self.sink.start()
+
+        gc.callbacks.append(self._on_gc)
+        process_cpu, started = time.process_time(), time.perf_counter()
+        source = threading.Thread(target=self._run_source, name="pipeline-source", daemon=True)
+        try:
+            source.start()
+            if self.serial:
+                source.join()
+            self._consume()
+        except BaseException:
+            producer.on_limit = None
+            self.source.stop()
+            # Unblock the source if it is waiting on a full queue
+            while source.is_alive():
+                try:
+                    while True:
+                        self._queue.get_nowait()
+                except queue.Empty:
+                    source.join(0.1)
+            raise
+        finally:
+            source.join()
+            gc.callbacks.remove(self._on_gc)
+        report.wall_s = time.perf_counter() - started
+        report.process_cpu_s = time.process_time() - process_cpu
+        if self._source_error is not None:
+            raise self._source_error
+        return report
@@ -6,15 +6,23 @@
 
 import os
 import json
+import threading
+import time
+from collections import deque
 from datetime import datetime
 from quixstreams import Application
-from quixstreams.sinks.base import BatchingSink, SinkBatch
+from quixstreams.sinks.base import BatchingSink, SinkBatch, SinkBackpressureError
 from questdb.ingress import Sender
 from dotenv import load_dotenv
 
+from spill_log import SpillLog, SpillLogFull, is_persistent
+from tracing import LatencyTracing, start_metrics_server
+
 load_dotenv()
 
-class QuestDBSink(BatchingSink):
+class QuestDBSink(LatencyTracing, BatchingSink):
+    trace_name = "questdb"
+
     def __init__(self):
         super().__init__()
         self.host = os.environ.get('QDB_HOST', 'localhost')
@@ -27,15 +35,53 @@ class QuestDBSink(BatchingSink):
         self.timestamp_column = os.environ.get('QDB_TIMESTAMP_COLUMN', 'timestamp')
         self.sender = None
 
+        # Disk-backed spill log used while QuestDB is unreachable
+        self.spill_dir = os.environ.get('QDB_SPILL_DIR', 'state/questdb-spill')
+        try:
+            self.spill_max_bytes = int(os.environ.get('QDB_SPILL_MAX_MB', '1024')) * 1024 * 1024
+        except (ValueError, TypeError):
+            self.spill_max_bytes = 1024 * 1024 * 1024
+        try:
+            self.spill_segment_bytes = int(os.environ.get('QDB_SPILL_SEGMENT_MB', '64')) * 1024 * 1024
+        except (ValueError, TypeError):
+            self.spill_segment_bytes = 64 * 1024 * 1024
+        try:
+            self.drain_batch_size = int(os.environ.get('QDB_SPILL_DRAIN_BATCH_SIZE', '10000'))
+        except (ValueError, TypeError):
+            self.drain_batch_size = 10000
+        try:
+            self.drain_retry_interval = float(os.environ.get('QDB_SPILL_RETRY_INTERVAL', '5.0'))
+        except (ValueError, TypeError):
+            self.drain_retry_interval = 5.0
+        self.spill = None
+        self._next_drain_attempt = 0.0
+        # [rows left in the spill log, topic, partition, held traces] of each spilled
+        # batch, oldest first: their latencies are recorded once the rows are drained
+        self._spilled_traces = deque()
+        # write() and the idle drain both use the sender and the spill log
+        self._lock = threading.Lock()
+
     def setup(self):
         self.sender = Sender.from_conf(
             f'http::addr={self.host}:{self.port};token={self.token};'
         )
-
-    def write(self, batch: SinkBatch):
-        if not self.sender:
+        if not is_persistent(self.spill_dir):
+            # Spilled rows have their offsets committed, so they would be lost with the pod
+            print(f'{self.spill_dir} is not on a persistent volume (enable state for this deployment): '
+                  f'not spilling, the sink backpressures while QuestDB is down')
             return
-            
+        self.spill = SpillLog(
+            self.spill_dir,
+            segment_bytes=self.spill_segment_bytes,
+            max_bytes=self.spill_max_bytes,
+        )
+        if len(self.spill):
+            print(f'Found spilled rows from a previous run: {self.spill.metrics()}')
+        threading.Thread(target=self._drain_while_idle, name='questdb-spill-drain', daemon=True).start()
+
+    def _rows_from_batch(self, batch: SinkBatch) -> list:
+        """Convert a batch into QuestDB rows (kwargs for ``Buffer.row``)."""
+        rows = []
         for item in batch:
             try:
                 print(f'Raw message: {item}')
@@ -57,9 +103,7 @@ class QuestDBSink(BatchingSink):
                 else:
                     timestamp_str = datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
                 
-                # Build QuestDB line protocol
-                self.sender.row(
-                    self.table,
+                rows.append(dict(
                     symbols={
                         'panel_id': data.get('panel_id', ''),
                         'location_id': data.get('location_id', ''),
@@ -77,21 +121,119 @@ class QuestDBSink(BatchingSink):
                         'current': float(data.get('current', 0))
                     },
                     at=timestamp_str
-                )
+                ))
                 
             except Exception as e:
                 print(f'Error processing message: {e}')
                 continue
-        
-        # Flush the batch
+        return rows
+
+    def _flush_rows(self, rows: list):
+        """Send rows to QuestDB in a single request; raises if it fails."""
+        buffer = self.sender.new_buffer()
+        for row in rows:
+            buffer.row(self.table, **row)
+        self.sender.flush(buffer)
+
+    def _drain_spill(self) -> bool:
+        """
+        Replay the oldest `drain_batch_size` spilled rows in one request; one
+        call is kept short so it never holds up the poll loop for long.
+        Returns True once the spill log is empty.
+        """
+        if time.monotonic() < self._next_drain_attempt:
+            return False
+        records, position = self.spill.read(self.drain_batch_size)
         try:
-            self.sender.flush()
+            self._flush_rows([json.loads(record) for record in records])
         except Exception as e:
-            print(f'Error flushing to QuestDB: {e}')
+            print(f'QuestDB still unavailable, keeping spilled rows: {e}')
+            self._next_drain_attempt = time.monotonic() + self.drain_retry_interval
+            return False
+        self._drained(len(records))
+        self.spill.commit(position)
+        print(f'Drained {len(records)} spilled rows: {self.spill.metrics()}')
+        return not len(self.spill)
+
+    def _drained(self, count: int):
+        """Record the latencies of the spilled batches whose last rows were just written."""
+        # Rows spilled by a previous run come first and have no traces left
+        count -= len(self.spill) - sum(entry[0] for entry in self._spilled_traces)
+        while count > 0 and self._spilled_traces:
+            entry = self._spilled_traces[0]
+            taken = min(count, entry[0])
+            entry[0] -= taken
+            count -= taken
+            if entry[0]:
+                break
+            self._spilled_traces.popleft()
+            self._tracker().landed(entry[1], entry[2], entry[3])
+
+    def _drain_while_idle(self):
+        """
+        Drain the spill log between batches too: Quix Streams only flushes sinks
+        when there are new messages, so rows spilled just before the topic went
+        idle would otherwise wait for the next one.
+        """
+        while True:
+            time.sleep(self.drain_retry_interval)
+            # One request per turn of the lock, so write() never waits for a whole drain
+            while True:
+                with self._lock:
+                    if self.spill is None:
+                        return
+                    if not len(self.spill) or self._drain_spill() or time.monotonic() < self._next_drain_attempt:
+                        break
+
+    def _spill_rows(self, rows: list, batch: SinkBatch):
+        """
+        Durably store rows that could not be written. Once this returns the
+        batch offsets can be committed; if the spill log is full the batch is
+        rejected with backpressure so it is re-consumed later instead, as it
+        is when there is no spill log. The batch's latencies are only recorded
+        once its rows are drained.
+        """
+        if self.spill is None:
+            raise SinkBackpressureError(retry_after=self.drain_retry_interval)
+        try:
+            self.spill.append(json.dumps(row).encode() for row in rows)
+        except SpillLogFull as e:
+            print(f'Spill log full, pausing consumption: {e}')
+            raise SinkBackpressureError(retry_after=self.drain_retry_interval)
+        held = self._tracker().hold(batch.topic, batch.partition)
+        self._spilled_traces.append([len(rows), batch.topic, batch.partition, held])
+        print(f'Spilled {len(rows)} rows: {self.spill.metrics()}')
+
+    def write(self, batch: SinkBatch):
+        if not self.sender:
+            return
+
+        rows = self._rows_from_batch(batch)
+        if not rows:
+            return
+
+        with self._lock:
+            # Older spilled rows must reach QuestDB before this batch does. Only the
+            # oldest of them are sent here; while more are left, the batch is spilled
+            # behind them and the idle drain carries on between batches
+            if self.spill is not None and len(self.spill) and not self._drain_spill():
+                self._spill_rows(rows, batch)
+                return
+
+            try:
+                self._flush_rows(rows)
+            except Exception as e:
+                print(f'Error flushing to QuestDB, spilling batch to disk: {e}')
+                self._next_drain_attempt = time.monotonic() + self.drain_retry_interval
+                self._spill_rows(rows, batch)
 
     def close(self):
-        if self.sender:
-            self.sender.close()
+        with self._lock:
+            if self.sender:
+                self.sender.close()
+            if self.spill:
+                self.spill.close()
+                self.spill = None
 
 # Create the application
 app = Application(
@@ -109,4 +251,6 @@ sdf.print(pretty=True,metadata=True)
 sdf.sink(questdb_sink)
 
 if __name__ == "__main__":
+    start_metrics_server(int(os.environ.get("TRACE_METRICS_PORT", "9464")),
+                         window_s=float(os.environ.get("TRACE_WINDOW_S", "60")))
     app.run()
\ No newline at end of file
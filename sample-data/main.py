@@ -11,7 +11,13 @@ from dataclasses import dataclass, field
 from typing import List, Dict, Tuple
 import uuid
 
+from keying import key_function
+from tracing import trace_headers
+
 location = os.environ["location"] # e.g. LONDON
+# How readings are keyed, and so spread over partitions; see keying.py
+key_strategy = os.environ.get("KEY_STRATEGY", "location")
+key_buckets = int(os.environ.get("KEY_BUCKETS", "16"))
 
 @dataclass
 class Location:
@@ -80,6 +86,10 @@ class SolarDataGenerator(Source):
             raise ValueError(f"Invalid location: '{location}'. Valid locations are: {valid_locations}")
         
         print(f"Generating data for location: {selected_location.name} ({selected_location.location_id})")
+
+        # Every reading of a panel gets the same key, so its readings stay in order
+        self.key_of = key_function(key_strategy, key_buckets)
+        print(f"Keying readings by {key_strategy}")
         
         # Initialize panels for the selected location only
         self.panels = []
@@ -199,6 +209,7 @@ class SolarDataGenerator(Source):
             "current": round(current, 1),
             "unit_current": "A",
             "inverter_status": "OK" if power_output > 0 else "STANDBY",
+            "degradation_rate": round(panel.degradation_rate, 4),  # Expected yearly decline, for anomaly detection
             "timestamp": self.current_time
         }
     
@@ -218,9 +229,10 @@ class SolarDataGenerator(Source):
                     # Add timestamp
                     event["timestamp"] = self.current_time
                     
-                    # Serialize and produce the event with location_id as key
-                    event_serialized = self.serialize(key=event["location_id"], value=event)
-                    self.produce(key=event_serialized.key, value=event_serialized.value)
+                    # Serialize and produce the event with the configured key
+                    event_serialized = self.serialize(key=self.key_of(event), value=event)
+                    # Trace id and generation time, for the sinks' latency metrics
+                    self.produce(key=event_serialized.key, value=event_serialized.value, headers=trace_headers())
                 
                 if self.current_time % 10 == 0:  # Print every 10 seconds to reduce noise
                     print(f"Produced data for {len(self.panels)} panels at time {self.current_time}")
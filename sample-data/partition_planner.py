@@ -0,0 +1,105 @@
+"""
+Plans the partition count of the solar readings topic for a target number of
+consumers, under each key strategy (see keying.py).
+
+For every candidate partition count it places each key where the producer
+would (murmur2), adds up the readings per partition, and hands the partitions
+out to the consumers evenly by count, as Kafka's assignors do. The effective
+parallelism is the total rate over the busiest consumer's rate: how many
+consumers' worth of work actually runs side by side. The plan is the smallest
+partition count whose effective parallelism is within `--tolerance` of the
+target.
+
+    python partition_planner.py --consumers 8
+    python partition_planner.py --consumers 8 --strategy location_bucket --buckets 32
+    python partition_planner.py --partitions 12 --consumers 12
+"""
+
+import argparse
+import math
+from collections import Counter
+from typing import Dict, List, Optional
+
+from keying import STRATEGIES, key_function, partition_for
+
+# The generator's sites, see SolarDataGenerator
+LOCATIONS = ["LONDON", "MADRID", "BERLIN", "ROME", "PARIS", "AMSTERDAM", "VIENNA", "DUBLIN", "PRAGUE", "ATHENS"]
+
+
+def key_rates(strategy: str, buckets: int, locations: List[str], panels: int, rate: float) -> Dict[str, float]:
+    """Readings per second for each key, with every panel sending `rate` readings a second."""
+    key_of = key_function(strategy, buckets)
+    rates = Counter()
+    for location_id in locations:
+        for i in range(1, panels + 1):
+            rates[key_of({"location_id": location_id, "panel_id": f"{location_id}-P{i:04d}"})] += rate
+    return rates
+
+
+def evaluate(rates: Dict[str, float], partitions: int, consumers: int) -> dict:
+    loads = [0.0] * partitions
+    for key, rate in rates.items():
+        loads[partition_for(key, partitions)] += rate
+    # Partitions are handed out evenly by count; which ones go together does not depend on their load
+    consumer_loads = [sum(loads[p::consumers]) for p in range(consumers)]
+    total = sum(loads)
+    return {
+        "partitions": partitions,
+        "used": sum(1 for load in loads if load),
+        "effective": total / max(consumer_loads) if total else 0.0,
+        "busiest_partition": max(loads) / total if total else 0.0,
+        "skew": max(loads) / (total / partitions) if total else 0.0,
+    }
+
+
+def plan(rates: Dict[str, float], consumers: int, max_partitions: int, tolerance: float) -> Optional[dict]:
+    """The smallest partition count that lets `consumers` share the load within `tolerance`, if any."""
+    best = None
+    for partitions in range(consumers, max_partitions + 1):
+        result = evaluate(rates, partitions, consumers)
+        if result["effective"] >= consumers * (1 - tolerance):
+            return dict(result, planned=True)
+        if best is None or result["effective"] > best["effective"]:
+            best = result
+    return dict(best, planned=False) if best else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partitions needed for a target consumer parallelism")
+    parser.add_argument("--consumers", type=int, default=4, help="Consumers that should share the topic")
+    parser.add_argument("--consumer-capacity", type=float, default=0,
+                        help="Readings/s one consumer handles; raises --consumers to what the rate needs")
+    parser.add_argument("--strategy", choices=STRATEGIES, help="Only plan for this key strategy")
+    parser.add_argument("--buckets", type=int, default=16, help="KEY_BUCKETS of the bucket strategies")
+    parser.add_argument("--locations", default=",".join(LOCATIONS), help="Comma-separated location ids")
+    parser.add_argument("--panels", type=int, default=100, help="Panels per location")
+    parser.add_argument("--rate", type=float, default=1.0, help="Readings per panel per second")
+    parser.add_argument("--partitions", type=int, help="Evaluate this partition count instead of planning one")
+    parser.add_argument("--max-partitions", type=int, default=256)
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Accepted shortfall of the effective parallelism, as a fraction")
+    args = parser.parse_args()
+
+    locations = [location.strip().upper() for location in args.locations.split(",") if location.strip()]
+    total = len(locations) * args.panels * args.rate
+    consumers = args.consumers
+    if args.consumer_capacity:
+        consumers = max(consumers, math.ceil(total / args.consumer_capacity))
+
+    print(f"{len(locations)} locations x {args.panels} panels at {args.rate:g}/s = {total:,.0f} readings/s "
+          f"for {consumers} consumers")
+    print(f"{'strategy':>16} {'keys':>6} {'partitions':>11} {'used':>5} {'parallelism':>12} "
+          f"{'busiest':>8} {'skew':>6}")
+    for strategy in [args.strategy] if args.strategy else STRATEGIES:
+        rates = key_rates(strategy, args.buckets, locations, args.panels, args.rate)
+        if args.partitions:
+            result = dict(evaluate(rates, args.partitions, consumers), planned=True)
+        else:
+            result = plan(rates, consumers, args.max_partitions, args.tolerance)
+        note = "" if result["planned"] else f"  best up to {args.max_partitions} partitions, short of the target"
+        print(f"{strategy:>16} {len(rates):>6} {result['partitions']:>11} {result['used']:>5} "
+              f"{result['effective']:>12.2f} {result['busiest_partition']:>7.1%} {result['skew']:>6.2f}{note}")
+
+
+if __name__ == "__main__":
+    main()
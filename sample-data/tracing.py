@@ -0,0 +1,22 @@
+"""
+Trace headers for the solar data pipeline.
+
+Every generated reading carries a trace id and the wall-clock time it was
+produced at. The sinks read them back with the `tracing.py` they each ship,
+which records the pipeline's latencies; these header names must match theirs.
+"""
+
+import time
+import uuid
+from typing import List, Tuple
+
+TRACE_ID_HEADER = "trace_id"
+GENERATED_AT_HEADER = "generated_at_ns"
+
+
+def trace_headers() -> List[Tuple[str, bytes]]:
+    """Headers for a newly generated message: a new trace id and the time now."""
+    return [
+        (TRACE_ID_HEADER, uuid.uuid4().hex.encode()),
+        (GENERATED_AT_HEADER, str(time.time_ns()).encode()),
+    ]
@@ -5,6 +5,8 @@ from datetime import datetime
 from quixstreams import Application
 from quixstreams.sinks.base import BatchingSink, SinkBatch
 
+from tracing import LatencyTracing, start_metrics_server
+
 # Load environment variables from a .env file for local development
 from dotenv import load_dotenv
 load_dotenv()
@@ -14,7 +16,9 @@ def _as_bool(env_var: str, default="false") -> bool:
     return os.environ.get(env_var, default).lower() == "true"
 
 
-class TimescaleDBSink(BatchingSink):
+class TimescaleDBSink(LatencyTracing, BatchingSink):
+    trace_name = "timescaledb"
+
     def __init__(self, host, port, dbname, user, password, table_name, schema_name="public", schema_auto_update=True):
         super().__init__()
         self.host = host
@@ -209,4 +213,6 @@ sdf = sdf.apply(lambda item: print(f'Raw message: {item}') or item)
 sdf.sink(timescaledb_sink)
 
 if __name__ == "__main__":
+    start_metrics_server(int(os.environ.get("TRACE_METRICS_PORT", "9464")),
+                         window_s=float(os.environ.get("TRACE_WINDOW_S", "60")))
     app.run()
\ No newline at end of file